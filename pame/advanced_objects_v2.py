@@ -5,12 +5,14 @@ from interfaces import IMie, IMaterial, IMixer, IStorage
 from numpy import empty, array
 import os.path as op
 import math, cmath
+import logging
 from mie_traits_v2 import bare_sphere, effective_sphere
 from material_models import Dispwater #<--- Used by double nanoparticle
 from composite_materials_v2 import SphericalInclusions_Disk, DoubleComposite #For inheritance
 
 from pame import XNK_dir
 from material_files import XNKFile
+import dispersion
 
 def free_path_correction():
     ''' Size correction for the reduced mean free path.  Cited in many papers, in fact I'm writing this from,
@@ -178,23 +180,21 @@ class DrudeNP_corrected(DrudeBulk, NanoSphere):
         self.update_data()	
 
     def update_data(self):   #THIS DOES FIRE AT INSTANTIATION
-        if self.valid_metals == 'gold':               #These effects may be size dependent, need to look into it.  
-            self.lam_plasma=(1.6826 * 10**-7) #m
-            lb=(8.9342 * 10**-6)              #m
-            vf=Float(1.4*10**6) #m/s  ONLY VALID FOR GOLD AND SILVER
-        elif self.valid_metals == 'silver':
-            self.lam_plasma=(1.4541 * 10**-7) #m
-            lb=(1.7614 * 10**-5)              #m   #Uncorrected collision wavelength	
-            vf=Float(1.4*10**6) #m/s  ONLY VALID FOR GOLD AND SILVER
-        den=1.0 + ( (self.vf * lb) / (2.0*math.pi*self.c * self.r_core* 1.0*10**-9 )) 
+        self.lam_plasma, lb = dispersion.DRUDE_METALS[self.valid_metals] #m, lb uncorrected
         if self.apply_correction==True:
-            self.lam_collis=lb/den
+            try:
+                vf = dispersion.fermi_velocity(self.valid_metals) #m/s
+            except dispersion.DispersionError as exc:
+                # Turning it off updates again, with the bulk value
+                logging.warning('%s; using bulk collision wavelength' % exc)
+                self.apply_correction = False
+                return
+            self.lam_collis = float(dispersion.free_path_collis(lb, self.r_core, vf))
         else:
             self.lam_collis=lb  #Set to bulk value
 
-        m_xarray=self.specparms.specific_array('Meters')
-        unity= array([complex(0.0,1.0)], dtype=complex)  #Gupta requries i * lambda, so this gets complex value of the xarray
-        self.earray = 1.0 - ( (m_xarray**2 * self.lam_collis) / (self.lam_plasma**2 * ( self.lam_collis + m_xarray*unity)  ) )
+        self.earray = dispersion.drude(self.lambdas, self.lam_plasma,
+                                       self.lam_collis)
 
         # WTF IS THIS
         self.CoreMaterial=self
@@ -13,6 +13,8 @@ from chaco.api import Plot
 import copy
 from pame.utils import complex_e_to_n, complex_n_to_e
 from pame.main_parms import SHARED_SPECPARMS
+from pame.material_registry import SHARED_REGISTRY
+from quiet import deferred
 
 
 class BasicMaterial(HasTraits):
@@ -36,6 +38,11 @@ class BasicMaterial(HasTraits):
     interpolation = Any
     extrapolation = Bool(False)
     
+    # Traits that fully determine earray for this exact class (subclasses must
+    # declare their own).  If set, instances with equal values share one earray
+    # per lambdas grid (see material_registry)
+    registry_traits = ()
+
     # Dummy traits used to trigger main-level redraws of plot.  Useful for
     # example if chaging a material should trigger a global pame material plot
     # update.  Woudln't implement if we didn't want "instantaneous redraw", which
@@ -65,7 +72,32 @@ class BasicMaterial(HasTraits):
         return MaterialView(model=self)
     
     def _lambdas_changed(self): 
-        self.update_data()
+        self.update_shared(self.update_data)
+
+    def registry_key(self):
+        """ Key identifying materials with identical earray, or None if this
+        material can't share its earray."""
+        cls = type(self)
+        if not vars(cls).get('registry_traits'):
+            return None
+        return (cls.__name__,) + tuple(getattr(self, attr) for attr in
+                                       cls.registry_traits)
+
+    def update_shared(self, update):
+        """ Call update() (which sets earray), unless an identical material
+        already did on this lambdas grid; then just reference its earray."""
+        key = self.registry_key()
+        if key is None:
+            update()
+            return
+
+        def compute():
+            update()
+            return self.earray
+
+        earray = SHARED_REGISTRY.shared(key, self.lambdas, compute)
+        if earray is not self.earray:
+            self.earray = earray
 
     def _mviewbutton_fired(self): 
         self.mview.edit_traits(kind='live') #<-- why live?
@@ -108,6 +140,7 @@ class BasicMaterial(HasTraits):
         
         return out
 
+    @deferred('redraw')
     def redraw_requested(self):
         """ Changes dummy trait "_dummydraw" to cause a trigger that top-level
         plot_selector listens for.  For example, if user were to change a
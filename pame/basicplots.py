@@ -15,6 +15,7 @@ from chaco.api import ArrayPlotData, Plot, PlotAxis, HPlotContainer, ToolbarPlot
 from chaco.tools.api import *
 from numpy import where
 from interfaces import IView
+from quiet import deferred, immediately
 from chaco.tools.api import RangeSelection, RangeSelectionOverlay
 from scipy.integrate import simps  #Simpson integration
 
@@ -434,7 +435,7 @@ class ABCView(HasTraits):
         should just hook up.
         """
         super(ABCView, self).__init__(*args, **kwargs)
-        self.update_data()
+        immediately(self.update_data) #Plots need data even if quiet
         self.create_plots()
                
     def _data_default(self):
@@ -536,6 +537,7 @@ class MaterialView(ABCView):
         self.add_tools_title(self.eplot, 'Dielectric Function vs. Wavelength')
         self.add_tools_title(self.nplot, 'Index of Refraction vs. Wavelength ')
 
+    @deferred('view')
     def update_data(self):    
         """Method to update plots; draws them if they don't exist; otherwise 
         simply updates the data
@@ -615,6 +617,7 @@ class ScatterView(ABCView):
     def _plot_title_changed(self):
         self.sigplot.title = self.plot_title
 
+    @deferred('view')
     def update_data(self):
         #Don't alter these keys 'x', 'sig' etc... as they are called in the composit_plot Double Sview object
         self.data.set_data('Scattering', self.Cscatt)
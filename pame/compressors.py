@@ -0,0 +1,74 @@
+""" Compression of stored arrays (see simcolumns).  zlib is always there;
+lz4, zstd and blosc are used when installed.  Spectra are smooth and many
+imaginary parts are 0, so simulations compress well, and since columns are
+chunked along steps, reading one step only decompresses its chunks.
+
+   >>> data = compress(array.tostring(), 'zlib', level=6)
+   >>> np.frombuffer(decompress(data, 'zlib'), array.dtype)
+
+Levels go from 1 (fastest) to 9 (smallest) for every codec.
+"""
+
+import zlib
+from collections import OrderedDict
+
+LZ4_INSTALLED = True
+try:
+    import lz4.frame
+except ImportError:
+    LZ4_INSTALLED = False
+
+ZSTD_INSTALLED = True
+try:
+    import zstandard
+except ImportError:
+    ZSTD_INSTALLED = False
+
+BLOSC_INSTALLED = True
+try:
+    import blosc
+except ImportError:
+    BLOSC_INSTALLED = False
+
+DEFAULT_LEVEL = 6
+
+class CompressionError(Exception):
+    """ """
+
+# Codec : (installed, compress(data, level, typesize), decompress(data))
+CODECS = OrderedDict([
+    ('zlib', (True,
+              lambda data, level, typesize: zlib.compress(data, level),
+              zlib.decompress)),
+    ('lz4', (LZ4_INSTALLED,
+             lambda data, level, typesize: lz4.frame.compress(data, compression_level=level),
+             lambda data: lz4.frame.decompress(data))),
+    ('zstd', (ZSTD_INSTALLED,
+              lambda data, level, typesize: zstandard.ZstdCompressor(level=level).compress(data),
+              lambda data: zstandard.ZstdDecompressor().decompress(data))),
+    ('blosc', (BLOSC_INSTALLED,
+               lambda data, level, typesize: blosc.compress(data, typesize=typesize, clevel=level),
+               lambda data: blosc.decompress(data))),
+    ])
+
+def available():
+    """ Names of codecs that are installed """
+    return [name for name, codec in CODECS.items() if codec[0]]
+
+def _codec(name):
+    if name not in CODECS:
+        raise CompressionError('Unknown compression "%s"; codecs are %s'
+                               % (name, CODECS.keys()))
+    if not CODECS[name][0]:
+        raise CompressionError('%s is not installed; available codecs are %s'
+                               % (name, available()))
+    return CODECS[name]
+
+def compress(data, codec, level=DEFAULT_LEVEL, typesize=1):
+    """ Compressed bytes.  typesize (bytes per value) helps blosc shuffle."""
+    if not 1 <= level <= 9:
+        raise CompressionError('Compression level must be 1 - 9, got %s' % level)
+    return _codec(codec)[1](data, level, typesize)
+
+def decompress(data, codec):
+    return _codec(codec)[2](data)
@@ -31,6 +31,10 @@ MATDELIM = '\t'
 USESOPRA = True
 USERIINFO = True#True #slows performance it's so large
 
+# Load databases in background threads (tree fills in as they finish)
+BACKGROUNDLOAD = True
+LOADTHREADS = 3
+
 # Spectral parameters IN NANOMETERS (MUST BE IN NANOMETERS, CAN CONVERT
 # IN PROGRAM)
 xstart = 300 
@@ -42,11 +46,28 @@ xpoints = 100
 SIMFOLDER = op.join( op.abspath('.'),'Simulations') #Default save folder for sims (smart to have this way?)
 SIMPREFIX = 'Layersim'
 SIMPARSERBACKEND = 'pandas' #pandas or skspec
-MAXSTEPS = 50
+MAXSTEPS = 50 # Steps held in memory; streamed simulations go to MAXSTREAMSTEPS
+MAXSTREAMSTEPS = 100000
+# Worker processes for simulation steps; >1 runs steps in parallel through the
+# headless engine (engine.py), 1 runs them in the program
+SIMPROCESSES = 1
 # File extension
 SIMEXT = '.mpickle'
+STREAMEXT = '.simdir' # Directory of steps written as they complete (simstore.py)
+COLEXT = '.simcol' # Columnar, memory-mapped simulation (simcolumns.py)
+CATALOGNAME = '.pamecatalog.sqlite' # Index of a simulation folder (simcatalog.py)
+# Optical stacks already solved, reused across sweeps and sessions
+# (stackcache.py).  Default of the simulation's "Stack cache" option, and
+# whether the program's own stack uses it; files go to STACKCACHEDIR
+STACKCACHE = False
+STACKCACHEDIR = op.join(op.expanduser('~'), '.pame', 'stackcache')
+STACKCACHE_MB = 256
 
-SAVEDEPTH = ['light', 'medium', 'heavy']
+# What saved simulations hold: primary only, results without full optical
+# stacks, or everything (simcolumns.trim_storage)
+SAVEDEPTH = 'heavy' # light, medium or heavy (simcolumns.SAVEDEPTHS)
+COMPRESSION = 'zlib' # Default codec of columnar saves (compressors.py), or None
+COMPRESSLEVEL = 6 # 1 (fastest) - 9 (smallest)
 
 # Complex numbers
 # ---------------
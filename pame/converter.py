@@ -1,4 +1,4 @@
-from traits.api import HasTraits, Float, Array, Property, Enum, Trait, CFloat, Constant, List
+from traits.api import HasTraits, Float, Array, Property, Enum, Trait, CFloat, Constant, List, Any
 from traitsui.api import View, Item, Group, HSplit, VSplit
 from numpy import linspace, array
 from math import pi
@@ -11,7 +11,7 @@ class SpectralConverter ( HasTraits ):
     h=float(6.626068*10**-34)  # m**2 kg / s
     eVtoJ=float(1.60217646 * 10**-19)  #Number of Joules in one Ev
     c=float(299792458)     #speed of light m/
-    Units = Trait( 'Meters', { 'Meters':      1.0,
+    unit_factors = { 'Meters':      1.0,
                                'Centimeters':.01,
                                'Micrometers':.000001,
                                'Nanometers': .000000001,       #DEFINE RELATIVE TO METERS
@@ -20,7 +20,8 @@ class SpectralConverter ( HasTraits ):
                                'Wavenumber(nm-1)':.000000001,  #WAVENUMBER IS INVERSE WAVELENGTH IN NM
                                'Frequency(Hz)':  c,  #SIMPLY INVERTED
                                'Angular Frequency(rad)': 2.0*pi*c
-                               } )
+                               }
+    Units = Trait( 'Meters', unit_factors )
 
     proportional=['Meters', 'Nanometers', 'Centimeters', 'Micrometers']  #proportional to distance
     reciprocal=['cm-1', 'eV', 'Wavenumber(nm-1)', 'Frequency(Hz)', 'Angular Frequency(rad)']                #Inverse to distance (aka energy is recicprocal E=hc/lam)s  
@@ -31,6 +32,10 @@ class SpectralConverter ( HasTraits ):
                                                   'output_units' ])
     output_units  = Units( )  #Default unit
 
+    # {unit : read-only array} for specific_array(); plain dict so that
+    # caching doesn't fire trait events
+    _cache = Any()
+
     valid_units=Property(List, depends_on='proportional, reciprocal')  #All valid units in the system
 
     xstart=Property(Float, depends_on='input_array')
@@ -66,30 +71,53 @@ class SpectralConverter ( HasTraits ):
         return self.proportional+self.reciprocal
     
     def specific_array(self, new_unit): 
-        """Return a unit-converted array without changing current settings"""
+        """Return a unit-converted array without changing current settings.
+        Converting no longer toggles output_units, so it fires no trait
+        events.  Arrays are cached per unit until input_array or input_units
+        change, for repeated lookups of one grid; callers (ie
+        SpecParms.lambdas) keep and may modify what they get, so it's a copy."""
+        if self._cache is None:
+            self._cache = {}
+        try:
+            return self._cache[new_unit].copy()
+        except KeyError:
+            pass
+
         if new_unit not in self.valid_units:
             raise ConversionError('Invalid spectral unit: %s' % new_unit)
-    
-        # Temporarily change outunit, send, return it back
-        old_unit = self.output_units
-        self.output_units = new_unit
-        specificarray = self.output_array  #propety so not copied 
-        self.output_units = old_unit
-        return specificarray    
-    
-    # Property implementations
-    def _get_output_array ( self ):
-        if self.input_units in self.proportional and self.output_units in self.proportional:
-            return (self.input_array * self.input_units_) / self.output_units_
 
-        elif self.input_units in self.proportional and self.output_units in self.reciprocal:
-            return 1.0/( (self.input_array * self.input_units_) / self.output_units_)
+        specificarray = self._convert(new_unit)
+        self._cache[new_unit] = specificarray
+        return specificarray.copy()
+
+    def _input_array_changed(self):
+        if self._cache:
+            self._cache.clear()
 
-        elif self.input_units in self.reciprocal and self.output_units in self.proportional:
-            return 1.0/( (self.input_array * self.output_units_) / self.input_units_)   #Output/input
+    def _input_units_changed(self):
+        if self._cache:
+            self._cache.clear()
 
-        elif self.input_units in self.reciprocal and self.output_units in self.reciprocal:
-            return  (self.input_array * self.output_units_) / self.input_units_
+    def _convert(self, output_units):
+        """ Convert input_array to output_units; does not touch any traits. """
+        input_units = self.input_units
+        inp, out = self.unit_factors[input_units], self.unit_factors[output_units]
+
+        if input_units in self.proportional and output_units in self.proportional:
+            return (self.input_array * inp) / out
+
+        elif input_units in self.proportional and output_units in self.reciprocal:
+            return 1.0/( (self.input_array * inp) / out)
+
+        elif input_units in self.reciprocal and output_units in self.proportional:
+            return 1.0/( (self.input_array * out) / inp)   #Output/input
+
+        elif input_units in self.reciprocal and output_units in self.reciprocal:
+            return  (self.input_array * out) / inp
+
+    # Property implementations
+    def _get_output_array ( self ):
+        return self._convert(self.output_units)
 
 if __name__ == '__main__':
     x=linspace(400,555,100)
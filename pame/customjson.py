@@ -1,11 +1,27 @@
 """ Json encoding/decoding of dictionary with arbitrary array datatypes.  Thanks to hpaulj:
 http://stackoverflow.com/questions/27909658/json-encoder-and-decoder-for-complex-numpy-arrays/27913569#27913569
+
+Arrays are base64 strings in the json by default.  With sidecar, they are
+written as raw bytes to a binary file next to it instead (path + SIDECAREXT,
+or any path), and the json only holds references:
+
+   {"__ndarray_ref__": 4096, "dtype": "<c16", "shape": [100], "file": "sim.json.npbin"}
+
+Loading maps each reference as a read-only np.memmap, so neither file is
+held in memory whole:
+
+   >>> dump(allstorage, 'sim.json', sidecar=True)
+   >>> load('sim.json')['primary']['step_0']['R_avg']   #memmap
 """
+import os.path as op
 import base64
 import json
 import numpy as np
 from collections import OrderedDict
 
+SIDECAREXT = '.npbin'
+_ALIGN = 64 #Arrays start on multiples of this many bytes in the sidecar
+
 class CustomJsonError(Exception):
     """ """
 
@@ -14,19 +30,44 @@ class NumpyEncoder(json.JSONEncoder):
         """
         if input object is a ndarray it will be converted into a dict holding dtype, shape and the data base64 encoded
         """
+        if isinstance(obj, np.generic): #ie np.complex128 scalars
+            obj = np.asarray(obj)
         if isinstance(obj, np.ndarray):
-            data_b64 = base64.b64encode(obj.data)
             if obj.dtype == np.object:
                 raise CustomJsonError('Cannot encode json object types!')
-            return dict(__ndarray__=data_b64,
-                        dtype=str(obj.dtype),
-                        shape=obj.shape)
+            return self.encode_array(np.array(obj, copy=False, order='C'))
         # Let the base class default method raise the TypeError
         
 #        elif isinstance(obj ,OrderedDict.OrderedDict):
 #                return "{" + ",".join( [ self.encode(k)+":"+self.encode(v) for \
 #                                         (k,v) in obj.iteritems() ] ) + "}"        
-        return json.JSONEncoder(self, obj)
+        return json.JSONEncoder.default(self, obj)
+
+    def encode_array(self, obj):
+        return dict(__ndarray__=base64.b64encode(obj.data),
+                    dtype=str(obj.dtype),
+                    shape=obj.shape)
+
+
+class SidecarEncoder(NumpyEncoder):
+    """ Writes arrays to sidecar (open binary file, named name in the json)
+    and encodes a reference to them """
+
+    def __init__(self, *args, **kwargs):
+        self.sidecar = kwargs.pop('sidecar')
+        self.sidecar_name = kwargs.pop('sidecar_name')
+        super(SidecarEncoder, self).__init__(*args, **kwargs)
+
+    def encode_array(self, obj):
+        offset = self.sidecar.tell()
+        if offset % _ALIGN:
+            self.sidecar.write('\0' * (_ALIGN - offset % _ALIGN))
+            offset = self.sidecar.tell()
+        self.sidecar.write(obj.data)
+        return dict(__ndarray_ref__=offset,
+                    dtype=obj.dtype.str,
+                    shape=obj.shape,
+                    file=self.sidecar_name)
 
 
 def json_numpy_obj_hook(dct):
@@ -37,11 +78,27 @@ def json_numpy_obj_hook(dct):
     :return: (ndarray) if input was an encoded ndarray
     """
     if isinstance(dct, dict) and '__ndarray__' in dct:
-        print 'hi in here woo', dct
         data = base64.b64decode(dct['__ndarray__'])
         return np.frombuffer(data, dct['dtype']).reshape(dct['shape'])
     return dct
 
+def sidecar_hook(directory, mmap=True):
+    """ object_hook decoding arrays and sidecar references (files relative to
+    directory) as memmaps, or read into memory if not mmap """
+    def hook(dct):
+        if isinstance(dct, dict) and '__ndarray_ref__' in dct:
+            path = op.join(directory, dct['file'])
+            dtype, shape = np.dtype(dct['dtype']), tuple(dct['shape'])
+            if not op.exists(path):
+                raise CustomJsonError('Array sidecar %s not found' % path)
+            if mmap and dtype.itemsize * int(np.prod(shape)) > 0:
+                return np.memmap(path, dtype, 'r', dct['__ndarray_ref__'], shape)
+            with open(path, 'rb') as f:
+                f.seek(dct['__ndarray_ref__'])
+                return np.fromfile(f, dtype, int(np.prod(shape))).reshape(shape)
+        return json_numpy_obj_hook(dct)
+    return hook
+
 # Overload dump/load to default use this behavior.
 # MUST PASS FILE OBJECTS, NOT PATH STRINGS
 def dumps(*args, **kwargs):
@@ -49,26 +106,48 @@ def dumps(*args, **kwargs):
     return json.dumps(*args, **kwargs)
 
 def loads(*args, **kwargs):
-    kwargs.setdefault('object_hook', json_numpy_obj_hook)    
+    """ json.loads with arrays; sidecar files are looked for in sidecar_dir """
+    hook = sidecar_hook(kwargs.pop('sidecar_dir', '.'), kwargs.pop('mmap', True))
+    kwargs.setdefault('object_hook', hook)
     return json.loads(*args, **kwargs)
 
 def dump(*args, **kwargs):
-    kwargs.setdefault('cls', NumpyEncoder)
+    """ json.dump with arrays.  sidecar=True writes arrays to fp's path +
+    SIDECAREXT, sidecar=path to path (in the same directory when loading). """
+    sidecar = kwargs.pop('sidecar', None)
+    kwargs.setdefault('cls', SidecarEncoder if sidecar else NumpyEncoder)
     # Got tired of forgetting have to pass file object as first arg
     # so let it pass path as first argument
     args = list(args)
     if isinstance(args[1], basestring): #<--- In dump, args[1] is fp
         args[1] = open(args[1], 'w')
-    return json.dump(*args, **kwargs)
+    if not sidecar:
+        return json.dump(*args, **kwargs)
+
+    if sidecar is True:
+        if not getattr(args[1], 'name', None):
+            raise CustomJsonError('Name the sidecar file when dumping to a stream')
+        sidecar = args[1].name + SIDECAREXT
+    with open(sidecar, 'wb') as f:
+        kwargs.update(sidecar=f, sidecar_name=op.basename(sidecar))
+        return json.dump(*args, **kwargs) #Streams, arrays are never base64 strings
 
 def load(*args, **kwargs):
-    kwargs.setdefault('object_hook', json_numpy_obj_hook)
+    """ json.load with arrays.  Sidecar references become read-only memmaps
+    (mmap=False reads them instead); their files are looked for in the json
+    file's directory, or sidecar_dir."""
+    mmap = kwargs.pop('mmap', True)
+    sidecar_dir = kwargs.pop('sidecar_dir', None)
 
     # Got tired of forgetting have to pass file object as first arg
     # so let it pass path as first argument
     args = list(args) 
     if isinstance(args[0], basestring): #<--- In load, args[0] is fp
         args[0] = open(args[0], 'r')
+    if sidecar_dir is None:
+        name = getattr(args[0], 'name', None)
+        sidecar_dir = op.dirname(op.abspath(name)) if name else op.abspath('.')
+    kwargs.setdefault('object_hook', sidecar_hook(sidecar_dir, mmap))
     return json.load(*args, **kwargs)
 
 if __name__ == '__main__':
@@ -0,0 +1,125 @@
+""" Small dataflow graph with cached values and dirty flags.  Nodes are either
+sources, read from the program through value(), or computed from other nodes.
+Each node keeps its last value; pulling a node only recomputes it when
+something upstream changed, and only along that path.  For DielectricSlab:
+
+   layer0.n  layer1.n  layer2.n     layer0.d  layer1.d  layer2.d    config
+         \\      |      /                  \\      |      /            |
+                ns                                ds                 |
+                  \\_________________________________\\_______________|
+                                              optical_stack
+
+so a shell_width change (which the material recomputes itself; see quiet.py)
+only reconverts that layer's n column and the transfer matrix.
+
+Sources are checked on pull with key(), a cheap fingerprint of their inputs:
+arrays compare by identity first (materials assign new earrays rather than
+editing them in place), then by value.  invalidate() marks a node and its
+dependents dirty directly, for inputs that have no key.
+"""
+
+import numpy as np
+
+class DataflowError(Exception):
+    """ """
+
+def same(a, b):
+    """ Key comparison; arrays by identity, then value """
+    if a is b:
+        return True
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        a, b = np.asarray(a), np.asarray(b)
+        return a.shape == b.shape and np.array_equal(a, b)
+    if isinstance(a, (tuple, list)) and isinstance(b, (tuple, list)):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+class Node(object):
+    """ Cached value.  version increases each time the value changes."""
+
+    def __init__(self, name, compute, inputs=(), key=None):
+        self.name = name
+        self.compute = compute
+        self.inputs = tuple(inputs)
+        self.key = key
+        self.dependents = []
+        self.dirty = True
+        self.version = 0
+        self.computes = 0
+        self._value = None
+        self._key = None
+        self._seen = None #Input versions used for _value
+
+
+class Graph(object):
+    """ Nodes by name.  Add inputs before the nodes that use them."""
+
+    def __init__(self):
+        self.nodes = {}
+
+    def __contains__(self, name):
+        return name in self.nodes
+
+    def _add(self, node):
+        if node.name in self.nodes:
+            raise DataflowError('Node "%s" already in graph' % node.name)
+        for name in node.inputs:
+            if name not in self.nodes:
+                raise DataflowError('Node "%s" needs unknown input "%s"'
+                                    % (node.name, name))
+            self.nodes[name].dependents.append(node.name)
+        self.nodes[node.name] = node
+        return node
+
+    def source(self, name, value, key=None):
+        """ Node read with value().  With key, it is only re-read when key()
+        changes; otherwise only after invalidate(name)."""
+        return self._add(Node(name, value, key=key))
+
+    def node(self, name, compute, inputs):
+        """ Node computed as compute(*input values) """
+        return self._add(Node(name, compute, inputs))
+
+    def invalidate(self, name):
+        """ Mark name and everything downstream dirty """
+        stack = [name]
+        while stack:
+            node = self.nodes[stack.pop()]
+            node.dirty = True
+            stack.extend(node.dependents)
+
+    def _refresh(self, node):
+        if node.key is not None:
+            key = node.key()
+            if node._seen is None or not same(key, node._key):
+                node._key = key
+                node.dirty = True
+        if not node.inputs:
+            if node.dirty or node._seen is None:
+                self._store(node, node.compute(), ())
+            return
+
+        for name in node.inputs:
+            self._refresh(self.nodes[name])
+        seen = tuple(self.nodes[name].version for name in node.inputs)
+        if node.dirty or seen != node._seen:
+            values = [self.nodes[name]._value for name in node.inputs]
+            self._store(node, node.compute(*values), seen)
+
+    def _store(self, node, value, seen):
+        node._value = value
+        node._seen = seen
+        node.dirty = False
+        node.version += 1
+        node.computes += 1
+
+    def value(self, name):
+        """ Current value of name, recomputing only what changed """
+        node = self.nodes[name]
+        self._refresh(node)
+        return node._value
+
+    def stats(self):
+        """ {name : times computed} """
+        return dict((name, node.computes) for name, node in self.nodes.items())
@@ -0,0 +1,253 @@
+""" Pure (traits-free) dispersion models.  Each function takes the wavelength
+grid in nanometers (the internal PAME unit) and model parameters, and returns
+the complex permittivity.  Parameters may be scalars, giving an array shaped
+like lambdas, or length K arrays (ie K candidate materials), giving a
+(K x wavelength) array in one broadcasted computation:
+
+   >>> sellmeir(lambdas, a1=[.69, .70], a2=.41, a3=.90, b1=.068, b2=.116, b3=9.9)
+
+Material models in material_models.py and advanced_objects_v2.py call these
+for their own single parameter set, and the mixers in material_mixer_v2.py
+call the mixing rules at the bottom.  engine.py builds whole stacks from them.
+"""
+
+from __future__ import division
+import math
+import numpy as np
+
+SPEED_OF_LIGHT = 299792458.0 # m/s
+
+# Bulk (plasma, collision) wavelengths in meters; Sharma, Gupta 2007
+DRUDE_METALS = {'gold':(1.6826e-7, 8.9342e-6),
+                'silver':(1.4541e-7, 1.7614e-5),
+                'aluminum':(1.0657e-7, 2.4511e-5),
+                'copper':(1.3617e-7, 4.0825e-5)}
+
+# Fermi velocity m/s (only know gold and silver)
+FERMI_VELOCITY = {'gold':1.4e6, 'silver':1.4e6}
+
+class DispersionError(Exception):
+    """ """
+
+def _batch(lambdas, *params):
+    """ Returns lambdas and params as arrays that broadcast to (K, N) for
+    length K parameters, or (N,) if all parameters are scalars."""
+    lambdas = np.asarray(lambdas, dtype=float)
+    if lambdas.ndim != 1:
+        raise DispersionError('lambdas must be 1d, got shape %s'
+                              % (lambdas.shape,))
+    out = [lambdas]
+    for p in params:
+        p = np.asarray(p, dtype=float)
+        if p.ndim > 1:
+            raise DispersionError('Parameters must be scalars or 1d arrays')
+        out.append(p[..., np.newaxis])
+    return out
+
+def _n_to_e(narray):
+    """ Permittivity from real index (complex dtype to match earrays) """
+    return np.asarray(narray, dtype=complex)**2
+
+def cauchy(lambdas, A, B, C=0.0, D=0.0):
+    """ n = A + B/um^2 + C/um^3 + D/um^4 """
+    lambdas, A, B, C, D = _batch(lambdas, A, B, C, D)
+    um = lambdas / 1000.0
+    return _n_to_e(A + B/um**2 + C/um**3 + D/um**4)
+
+def sellmeir(lambdas, a1, a2, a3, b1, b2, b3):
+    """ n^2 = 1 + sum(a_i * um^2 / (um^2 - b_i^2)) """
+    lambdas, a1, a2, a3, b1, b2, b3 = _batch(lambdas, a1, a2, a3, b1, b2, b3)
+    l_sqr = (lambdas / 1000.0)**2
+    f1 = (a1*l_sqr) / (l_sqr - b1**2)
+    f2 = (a2*l_sqr) / (l_sqr - b2**2)
+    f3 = (a3*l_sqr) / (l_sqr - b3**2)
+    return np.asarray(1.0 + f1 + f2 + f3, dtype=complex)
+
+def dispwater(lambdas, A=3479.0, B=5.111e7):
+    """ n = 1.32334 + A/nm^2 - B/nm^4 """
+    lambdas, A, B = _batch(lambdas, A, B)
+    return _n_to_e(1.32334 + (A / lambdas**2) - (B / lambdas**4))
+
+def drude(lambdas, lam_plasma, lam_collis):
+    """ Drude metal from plasma and collision wavelengths (meters); Sharma,
+    Gupta 2007: e = 1 - m^2 * lc / (lp^2 * (lc + i*m))"""
+    lambdas, lam_plasma, lam_collis = _batch(lambdas, lam_plasma, lam_collis)
+    m = lambdas * 1.0e-9
+    return 1.0 - ((m**2 * lam_collis) / (lam_plasma**2 * (lam_collis + 1j*m)))
+
+def fermi_velocity(metal):
+    """ Fermi velocity (m/s) of metal, for the free path correction """
+    try:
+        return FERMI_VELOCITY[metal]
+    except KeyError:
+        raise DispersionError('No Fermi velocity for %s; free path correction '
+            'is only available for %s' % (metal, sorted(FERMI_VELOCITY)))
+
+def free_path_collis(lam_collis, r_core, vf=FERMI_VELOCITY['gold']):
+    """ Collision wavelength corrected for reduced mean free path in a
+    particle of radius r_core (nm).  Broadcasts like numpy."""
+    lam_collis = np.asarray(lam_collis, dtype=float)
+    r_core = np.asarray(r_core, dtype=float)
+    den = 1.0 + ((vf * lam_collis) / (2.0*math.pi*SPEED_OF_LIGHT * r_core*1.0e-9))
+    return lam_collis / den
+
+def drude_np_corrected(lambdas, lam_plasma, lam_collis, r_core,
+                       vf=FERMI_VELOCITY['gold']):
+    """ Drude metal with free path corrected collision wavelength.  Batches
+    over any of lam_plasma, lam_collis or r_core (ie many particle radii)."""
+    return drude(lambdas, lam_plasma, free_path_collis(lam_collis, r_core, vf))
+
+
+# refractiveindex.info formulas
+# -----------------------------
+# http://refractiveindex.info/download/database/rii-database-doc.pdf
+# Wavelength in micrometers, C1..C17 coefficients (1-indexed in docs).
+RIINFO_FORMULAS = {1:'Sellmeier', 2:'Sellmeier-2', 3:'Polynomial',
+                   4:'RefractiveIndex.INFO', 5:'Cauchy', 6:'Gases',
+                   7:'Herzberger', 8:'Retro', 9:'Exotic'}
+
+def riinfo_coefficients(coefficients):
+    """ Parse FORMULA coefficients (space-delimited string from yaml, or a
+    bare number if only one) into a float array.  Parse once and keep."""
+    if isinstance(coefficients, basestring):
+        return np.array(coefficients.split(), dtype=float)
+    return np.atleast_1d(np.asarray(coefficients, dtype=float))
+
+def _pairs(c, start):
+    """ (c[i], c[i+1]) pairs of coefficients from start (0-indexed) """
+    return [(c[i], c[i+1]) for i in range(start, len(c)-1, 2)]
+
+def riinfo_index(lambdas, formula_type, coefficients):
+    """ Real index of refraction from a refractiveindex.info formula (types
+    1-9) on lambdas (nm).  Coefficients are an array (see riinfo_coefficients)."""
+    um = np.asarray(lambdas, dtype=float) / 1000.0
+    c = np.asarray(coefficients, dtype=float)
+    if formula_type not in RIINFO_FORMULAS:
+        raise DispersionError('Unknown refractiveindex.info formula type %s'
+                              % formula_type)
+
+    # Pad optional trailing terms of fixed-form formulas with zeros
+    if formula_type in (7, 8, 9):
+        c = np.concatenate((c, np.zeros(max(0, 6 - len(c)))))
+
+    l_sqr = um**2
+    zeros = np.zeros(um.shape) #So constant-only formulas still give arrays
+    if formula_type == 1:
+        n_sqr = zeros + 1.0 + c[0]
+        for b, cc in _pairs(c, 1):
+            n_sqr = n_sqr + b*l_sqr / (l_sqr - cc**2)
+        return np.sqrt(n_sqr)
+
+    elif formula_type == 2:
+        n_sqr = zeros + 1.0 + c[0]
+        for b, cc in _pairs(c, 1):
+            n_sqr = n_sqr + b*l_sqr / (l_sqr - cc)
+        return np.sqrt(n_sqr)
+
+    elif formula_type == 3:
+        n_sqr = zeros + c[0]
+        for b, p in _pairs(c, 1):
+            n_sqr = n_sqr + b*um**p
+        return np.sqrt(n_sqr)
+
+    elif formula_type == 4:
+        n_sqr = zeros + c[0]
+        # Two resonant terms C2*l^C3/(l^2 - C4^C5), then polynomial terms
+        for i in (1, 5):
+            if len(c) > i+3:
+                n_sqr = n_sqr + c[i]*um**c[i+1] / (l_sqr - c[i+2]**c[i+3])
+        for b, p in _pairs(c, 9):
+            n_sqr = n_sqr + b*um**p
+        return np.sqrt(n_sqr)
+
+    elif formula_type == 5:
+        n = zeros + c[0]
+        for b, p in _pairs(c, 1):
+            n = n + b*um**p
+        return n
+
+    elif formula_type == 6:
+        n = zeros + 1.0 + c[0]
+        for b, cc in _pairs(c, 1):
+            n = n + b / (cc - 1.0/l_sqr)
+        return n
+
+    elif formula_type == 7:
+        t = 1.0 / (l_sqr - 0.028)
+        return c[0] + c[1]*t + c[2]*t**2 + c[3]*l_sqr + c[4]*l_sqr**2 + c[5]*l_sqr**3
+
+    elif formula_type == 8:
+        r = c[0] + c[1]*l_sqr / (l_sqr - c[2]) + c[3]*l_sqr
+        return np.sqrt((1.0 + 2.0*r) / (1.0 - r))
+
+    elif formula_type == 9:
+        n_sqr = c[0] + c[1] / (l_sqr - c[2]) + \
+            c[3]*(um - c[4]) / ((um - c[4])**2 + c[5])
+        return np.sqrt(n_sqr)
+
+
+# Effective medium mixing
+# -----------------------
+# Pure versions of material_mixer_v2; esolute/esolvent are earrays on the same
+# grid (or anything that broadcasts).
+
+def linear_sum(esolute, esolvent, alpha):
+    """ alpha*e1 + (1-alpha)*e2 """
+    return alpha*np.asarray(esolute) + (1.0 - alpha)*np.asarray(esolvent)
+
+def mg_garcia(esolute, esolvent, Vfrac, K=0.0):
+    """ Maxwell Garnett modified by Garcia for spheres (see MG_Mod) """
+    ep = np.asarray(esolute, dtype=complex)
+    em = np.asarray(esolvent, dtype=complex)
+    emr, epr, epi = em.real, ep.real, ep.imag
+
+    A = Vfrac*(epr - emr)
+    B = Vfrac*epi
+    shell_scaling = (1.0/3.0)  #Spheres
+    gam = (1.0/(3.0*emr)) + (K/(4.0*math.pi*emr))
+    C = em + shell_scaling*(epr - emr) - Vfrac*gam*(epr - emr)
+    D = shell_scaling*epi - Vfrac*gam*epi
+    eff_r = (emr + ((A*C + B*D) / (C**2 + D**2))).real
+    eff_i = ((B*C - A*D) / (C**2 + D**2)).real
+    return eff_r + 1j*eff_i
+
+def root_mix(esolute, esolvent, Vfrac, w):
+    """ Liu et al. 2011 single equation for MG (w=0), Bruggeman (w=2) and
+    QCA-CP (w=3):
+
+        (x-em)/(x+2em+w(x-em)) = v(e1-em)/(e1+2em+w(x-em))
+
+    which is quadratic in y = x-em, so solved in closed form on the whole
+    array rather than with a per-wavelength root finder (RootFinder).  Of the
+    two roots, the physical one is taken (largest Im, then largest Re)."""
+    e1 = np.asarray(esolute, dtype=complex)
+    em = np.asarray(esolvent, dtype=complex)
+    v = Vfrac
+
+    b = e1 + 2.0*em - v*(e1 - em)*(1.0 + w)
+    c = -3.0*v*em*(e1 - em)
+    if w == 0:
+        return em - c/b
+
+    root = np.sqrt(b**2 - 4.0*w*c)
+    y1 = (-b + root) / (2.0*w)
+    y2 = (-b - root) / (2.0*w)
+    same_imag = np.isclose(y1.imag, y2.imag)
+    first = ((y1.imag > y2.imag) & ~same_imag) | (same_imag & (y1.real >= y2.real))
+    return em + np.where(first, y1, y2)
+
+def equiv_coreshell(ecore, eshell, r_core, shell_width, core_scaling=1.0,
+                    shell_scaling=1.0, e_core_scaling=1.0, e_shell_scaling=1.0):
+    """ Core/shell particle as one equivalent particle of radius
+    r_core + shell_width (Garcia Eq. 2, see EquivMethod/CustomEquiv).  With
+    default scalings this is the plain equivalence method."""
+    ecore = np.asarray(ecore, dtype=complex)
+    eshell = np.asarray(eshell, dtype=complex)
+    r1 = core_scaling * r_core
+    r2 = shell_scaling * shell_width + r1  #r2 is not just shell_width
+    A = (r1/r2)**3
+
+    B = (eshell*e_shell_scaling) / (e_core_scaling*ecore)  #eshell/ecore
+    num = (B*(1.0 + 2.0*B)) + (2.0*A*B*(1.0 - B))
+    den = (1.0 + 2.0*B) - (A*(1.0 - B))
+    return (num/den) * ecore
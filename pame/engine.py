@@ -0,0 +1,908 @@
+""" Headless simulation engine.  Does the same computation as the GUI (layer
+permittivities, transfer matrix at each angle, angle averaging) but from a
+plain description of the stack instead of live HasTraits objects, so there are
+no trait notifications or plots.  Scripts, worker processes and batch runs use
+it directly, and describe() snapshots the running program into a description.
+
+A description is nested dicts/lists (picklable, customjson serializable):
+
+   {'spectral': {'xstart':300.0, 'xend':700.0, 'xpoints':100},   #nm
+    'angles': {'angle_start':0.5, 'angle_stop':15.96, 'angle_inc':0.5,
+               'Config':'Axial', 'Mode':'S-polarized', 'angle_avg':'Equal'},
+    'stack': [{'name':'Substrate', 'd':'semi-infinite',
+               'material':{'model':'Sellmeir'}},
+              {'name':'Nanoparticle', 'd':24.0,
+               'material':{'model':'NanoSphereShell', 'r_core':12.0}},
+              {'name':'Solvent', 'd':'semi-infinite',
+               'material':{'model':'Dispwater'}}]}
+
+Material models and their parameters are named after the GUI classes and
+traits, and any parameter left out takes the GUI default, so simulation
+variables are written the same way as in gensim:
+
+   >>> run_simulation(description, {'layer1.d':np.linspace(10, 20, 5),
+   ...                              'material1.ShellMaterial.Vfrac':...})
+
+GUI materials with no model here (eg yaml files, custom composites) are
+described as a 'Table' of their current earray.
+"""
+
+from __future__ import division
+import copy
+import logging
+import math
+import ctypes
+import multiprocessing
+import re
+import traceback
+import os.path as op
+from collections import OrderedDict
+
+import numpy as np
+import scipy.interpolate as scinterp
+from pandas import Panel
+
+from pame import globalparms, XNK_dir
+from tmm_mod import vector_com_tmm
+from material_registry import file_fingerprint
+from material_search import to_nanometers
+import dispersion
+import simstore
+import stackcache
+
+class EngineError(Exception):
+    """ """
+
+# FiberParms defaults (angle_stop is the critical angle for NA=.275)
+ANGLE_DEFAULTS = {'angle_start':0.5, 'angle_stop':15.96, 'angle_inc':0.5,
+                  'Config':'Axial', 'Mode':'S-polarized', 'angle_avg':'Equal'}
+
+_POLARIZATION = {'S-polarized':'s', 'P-polarized':'p', 'Unpolarized':'both'}
+
+# Materials
+# ---------
+_JC_GOLD = {'model':'XNKFile', 'file_path':op.join(XNK_dir, 'JC_Gold.nk')}
+
+_COMPOSITE = {'Material1':{'model':'Sellmeir'},
+              'Material2':{'model':'Dispwater'},
+              'MixingStyle':'MG Garcia', 'Vfrac':0.1, 'K':0.0, 'alpha':0.5}
+
+_EQUIV = {'MixingStyle':'Custom Equiv', 'core_scaling':1.0,
+          'shell_scaling':1.0, 'e_core_scaling':1.0, 'e_shell_scaling':1.0}
+
+# Parameters of each model and their GUI defaults
+MODEL_DEFAULTS = {
+    'Constant':{'constant_dielectric':complex(1.804535, 0.0)},
+    'Air':{'constant_dielectric':complex(1.0, 0.0)},
+    'Cauchy':{'A':1.4580, 'B':0.00354, 'C':0.0, 'D':0.0},
+    'Sellmeir':{'a1':.6961663, 'a2':.4079426, 'a3':.8974794,
+                'b1':.0684043, 'b2':.1162414, 'b3':9.896161},
+    'Dispwater':{'A':3479.0, 'B':5.111e7},
+    'DrudeBulk':{'lam_plasma':dispersion.DRUDE_METALS['gold'][0],
+                 'lam_collis':dispersion.DRUDE_METALS['gold'][1]},
+    'XNKFile':{'file_path':_JC_GOLD['file_path'], 'interpolation':'linear',
+               'extrapolation':False},
+    'XNKFileCSV':{'file_path':None, 'interpolation':'linear',
+                  'extrapolation':False},
+    'SopraFile':{'file_path':None, 'interpolation':'linear',
+                 'extrapolation':False},
+    'Table':{'lambdas':None, 'earray':None},
+    'CompositeMaterial':_COMPOSITE,
+    'CompositeMaterial_Equiv':dict(_EQUIV, r_particle=12.0, shell_width=2.0,
+                                   Material1={'model':'Sellmeir'},
+                                   Material2={'model':'Dispwater'}),
+    'NanoSphereShell':dict(r_core=12.0, shell_width=2.0, Vfrac=0.1, K=0.0,
+                           alpha=0.5, MixingStyle='MG Garcia',
+                           CoreMaterial=_JC_GOLD,
+                           MediumMaterial={'model':'Dispwater'},
+                           ShellMaterial=dict(_COMPOSITE, model='CompositeMaterial'),
+                           CoreShellComposite=_EQUIV),
+    }
+
+# Same mixing rule as CompositeMaterial.MixingStyle
+_ROOT_MIXING = {'MG (root)':0, 'Bruggeman (root)':2, 'QCACP (root)':3}
+
+def _params(spec):
+    """ Material spec over its model defaults """
+    model = spec.get('model')
+    if model not in _MATERIALS:
+        raise EngineError('Unknown material model "%s"; valid models are %s'
+                          % (model, sorted(_MATERIALS)))
+    p = dict(MODEL_DEFAULTS[model])
+    p.update(spec)
+    return p
+
+def _mix(p, esolute, esolvent):
+    style = p['MixingStyle']
+    if style == 'MG Garcia':
+        return dispersion.mg_garcia(esolute, esolvent, p['Vfrac'], p['K'])
+    elif style == 'LinearSum':
+        return dispersion.linear_sum(esolute, esolvent, p['alpha'])
+    elif style in _ROOT_MIXING:
+        return dispersion.root_mix(esolute, esolvent, p['Vfrac'],
+                                   _ROOT_MIXING[style])
+    raise EngineError('Unknown MixingStyle "%s"' % style)
+
+def _equiv(p, ecore, eshell, r_core, shell_width):
+    if p['MixingStyle'] == 'Equivalence':
+        return dispersion.equiv_coreshell(ecore, eshell, r_core, shell_width)
+    elif p['MixingStyle'] == 'Custom Equiv':
+        return dispersion.equiv_coreshell(ecore, eshell, r_core, shell_width,
+            p['core_scaling'], p['shell_scaling'], p['e_core_scaling'],
+            p['e_shell_scaling'])
+    raise EngineError('Unknown equivalence MixingStyle "%s"' % p['MixingStyle'])
+
+# File data is read once per file (path, size, mtime)
+_FILE_DATA = {}
+
+def _read_xnk(path, delimiter=None):
+    with open(path, 'r') as f:
+        header = f.readline().lstrip('#').strip()
+    x, n, k = np.genfromtxt(path, unpack=True, skip_header=1,
+                            delimiter=delimiter)
+    return x, n + 1j*k, header.split(delimiter)[0]
+
+def _read_sopra(path):
+    with open(path, 'r') as f:
+        header = f.readline().lstrip('#').strip().split()
+    code, xstart, xend, xpoints = (int(header[0]), float(header[1]),
+                                   float(header[2]), int(header[3]))
+    units = {1:'eV', 2:'Micrometers', 3:'cm-1', 4:'Nanometers'}
+    if code not in units:
+        raise EngineError('Sopra specunit code must be 1,2,3 or 4.  Got: %s'
+                          % code)
+    n, k = np.genfromtxt(path, unpack=True, skip_header=1)
+    return np.linspace(xstart, xend, xpoints+1), n + 1j*k, units[code]
+
+def _file_data(model, path):
+    """ (xps in nm, complex n), increasing in wavelength """
+    if path is None:
+        raise EngineError('%s material needs a file_path' % model)
+    key = (model, file_fingerprint(path))
+    if key not in _FILE_DATA:
+        if model == 'SopraFile':
+            x, n, unit = _read_sopra(path)
+        else:
+            x, n, unit = _read_xnk(path, ',' if model == 'XNKFileCSV' else None)
+        xps = np.array([to_nanometers(v, unit) for v in x])
+        if xps[0] > xps[-1]:
+            xps, n = xps[::-1], n[::-1]
+        _FILE_DATA[key] = (xps, n)
+    return _FILE_DATA[key]
+
+def _file(p, lambdas):
+    """ Same interpolation as ABCExternal.update_interp """
+    xps, n = _file_data(p['model'], p['file_path'])
+    f = scinterp.interp1d(xps, n, kind=p['interpolation'], bounds_error=False)
+    if p['extrapolation']:
+        lambdas = np.clip(lambdas, xps[0], xps[-1])
+    return np.asarray(f(lambdas), dtype=complex)**2
+
+def _table(p, lambdas):
+    """ Earray sampled on its own grid (ie snapshot of a GUI material) """
+    x = np.asarray(p['lambdas'], dtype=float)
+    e = np.asarray(p['earray'], dtype=complex)
+    if x.shape == lambdas.shape and np.allclose(x, lambdas):
+        return e
+    return np.interp(lambdas, x, e.real) + 1j*np.interp(lambdas, x, e.imag)
+
+def _composite(p, lambdas):
+    return _mix(p, evaluate_material(p['Material1'], lambdas),
+                evaluate_material(p['Material2'], lambdas))
+
+def _composite_equiv(p, lambdas):
+    return _equiv(p, evaluate_material(p['Material1'], lambdas),
+                  evaluate_material(p['Material2'], lambdas),
+                  p['r_particle'], p['shell_width'])
+
+def _nanosphere_shell(p, lambdas):
+    """ Same chain as NanoSphereShell: shell inclusions in the medium, core
+    and shell as an equivalent particle, particles mixed into the medium."""
+    ecore = evaluate_material(p['CoreMaterial'], lambdas)
+    emedium = evaluate_material(p['MediumMaterial'], lambdas)
+
+    shell = dict(MODEL_DEFAULTS['CompositeMaterial'])
+    shell.update(p['ShellMaterial'])  #Material2 is always the medium
+    eshell = _mix(shell, evaluate_material(shell['Material1'], lambdas), emedium)
+
+    equiv = dict(_EQUIV)
+    equiv.update(p['CoreShellComposite'])
+    ecomposite = _equiv(equiv, ecore, eshell, p['r_core'], p['shell_width'])
+    return _mix(p, ecomposite, emedium)
+
+_MATERIALS = {
+    'Constant':lambda p, l: np.zeros(len(l), dtype=complex) + p['constant_dielectric'],
+    'Air':lambda p, l: np.zeros(len(l), dtype=complex) + p['constant_dielectric'],
+    'Cauchy':lambda p, l: dispersion.cauchy(l, p['A'], p['B'], p['C'], p['D']),
+    'Sellmeir':lambda p, l: dispersion.sellmeir(l, p['a1'], p['a2'], p['a3'],
+                                                p['b1'], p['b2'], p['b3']),
+    'Dispwater':lambda p, l: dispersion.dispwater(l, p['A'], p['B']),
+    'DrudeBulk':lambda p, l: dispersion.drude(l, p['lam_plasma'], p['lam_collis']),
+    'XNKFile':_file,
+    'XNKFileCSV':_file,
+    'SopraFile':_file,
+    'Table':_table,
+    'CompositeMaterial':_composite,
+    'CompositeMaterial_Equiv':_composite_equiv,
+    'NanoSphereShell':_nanosphere_shell,
+    }
+
+def evaluate_material(spec, lambdas):
+    """ Complex permittivity of a material description on lambdas (nm) """
+    p = _params(spec)
+    return np.asarray(_MATERIALS[p['model']](p, lambdas), dtype=complex)
+
+
+# Stack and optics
+# ----------------
+def spectral_grid(spectral):
+    """ lambdas (nm) from {'lambdas':array} or {'xstart', 'xend', 'xpoints'} """
+    if spectral.get('lambdas') is not None:
+        return np.asarray(spectral['lambdas'], dtype=float)
+    try:
+        return np.linspace(spectral['xstart'], spectral['xend'],
+                           spectral['xpoints'])
+    except KeyError as exc:
+        raise EngineError('Spectral parameters need lambdas or xstart, xend '
+                          'and xpoints; missing %s' % exc)
+
+def angle_grid(angles):
+    """ Angles in degrees, same as AngleParms/FiberParms.  Explicit 'angles'
+    are used as is (ie already transversal)."""
+    p = dict(ANGLE_DEFAULTS)
+    p.update(angles)
+    if p.get('angles') is not None:
+        return np.asarray(p['angles'], dtype=float)
+    samples = round((p['angle_stop'] - p['angle_start']) / p['angle_inc'])
+    out = np.linspace(p['angle_start'], p['angle_stop'], num=samples)
+    if p['Config'] == 'Transversal':
+        out = abs(90.0 - out)
+    return out
+
+def stack_arrays(stack, lambdas):
+    """ ns (layers x lambdas) and ds [inf, d..., inf] like DielectricSlab """
+    ns = np.empty((len(stack), len(lambdas)), dtype=complex)
+    ds = [np.inf, np.inf]
+    for i, layer in enumerate(stack):
+        ns[i, :] = np.lib.scimath.sqrt(evaluate_material(layer['material'],
+                                                         lambdas))
+        if layer.get('d', globalparms.semiinf_layer) != globalparms.semiinf_layer:
+            ds.insert(-1, layer['d'])
+    return ns, np.array(ds)
+
+def optical_stack(ns, ds, lambdas, angles, Mode='S-polarized'):
+    """ Panel of {angle : vector_com_tmm DataFrame}; see
+    DielectricSlab.update_optical_stack"""
+    try:
+        pol = _POLARIZATION[Mode]
+    except KeyError:
+        raise EngineError('Mode must be "S-polarized", "P-polarized" or '
+                          '"Unpolarized"; got %s' % Mode)
+    paneldict = {}
+    for ang in angles:
+        ang_rad = math.radians(ang)
+        if pol == 'both':
+            df_s = vector_com_tmm('s', ns, ds, ang_rad, lambdas)
+            df_p = vector_com_tmm('p', ns, ds, ang_rad, lambdas)
+            df = (df_s + df_p) / 2.0
+            tan_psi = df_p['r_amp'].abs() / df_s['r_amp'].abs()
+            df['r_psi'] = np.arctan(tan_psi)
+            df['r_delta'] = 1.0j * (np.log((tan_psi * (df_s['r_amp'] / df_p['r_amp']))))
+        else:
+            df = vector_com_tmm(pol, ns, ds, ang_rad, lambdas)
+            df['r_psi'] = np.nan * np.empty(len(lambdas))
+            df['r_delta'] = np.nan * np.empty(len(lambdas))
+        paneldict[ang] = df
+    return Panel(paneldict)
+
+def compute_average(stack, attr, angle_avg='Equal'):
+    """ Angle average of one optical quantity (ie 'R') """
+    if angle_avg != 'Equal':
+        raise EngineError('Only "Equal" angle averaging is supported; got %s'
+                          % angle_avg)
+    return np.average(np.vstack([stack[item][attr] for item in stack]), axis=0)
+
+def flat_attributes(stack, choose_optics, layers):
+    """ Layer dependent quantities (kz) expand to kz_L0, kz_L1... """
+    out = []
+    delim = '_%s' % globalparms._flat_suffix
+    setkeys = set(name.split(delim)[0] for name in stack.minor_axis
+                  if delim in name)
+    for attr in choose_optics:
+        if attr in stack.minor_axis:
+            out.append(attr)
+        elif attr in setkeys:
+            out.extend(attr + delim + str(idx) for idx in range(layers))
+        else:
+            raise EngineError('Cannot simulate over optical stack attr "%s" '
+                              ' not found in optical stack.' % attr)
+    return out
+
+def primary_optics(stack, choose_optics, averaging, layers, angles):
+    """ [(primary key, choose_optics entry, flat attribute, angle)] of the
+    optics evaluate_step stores, in order; angle is None for the average """
+    out = []
+    pairs = [(attr, flat) for attr in choose_optics
+             for flat in flat_attributes(stack, [attr], layers)]
+    if averaging in ['Average', 'Both']:
+        out.extend(('%s_%s' % (flat, 'avg'), attr, flat, None)
+                   for attr, flat in pairs)
+    if averaging in ['Not Averaged', 'Both']:
+        out.extend(('%s_%.2f' % (flat, angle), attr, flat, angle)
+                   for attr, flat in pairs for angle in angles)
+    return out
+
+def output_optics(description, choose_optics=None, averaging='Both'):
+    """ OrderedDict {primary key : (choose_optics entry, averaging)} of the
+    optics evaluate_step stores for description, found by solving it at one
+    wavelength.  choose_optics of None is every optical stack attribute."""
+    lambdas = spectral_grid(description['spectral'])[:1]
+    angles_p = dict(ANGLE_DEFAULTS)
+    angles_p.update(description.get('angles', {}))
+    angles = angle_grid(angles_p)
+    ns, ds = stack_arrays(description['stack'], lambdas)
+    stack = optical_stack(ns, ds, lambdas, angles, angles_p['Mode'])
+    if choose_optics is None:
+        delim = '_%s' % globalparms._flat_suffix
+        choose_optics = [name for name in stack.minor_axis if delim not in name]
+        choose_optics += sorted(set(name.split(delim)[0] for name in
+                                    stack.minor_axis if delim in name))
+    return OrderedDict((key, (attr, 'Average' if angle is None else 'Not Averaged'))
+        for key, attr, flat, angle in
+        primary_optics(stack, choose_optics, averaging, len(ns), angles))
+
+
+# Descriptions
+# ------------
+_LAYER_PATH = re.compile(r'(layer|material)_?(\d+)$')
+
+def _split_path(description, path):
+    """ (layer index, remaining names) of a gensim style path; layer index is
+    None for paths that aren't in the stack (ie spectral.xstart).  layer1,
+    Layer_1, substrate and solvent index the stack, and material1.x is short
+    for layer1.material.x"""
+    names = path.split('.')
+    prefix = names[0].lower()
+    stack = description['stack']
+    match = _LAYER_PATH.match(prefix)
+    if prefix in ('substrate', 'solvent'):
+        return (0 if prefix == 'substrate' else len(stack) - 1), names[1:]
+    elif match:
+        idx = int(match.group(2))
+        if idx >= len(stack):
+            raise EngineError('No layer for "%s" in stack of %s layers'
+                              % (names[0], len(stack)))
+        if match.group(1) == 'material':
+            return idx, ['material'] + names[1:]
+        return idx, names[1:]
+    return None, names
+
+def _locate(description, path, create=False):
+    """ (container, key) for a path.  If create, nested materials left to
+    defaults are filled in so that they can be set."""
+    idx, names = _split_path(description, path)
+    container = description if idx is None else description['stack'][idx]
+    if not names:
+        raise EngineError('Path "%s" names a layer, not a value' % path)
+    for name in names[:-1]:
+        if name not in container:
+            default = MODEL_DEFAULTS.get(container.get('model'), {}).get(name)
+            if default is None or not create:
+                raise EngineError('Cannot resolve "%s" in %s' % (name, path))
+            container[name] = copy.deepcopy(default)
+        container = container[name]
+    return container, names[-1]
+
+def get_value(description, path):
+    """ Value at path, or the model default if not set explicitly """
+    container, key = _locate(description, path)
+    if key in container:
+        return container[key]
+    try:
+        return MODEL_DEFAULTS[container['model']][key]
+    except KeyError:
+        raise EngineError('Cannot resolve "%s"' % path)
+
+def set_value(description, path, value):
+    """ Set value at path.  Only parameters of the material's model can be
+    set (ie can't simulate Vfrac of a Table)."""
+    container, key = _locate(description, path, create=True)
+    model = container.get('model')
+    if model is not None and key not in MODEL_DEFAULTS.get(model, {}):
+        raise EngineError('"%s" is not a parameter of %s material (%s)'
+                          % (key, model, path))
+    container[key] = value
+
+
+def evaluate_step(description, choose_optics=('R', 'T', 'A'),
+                  averaging='Average', store_optical_stack=False,
+                  additional_list=(), choose_layers='None',
+                  mater_only='Material Data', selected_index=1, cache=None,
+                  cache_bytes=stackcache.MAXBYTES):
+    """ One simulation step: returns (primary, results) dictionaries keyed
+    the same as LayerSimulation.runsim (keywords are SimConfigure traits).
+    Stored layers only have name, thickness and material e/n arrays.  With
+    cache (a directory), optical stacks are looked up in a
+    stackcache.StackCache before solving."""
+    lambdas = spectral_grid(description['spectral'])
+    angles_p = dict(ANGLE_DEFAULTS)
+    angles_p.update(description.get('angles', {}))
+    angles = angle_grid(angles_p)
+
+    ns, ds = stack_arrays(description['stack'], lambdas)
+    if cache:
+        stack = stackcache.open_cache(cache, cache_bytes).optical_stack(
+            ns, ds, lambdas, angles, angles_p['Mode'], optical_stack)
+    else:
+        stack = optical_stack(ns, ds, lambdas, angles, angles_p['Mode'])
+
+    primary = OrderedDict()
+    results = OrderedDict()
+    for key, attr, flat, angle in primary_optics(stack, choose_optics,
+                                                 averaging, len(ns), angles):
+        if angle is None:
+            primary[key] = compute_average(stack, flat, angles_p['angle_avg'])
+        else:
+            primary[key] = stack[angle][flat]
+
+    for path in additional_list:
+        primary[path] = get_value(description, path)
+
+    if store_optical_stack:
+        results[globalparms.optresponse] = stack
+
+    if choose_layers == 'Selected Layer':
+        results['Layer%s' % selected_index] = _layer_storage(
+            description['stack'][selected_index], ns[selected_index])
+
+    elif choose_layers == 'All Layers':
+        results['dielectric_layers'] = OrderedDict(
+            ('layer%s' % idx, _layer_storage(layer, ns[idx],
+                                             mater_only == 'Material Data'))
+            for idx, layer in enumerate(description['stack']))
+    return primary, results
+
+def _layer_storage(layer, narray, materials_only=False):
+    material = {'name':layer['material'].get('name', layer['material'].get('model')),
+                'earray':narray**2, 'narray':narray}
+    if materials_only:
+        return material
+    return {'layer_name':layer.get('name', ''),
+            'layer_thickness':layer.get('d', globalparms.semiinf_layer),
+            'material':material}
+
+def sim_inputs(variables):
+    """ {path : values} as arrays, checking each variable has same steps """
+    inputs = OrderedDict((path, np.asarray(values))
+                         for path, values in variables.items())
+    steps = set(len(values) for values in inputs.values())
+    if len(steps) > 1:
+        raise EngineError('Simulation variables must have the same number of '
+                          'steps; got %s' % dict((k, len(v)) for k, v in inputs.items()))
+    return inputs, (steps.pop() if steps else 1)
+
+def _copy_tree(obj):
+    """ Copy of the dicts and lists of a description; arrays and other leaves
+    are shared, not copied."""
+    if isinstance(obj, dict):
+        return obj.__class__((k, _copy_tree(v)) for k, v in obj.items())
+    elif isinstance(obj, list):
+        return [_copy_tree(v) for v in obj]
+    return obj
+
+def changes_material(description, path):
+    """ True if path changes a material earray (material parameters or the
+    spectral grid), not just the stack geometry or angles"""
+    idx, names = _split_path(description, path)
+    if idx is None:
+        return names[0] == 'spectral'
+    return bool(names) and names[0] == 'material'
+
+def freeze_materials(description, paths):
+    """ Copy of description where materials that no path changes are replaced
+    by a Table of their earray, so they're only evaluated once per run (and
+    shared between worker processes)."""
+    out = _copy_tree(description)
+    varied = set()
+    for path in paths:
+        if changes_material(description, path):
+            idx, names = _split_path(description, path)
+            if idx is None:
+                return out #New grid each step
+            varied.add(idx)
+
+    lambdas = spectral_grid(description['spectral'])
+    for idx, layer in enumerate(out['stack']):
+        material = layer['material']
+        if idx not in varied and material.get('model') != 'Table':
+            layer['material'] = {'model':'Table',
+                'name':material.get('name', material.get('model')),
+                'lambdas':lambdas,
+                'earray':evaluate_material(material, lambdas)}
+    return out
+
+def schedule(description, paths, points):
+    """ Groups [[point index, ...]] of points with the same material values.
+    Materials are the expensive part of a step (files, mixing, root
+    finding), so points are ordered with material values varying slowest,
+    and each group evaluates its materials once for all of its points."""
+    material = [j for j, path in enumerate(paths)
+                if changes_material(description, path)]
+    key = lambda i: tuple(points[i][j] for j in material)
+    groups = []
+    last = object()
+    for i in sorted(range(len(points)), key=key): #Stable, keeps point order
+        if key(i) != last:
+            groups.append([])
+            last = key(i)
+        groups[-1].append(i)
+    return groups
+
+def evaluate_group(description, paths, points, **storage):
+    """ [(primary, results)] of points that share material values """
+    first = _copy_tree(description)
+    for path, value in zip(paths, points[0]):
+        set_value(first, path, value)
+
+    cheap = [path for path in paths if not changes_material(description, path)]
+    frozen = freeze_materials(first, cheap + list(storage.get('additional_list', ())))
+    out = []
+    for point in points:
+        step = _copy_tree(frozen)
+        for path, value in zip(paths, point):
+            if path in cheap:
+                set_value(step, path, value)
+        out.append(evaluate_step(step, **storage))
+    return out
+
+class StepFailure(object):
+    """ Result of a point that raised; message is its traceback """
+    def __init__(self, message):
+        self.message = message
+
+def evaluate_safe(description, paths, points, **storage):
+    """ evaluate_group, but a point that raises gives a StepFailure rather
+    than losing the rest of the group """
+    try:
+        return evaluate_group(description, paths, points, **storage)
+    except Exception:
+        if len(points) == 1:
+            return [StepFailure(traceback.format_exc())]
+    return [evaluate_safe(description, paths, [point], **storage)[0] 
+            for point in points]
+
+
+# Worker processes
+# ----------------
+# The description is sent to each worker once; its arrays (frozen
+# materials, grids) are copied into shared memory and viewed read-only by
+# the workers, so tasks are only the points to evaluate.
+_WORKER = {}
+
+class _SharedArray(object):
+    """ Placeholder for an array in shared memory buffer number idx """
+    def __init__(self, idx, dtype, shape):
+        self.idx, self.dtype, self.shape = idx, dtype, shape
+
+def _share_arrays(obj, buffers):
+    """ Copy of description with arrays moved into new shared buffers """
+    if isinstance(obj, np.ndarray) and obj.size:
+        buf = multiprocessing.RawArray(ctypes.c_byte, obj.nbytes)
+        np.frombuffer(buf, dtype=obj.dtype)[:] = obj.ravel()
+        buffers.append(buf)
+        return _SharedArray(len(buffers) - 1, obj.dtype.str, obj.shape)
+    elif isinstance(obj, dict):
+        return obj.__class__((k, _share_arrays(v, buffers)) for k, v in obj.items())
+    elif isinstance(obj, list):
+        return [_share_arrays(v, buffers) for v in obj]
+    return obj
+
+def _attach_arrays(obj, buffers):
+    """ Replace _SharedArray placeholders with read-only views """
+    if isinstance(obj, _SharedArray):
+        out = np.frombuffer(buffers[obj.idx], dtype=obj.dtype).reshape(obj.shape)
+        out.flags.writeable = False
+        return out
+    elif isinstance(obj, dict):
+        return obj.__class__((k, _attach_arrays(v, buffers)) for k, v in obj.items())
+    elif isinstance(obj, list):
+        return [_attach_arrays(v, buffers) for v in obj]
+    return obj
+
+def _init_worker(skeleton, buffers, paths, storage, evaluate):
+    _WORKER['description'] = _attach_arrays(skeleton, buffers)
+    _WORKER['paths'] = paths
+    _WORKER['storage'] = storage
+    _WORKER['evaluate'] = evaluate
+
+def _worker_group(task):
+    """ (indices, results, stack cache counts of this task) """
+    indices, points = task
+    before = dict(stackcache.COUNTS)
+    results = _WORKER['evaluate'](_WORKER['description'], _WORKER['paths'],
+                                  points, **_WORKER['storage'])
+    return indices, results, dict((k, v - before[k]) for k, v in 
+                                  stackcache.COUNTS.items())
+
+def iter_points(description, paths, points, processes=1, failures=False,
+                **storage):
+    """ Yields (point index, (primary, results)) as each point completes,
+    in schedule order rather than point order.  Points are scheduled by
+    material values (see schedule), and with processes > 1 run in a pool of
+    worker processes.  Only finished results not yet taken are held.  With
+    failures, points that raise yield a StepFailure instead of stopping the
+    run."""
+    points = [tuple(point) for point in points]
+    if not points:
+        return
+
+    # Check all paths resolve before starting any work.  Materials read by
+    # additional_list keep their parameters.
+    check = _copy_tree(description)
+    for path, value in zip(paths, points[0]):
+        set_value(check, path, value)
+    frozen = freeze_materials(description, list(paths) +
+                              list(storage.get('additional_list', ())))
+    groups = schedule(frozen, paths, points)
+    evaluate = evaluate_safe if failures else evaluate_group
+
+    if processes <= 1:
+        for group in groups:
+            for i, result in zip(group, evaluate(frozen, paths,
+                    [points[i] for i in group], **storage)):
+                yield i, result
+        return
+
+    # Split groups so that all workers get work even if materials never change
+    chunk = max(1, len(points) // (4*processes))
+    tasks = [(group[j:j+chunk], [points[i] for i in group[j:j+chunk]])
+             for group in groups for j in range(0, len(group), chunk)]
+
+    buffers = []
+    skeleton = _share_arrays(frozen, buffers)
+    pool = multiprocessing.Pool(min(processes, len(tasks)), _init_worker,
+                                (skeleton, buffers, list(paths), storage, evaluate))
+    try:
+        for indices, results, counts in pool.imap_unordered(_worker_group, tasks):
+            stackcache.add_counts(counts)
+            for i, result in zip(indices, results):
+                yield i, result
+    finally:
+        pool.close()
+        pool.join()
+
+def run_points(description, paths, points, processes=1, **storage):
+    """ [(primary, results)] for each point (tuple of values of paths), in
+    the order of points (see iter_points)."""
+    out = [None] * len(points)
+    for i, result in iter_points(description, paths, points, processes, **storage):
+        out[i] = result
+    return out
+
+def rename_keys(tree, rename):
+    """ Copy of tree with keys renamed by rename ({key : name}) """
+    return OrderedDict((rename.get(k, k), v) for k, v in tree.items())
+
+def collect_points(description, paths, points, processes=1, store=None,
+                   static=None, about=None, rename=None, plan=None, **storage):
+    """ Primary and results dictionaries {'step_i' : ...} of points, with
+    primary keys renamed by rename ({path : name}).  With store (a
+    directory), each step is written to a simstore.StepWriter as it
+    completes instead and the returned dictionaries are empty; the store
+    also gets the plan (plus any extra plan entries) so resume_simulation
+    can finish it, and steps that raise are recorded and skipped."""
+    rename = rename or {}
+    primary = OrderedDict()
+    results = OrderedDict()
+    if store is None:
+        for i, (primary_increment, results_increment) in enumerate(
+                run_points(description, paths, points, processes, **storage)):
+            stepname = 'step_%s' % i
+            primary[stepname] = rename_keys(primary_increment, rename)
+            results[stepname] = results_increment
+        return primary, results
+
+    writer = simstore.StepWriter(store, static, about)
+    write_plan(writer, description, paths, points, processes, rename, 
+               storage, plan)
+    _stream_points(writer, description, paths, points, range(len(points)),
+                   processes, rename, storage)
+    return primary, results
+
+def write_plan(writer, description, paths, points, processes=1, rename=None,
+               storage=None, plan=None):
+    """ Save what resume_simulation needs to (re)run any step of writer's
+    store (plan is extra entries, eg sweep shape)."""
+    writer.write_plan(dict(plan or {}, description=description, 
+        paths=list(paths), points=[tuple(p) for p in points], 
+        processes=processes, rename=rename or {}, storage=storage or {}))
+
+def _stream_points(writer, description, paths, points, indices, processes,
+                   rename, storage):
+    """ Run points[indices] into writer; returns indices that failed """
+    failed = []
+    for j, result in iter_points(description, paths, [points[i] for i in indices],
+                                 processes, failures=True, **storage):
+        i = indices[j]
+        if isinstance(result, StepFailure):
+            logging.warning('Step %s failed:\n%s' % (i, result.message))
+            writer.fail(i, result.message)
+            failed.append(i)
+            continue
+        primary_increment, results_increment = result
+        writer.append(i, rename_keys(primary_increment, rename), results_increment,
+                      rename_keys(OrderedDict(zip(paths, points[i])), rename))
+    writer.close()
+    return sorted(failed)
+
+def resume_simulation(store, processes=None, failed_only=False):
+    """ Finish a streamed simulation (run_simulation or run_sweep with store)
+    that was cut short: runs steps not on disk yet, or with failed_only, just
+    the steps that raised.  processes defaults to that of the original run.
+    Returns storage dictionaries as run_simulation, with 'failed' the steps
+    that still fail."""
+    reader = simstore.StepReader(store)
+    plan = reader.plan
+    if plan is None:
+        raise EngineError('%s has no plan (not written by the engine); '
+                          'cannot resume' % store)
+    points = plan['points']
+    if failed_only:
+        indices = list(reader.failed)
+    else:
+        indices = reader.unfinished(len(points))
+    if processes is None:
+        processes = plan['processes']
+
+    writer = simstore.StepWriter.reopen(store)
+    _stream_points(writer, plan['description'], plan['paths'], points, 
+                   indices, processes, plan['rename'], plan['storage'])
+
+    allout = OrderedDict()
+    allout['static'] = reader.static
+    allout['about'] = reader.about
+    allout['primary'] = OrderedDict()
+    allout['results'] = OrderedDict()
+    allout['inputs'] = OrderedDict(
+        (plan['rename'].get(path, path), np.array([p[j] for p in points]))
+        for j, path in enumerate(plan['paths']))
+    allout['store'] = store
+    allout['failed'] = list(reader.failed)
+    return allout
+
+def static_storage(description):
+    """ Static dictionary of ABCSim.allstorage: spectral and angle parameters """
+    lambdas = spectral_grid(description['spectral'])
+    angles = dict(ANGLE_DEFAULTS)
+    angles.update(description.get('angles', {}))
+
+    static = OrderedDict()
+    static['Layers in Slab'] = len(description['stack'])
+    static[globalparms.spectralparameters] = {
+        'lambdas':lambdas, 'xstart':lambdas[0], 'xend':lambdas[-1],
+        'x_increment':abs(lambdas[0] - lambdas[-1]) / len(lambdas),
+        'x_samples':len(lambdas), 'x_unit':'Nanometers'}
+    static[globalparms.strataname] = {
+        'Optical Configuration':angles['Config'], 'Mode':angles['Mode'],
+        'Angle Min':angles['angle_start'], 'Angle Max':angles['angle_stop'],
+        'Angle Inc.':angles['angle_inc']}
+    return static
+
+def cache_counts(before):
+    """ Stack cache hits, misses... since before (a copy of
+    stackcache.COUNTS), workers included """
+    out = OrderedDict((k, stackcache.COUNTS[k] - before[k]) for k in 
+                      ('hits', 'misses', 'stores', 'evictions'))
+    lookups = out['hits'] + out['misses']
+    out['hit_rate'] = out['hits'] / lookups if lookups else 0.0
+    return out
+
+def run_simulation(description, variables=None, processes=1, store=None,
+                   rename=None, **storage):
+    """ Headless LayerSimulation.runsim.  variables is {path : values} (all
+    the same length), storage is keywords of evaluate_step.  With processes
+    > 1, steps run in a pool of worker processes.  Returns the same storage
+    dictionaries as ABCSim.allstorage (static, about, primary, results,
+    inputs), which LayerSimParser or customjson can save.  rename is {path :
+    name} for inputs and primary keys (eg additional_list paths).
+
+    With store (a directory name), steps are streamed to a simstore on disk
+    as they finish and primary/results come back empty, so the number of
+    steps isn't limited by memory; read it back with simstore.StepReader.
+    Steps that raise are skipped and listed in 'failed'; resume_simulation
+    reruns them or finishes a run that was cut short."""
+    inputs, steps = sim_inputs(variables or {})
+    points = zip(*inputs.values()) if inputs else [()]
+    counts = dict(stackcache.COUNTS)
+
+    allout = OrderedDict()
+    allout['static'] = static_storage(description)
+    allout['about'] = OrderedDict([('Steps', steps), ('Processes', processes),
+                                   ('Storage', storage)])
+    allout['primary'], allout['results'] = collect_points(description,
+        list(inputs), points, processes, store, allout['static'],
+        allout['about'], rename, **storage)
+    allout['inputs'] = rename_keys(inputs, rename or {})
+    if storage.get('cache'):
+        allout['about']['Stack cache'] = cache_counts(counts)
+    if store is not None:
+        allout['store'] = store
+        allout['failed'] = list(simstore.StepReader(store).failed)
+    return allout
+
+def describe_material(material):
+    """ Description of a GUI material (duck typed on class name, so no traits
+    import).  Materials with no engine model become a Table of their earray."""
+    model = type(material).__name__
+    if model in ('NanoSphere', 'SphericalInclusions', 'SphericalInclusions_Shell',
+                 'SphericalInclusions_Disk'):
+        model = 'CompositeMaterial'  #Same mixing, extra traits are cosmetic
+
+    if model == 'NanoSphereShell':
+        out = {'model':model, 'r_core':material.r_core,
+               'shell_width':material.shell_width,
+               'CoreMaterial':describe_material(material.CoreMaterial),
+               'MediumMaterial':describe_material(material.MediumMaterial)}
+        out.update(_describe_mix(material.TotalMix))
+
+        # Shell is mixed in the medium, core/shell composite only needs mixing
+        shell = material.ShellMaterial
+        out['ShellMaterial'] = {'model':'CompositeMaterial',
+                                'Material1':describe_material(shell.Material1)}
+        out['ShellMaterial'].update(_describe_mix(shell))
+        out['CoreShellComposite'] = _describe_equiv(material.CoreShellComposite)
+        return out
+
+    elif model == 'CompositeMaterial':
+        out = {'model':model,
+               'Material1':describe_material(material.Material1),
+               'Material2':describe_material(material.Material2)}
+        out.update(_describe_mix(material))
+        return out
+
+    elif model == 'CompositeMaterial_Equiv':
+        out = _describe_equiv(material)
+        out.update({'model':model, 'r_particle':material.r_particle,
+                    'shell_width':material.shell_width,
+                    'Material1':describe_material(material.Material1),
+                    'Material2':describe_material(material.Material2)})
+        return out
+
+    elif model in MODEL_DEFAULTS and model != 'Table':
+        out = {'model':model}
+        for key in MODEL_DEFAULTS[model]:
+            out[key] = getattr(material, key)
+        return out
+
+    return {'model':'Table', 'name':getattr(material, 'mat_name', ''),
+            'lambdas':np.array(material.lambdas),
+            'earray':np.array(material.earray)}
+
+def _describe_equiv(composite):
+    out = {'MixingStyle':composite.MixingStyle}
+    for key in _EQUIV:
+        if hasattr(composite.Mix, key):
+            out[key] = getattr(composite.Mix, key)
+    return out
+
+def _describe_mix(composite):
+    out = {'MixingStyle':composite.MixingStyle, 'Vfrac':composite.Vfrac}
+    for key in ('K', 'alpha'):
+        if hasattr(composite.Mix, key):
+            out[key] = getattr(composite.Mix, key)
+    return out
+
+def describe(base_app):
+    """ Description of the current stack, spectral and angle parameters of
+    the program (or anything with specparms, fiberparms and stack)."""
+    fiberparms = base_app.fiberparms
+    angles = {'angles':np.array(fiberparms.angles)}
+    for key in ANGLE_DEFAULTS:
+        if hasattr(fiberparms, key):
+            angles[key] = getattr(fiberparms, key)
+
+    stack = [{'name':layer.name, 'd':layer.d,
+              'material':describe_material(layer.material)}
+             for layer in base_app.stack]
+    return {'spectral':{'lambdas':np.array(base_app.specparms.lambdas)},
+            'angles':angles, 'stack':stack}
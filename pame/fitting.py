@@ -0,0 +1,290 @@
+""" Fit stack parameters (layer d, Vfrac, r_core, shell_width...) to a
+measured spectrum on the headless engine, instead of eyeballing sweeps (the
+SPRFit Mathematica notebooks do this for Mie/Gans models only).
+
+   >>> measured = measured_spectrum('SPRFit/Sample.dat')
+   >>> out = fit(description, measured, {'layer1.d':(5, 50),
+   ...                                   'material1.Vfrac':(0.01, 0.5)},
+   ...           output='A_avg', method='Global + local', processes=4)
+   >>> out.params, out.loss, out.solves
+
+Parameters are engine paths with (low, high) bounds.  The model output (a
+primary key, ie 'R_avg' or 'A_5.00') is interpolated onto the measured
+wavelengths, optionally scaled (and offset) by least squares since measured
+absorbance is rarely in absolute units, and compared with a loss:
+
+   Squared    mean squared residual
+   Absolute   mean absolute residual
+   Huber      squared near 0, absolute beyond huber_delta (outliers)
+   ...or any function loss(models, measured) of a (candidates x wavelengths)
+   array and the measured values, returning one loss per candidate
+
+Optimizers work on batches of candidates, so each batch is one
+engine.run_points call (parallel with processes > 1, materials mixed once
+per group of candidates sharing them; see engine.schedule):
+
+   Global   differential evolution, a population per generation, started
+            from a latin hypercube
+   Local    compass search, every parameter stepped up and down per batch
+            and the step halved when nothing improves
+   Global + local   global, then local from its best
+
+Candidates already evaluated (to resolution, a fraction of each parameter's
+range) are never solved twice, and the storage cache keyword (a stack cache
+directory, see stackcache.py) reuses stacks across fits.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+import engine
+from sweeps import latin_hypercube
+from spec_data import load_spec, spec_dtype
+
+FIT_METHODS = ('Global', 'Local', 'Global + local')
+LOSSES = ('Squared', 'Absolute', 'Huber')
+
+class FitError(Exception):
+    """ """
+
+def measured_spectrum(source):
+    """ (wavelengths, values) sorted by wavelength (nm) from a SpectraSuite
+    or two column text file, a spec_dtype array (ie from RunData
+    file_data_info) or a (wavelengths, values) pair."""
+    if isinstance(source, basestring):
+        with open(source) as f:
+            spectrasuite = f.readline().strip() == 'SpectraSuite Data File'
+        if spectrasuite:
+            source = load_spec(source)
+        else:
+            source = np.loadtxt(source, usecols=(0, 1), unpack=True)
+    if isinstance(source, np.ndarray) and source.dtype == spec_dtype:
+        source = (source['wavelength'], source['intensity'])
+
+    wavelengths, values = (np.asarray(a, dtype=float) for a in source)
+    if wavelengths.shape != values.shape or wavelengths.ndim != 1:
+        raise FitError('Measured spectrum needs one value per wavelength')
+    order = np.argsort(wavelengths)
+    return wavelengths[order], values[order]
+
+def _losses(name, huber_delta):
+    def squared(models, measured):
+        return np.mean((models - measured)**2, axis=1)
+    def absolute(models, measured):
+        return np.mean(np.abs(models - measured), axis=1)
+    def huber(models, measured):
+        r = np.abs(models - measured)
+        return np.mean(np.where(r < huber_delta, 0.5*r**2,
+                                huber_delta*(r - 0.5*huber_delta)), axis=1)
+    losses = dict(zip(LOSSES, (squared, absolute, huber)))
+    if callable(name):
+        return name
+    if name not in losses:
+        raise FitError('Unknown loss "%s"; valid losses are %s' % (name, LOSSES))
+    return losses[name]
+
+def fit_scale(models, measured, offset=False):
+    """ Least squares scale (and offset) of each row of models onto measured.
+    Returns (scaled models, scales, offsets)."""
+    if offset:
+        mm = models.mean(axis=1)[:, None]
+        centered = models - mm
+        var = (centered**2).sum(axis=1)
+        scales = np.where(var > 0, (centered*(measured - measured.mean())).sum(axis=1)
+                          / np.where(var > 0, var, 1.0), 0.0)
+        offsets = measured.mean() - scales*mm[:, 0]
+    else:
+        norm = (models**2).sum(axis=1)
+        scales = np.where(norm > 0, (models*measured).sum(axis=1)
+                          / np.where(norm > 0, norm, 1.0), 0.0)
+        offsets = np.zeros(len(models))
+    return scales[:, None]*models + offsets[:, None], scales, offsets
+
+
+class Objective(object):
+    """ Loss of batches of candidates (rows of parameter values), solving only
+    candidates not seen before.  solves counts engine steps run,
+    evaluations every candidate asked for."""
+
+    def __init__(self, description, measured, params, output='R_avg',
+                 loss='Squared', scale=True, offset=False, huber_delta=0.01,
+                 resolution=1e-6, processes=1, **storage):
+        self.description = description
+        self.paths = list(params)
+        self.bounds = np.array(params.values(), dtype=float)
+        if self.bounds.shape != (len(self.paths), 2) or \
+           np.any(self.bounds[:, 1] <= self.bounds[:, 0]):
+            raise FitError('Each parameter needs bounds (low, high) with low < high')
+        check = engine._copy_tree(description)
+        for path, (low, high) in zip(self.paths, self.bounds):
+            engine.set_value(check, path, low) #EngineError if not a parameter
+
+        lambdas = engine.spectral_grid(description['spectral'])
+        wavelengths, values = measured
+        inside = (wavelengths >= lambdas.min()) & (wavelengths <= lambdas.max())
+        if inside.sum() < 2:
+            raise FitError('Measured spectrum (%s - %s nm) does not overlap '
+                'the simulated one (%s - %s nm)' % (wavelengths[0],
+                wavelengths[-1], lambdas.min(), lambdas.max()))
+        self.lambdas = lambdas
+        self.wavelengths = wavelengths[inside]
+        self.measured = values[inside]
+
+        self.output = output
+        self.loss = _losses(loss, huber_delta)
+        self.scale, self.offset = scale, offset
+        self.resolution = resolution
+        self.processes = processes
+        # Output names map to optics with the engine's own primary key table
+        outputs = engine.output_optics(description, storage.get('choose_optics'),
+                                       storage.get('averaging', 'Both'))
+        if output in outputs:
+            attr, averaging = outputs[output]
+            storage.setdefault('choose_optics', (attr,))
+            storage.setdefault('averaging', averaging)
+        elif output not in storage.get('additional_list', ()):
+            raise FitError('"%s" is not a simulated output; outputs are %s'
+                           % (output, outputs.keys()))
+        self.storage = storage
+        self.models = {} #Rounded candidate : model on measured wavelengths
+        self.solves = 0
+        self.evaluations = 0
+
+    def _key(self, point):
+        span = self.bounds[:, 1] - self.bounds[:, 0]
+        return tuple(np.round((np.asarray(point) - self.bounds[:, 0])
+                              / (span*self.resolution)).astype(int))
+
+    def model_batch(self, points):
+        """ (candidates x measured wavelengths) model outputs """
+        points = np.atleast_2d(points)
+        keys = [self._key(p) for p in points]
+        todo = OrderedDict()
+        for key, point in zip(keys, points):
+            if key not in self.models and key not in todo:
+                todo[key] = tuple(float(v) for v in point)
+        if todo:
+            steps = engine.run_points(self.description, self.paths,
+                todo.values(), self.processes, **self.storage)
+            for key, (primary, results) in zip(todo, steps):
+                if self.output not in primary:
+                    raise FitError('"%s" is not a simulated output; outputs '
+                                   'are %s' % (self.output, primary.keys()))
+                self.models[key] = np.interp(self.wavelengths, self.lambdas,
+                    np.real(np.asarray(primary[self.output], dtype=complex)))
+            self.solves += len(todo)
+        self.evaluations += len(points)
+        return np.array([self.models[key] for key in keys])
+
+    def scaled(self, points):
+        """ (scaled models, scales, offsets) of points """
+        models = self.model_batch(points)
+        if not self.scale:
+            return models, np.ones(len(models)), np.zeros(len(models))
+        return fit_scale(models, self.measured, self.offset)
+
+    def __call__(self, points):
+        """ Loss of each candidate """
+        return np.asarray(self.loss(self.scaled(points)[0], self.measured),
+                          dtype=float)
+
+    def clip(self, points):
+        return np.clip(points, self.bounds[:, 0], self.bounds[:, 1])
+
+
+class FitResult(object):
+    """ Best parameters found.  history is the best loss after each batch."""
+
+    def __init__(self, objective, best, loss, history, method):
+        self.method = method
+        self.params = OrderedDict(zip(objective.paths, best))
+        self.loss = loss
+        self.history = history
+        self.solves = objective.solves
+        self.evaluations = objective.evaluations
+        self.wavelengths = objective.wavelengths
+        self.measured = objective.measured
+        models, scales, offsets = objective.scaled([best])
+        self.model = models[0]
+        self.scale, self.offset = scales[0], offsets[0]
+        self.description = engine._copy_tree(objective.description)
+        for path, value in self.params.items():
+            engine.set_value(self.description, path, value)
+
+    def __repr__(self):
+        return 'FitResult(%s, loss=%s, solves=%s)' % (
+            ', '.join('%s=%.4g' % item for item in self.params.items()),
+            self.loss, self.solves)
+
+
+def differential_evolution(objective, population=None, generations=20,
+                           mutation=0.7, crossover=0.8, tol=1e-8, seed=None):
+    """ (best, loss, history).  Each generation's trial population is one
+    batch; population defaults to 5 per parameter."""
+    rng = np.random.RandomState(seed)
+    n = len(objective.paths)
+    size = population or max(5*n, 6)
+    pop = latin_hypercube(objective.bounds, size, seed)
+    losses = objective(pop)
+    history = [losses.min()]
+    for generation in range(generations):
+        # rand/1/bin: each member tries a + mutation*(b - c) on some params
+        picks = np.array([rng.choice([j for j in range(size) if j != i], 3,
+                                     replace=False) for i in range(size)])
+        a, b, c = pop[picks[:, 0]], pop[picks[:, 1]], pop[picks[:, 2]]
+        cross = rng.rand(size, n) < crossover
+        cross[np.arange(size), rng.randint(n, size=size)] = True
+        trial = objective.clip(np.where(cross, a + mutation*(b - c), pop))
+        trial_losses = objective(trial)
+        better = trial_losses < losses
+        pop[better], losses[better] = trial[better], trial_losses[better]
+        history.append(losses.min())
+        if np.ptp(losses) <= tol*max(abs(losses.min()), 1e-30):
+            break
+    best = losses.argmin()
+    return pop[best], losses[best], history
+
+def compass_search(objective, start, step=0.1, min_step=1e-4, iterations=100):
+    """ (best, loss, history).  Steps are fractions of each parameter's
+    range; all 2*parameters moves from the current best are one batch."""
+    n = len(objective.paths)
+    span = objective.bounds[:, 1] - objective.bounds[:, 0]
+    best = objective.clip(np.asarray(start, dtype=float))
+    loss = objective([best])[0]
+    history = [loss]
+    moves = np.vstack([np.eye(n), -np.eye(n)])
+    for iteration in range(iterations):
+        if step < min_step:
+            break
+        trial = objective.clip(best + step*moves*span)
+        losses = objective(trial)
+        if losses.min() < loss:
+            best, loss = trial[losses.argmin()], losses.min()
+        else:
+            step /= 2.0
+        history.append(loss)
+    return best, loss, history
+
+def fit(description, measured, params, output='R_avg', method='Global + local',
+        loss='Squared', scale=True, offset=False, processes=1, seed=None,
+        generations=20, population=None, step=0.1, min_step=1e-4,
+        resolution=1e-6, huber_delta=0.01, **storage):
+    """ Fit params ({path : (low, high)}) of description to measured
+    ((wavelengths, values), see measured_spectrum).  storage is keywords of
+    evaluate_step (ie cache).  Returns a FitResult."""
+    if method not in FIT_METHODS:
+        raise FitError('Unknown fit method "%s"; valid methods are %s'
+                       % (method, FIT_METHODS))
+    objective = Objective(description, measured, params, output, loss, scale,
+                          offset, huber_delta, resolution, processes, **storage)
+    history = []
+    if method in ('Global', 'Global + local'):
+        best, value, history = differential_evolution(objective, population,
+                                                      generations, seed=seed)
+    else:
+        best = objective.bounds.mean(axis=1)
+    if method in ('Local', 'Global + local'):
+        best, value, local = compass_search(objective, best, step, min_step)
+        history = history + local
+    return FitResult(objective, best, value, history, method)
@@ -4,7 +4,10 @@
 import sys
 import os.path as op
 import time
+import multiprocessing
 import copy
+import logging
+import traceback
 from collections import OrderedDict
 from pame import globalparms
 import textwrap
@@ -17,7 +20,7 @@ from traits.trait_base import xsetattr, xgetattr
 
 #3rd party imports
 from pandas import concat, Panel
-from numpy import array, empty
+from numpy import array, empty, prod
 
 # Local imports
 from handlers import FileOverwriteDialog, BasicDialog
@@ -29,7 +32,13 @@ import config
 import hackedvtree
 import customjson
 import utils
+import engine
+import sweeps
+import simstore
+import simcolumns
+import compressors
 from layer_editor import SHARED_LAYEREDITOR
+from quiet import SHARED_QUIET
 from simparser import LayerSimParser
 
 WRAPWIDTH = 100 # Text characters for wrapping lines
@@ -265,10 +274,28 @@ class ABCSim(HasTraits):
 
     browse_numerics = Button # Browse avaialable numeric traits for sim
 
-    save_as = Enum(config.SIMEXT, '.json')
+    save_as = Enum(config.SIMEXT, '.json', config.COLEXT)
+    json_sidecar = Bool(True) # .json arrays go to a binary file next to it (see customjson)
+    compression = Enum(['None'] + compressors.available()) # Columnar saves only
+    compression_level = Range(low=1, high=9, value=config.COMPRESSLEVEL)
+    save_depth = Enum(config.SAVEDEPTH, simcolumns.SAVEDEPTHS)
 
     implements(ISim)
-    inc=Range(low=1,high=config.MAXSTEPS,value=10) # Need as range for now I think
+    inc=Range(low=1,high=config.MAXSTREAMSTEPS,value=10) # Over config.MAXSTEPS needs stream
+    sweep_mode=Enum(('Lockstep',) + sweeps.available_modes()) # Lockstep steps all traits together
+    samples=Int(64) # Latin hypercube/Sobol points
+    # Adaptive sweeps: start with adaptive_initial steps, refine up to inc
+    adaptive_output=Str('R_avg') # Primary quantity compared between steps
+    adaptive_measure=Enum(sweeps.ADAPTIVE_MEASURES)
+    tolerance=Float(0.01)
+    adaptive_initial=Int(5)
+    processes=Range(low=1, high=multiprocessing.cpu_count(),
+                    value=min(config.SIMPROCESSES, multiprocessing.cpu_count()))
+    stack_cache=Bool(config.STACKCACHE) # Reuse optical stacks solved before (stackcache.py)
+    stack_cache_dir=Directory(config.STACKCACHEDIR)
+    stream=Bool(False) # Write steps to sim_outdir as they complete instead of holding in memory
+    resume=Button # Continue a streamed run that was cut short
+    rerun_failed=Button
 
     notes=Str('<ADD NOTES ON SIMULATION>')
 
@@ -283,6 +310,8 @@ class ABCSim(HasTraits):
     primary = Dict
     results = Dict            
     static = Dict
+    sweep_inputs = Dict # Values of each trait at each step for non-lockstep sweeps
+    labeled = Dict # Primary quantities of sweeps as N-D LabeledArrays
     allstorage = Property(Dict) # Stores all four dicts plus metadata bout self
     _completed = Property(Bool)  # Set to true when results is populated (better criteria?) 
 
@@ -319,6 +348,18 @@ class ABCSim(HasTraits):
     selection_group = Group(
         HGroup(
             Item('inc',label='Steps'), #<-- make me nicer after wx works           
+            Item('sweep_mode', label='Sweep'),
+            Item('samples', visible_when='sweep_mode in ["Latin hypercube", "Sobol"]'),
+            Item('adaptive_output', label='Output', visible_when='sweep_mode == "Adaptive"'),
+            Item('adaptive_measure', label='Measure', visible_when='sweep_mode == "Adaptive"'),
+            Item('tolerance', visible_when='sweep_mode == "Adaptive"'),
+            Item('adaptive_initial', label='Initial steps', visible_when='sweep_mode == "Adaptive"'),
+            Item('processes', label='Processes'),
+            Item('stack_cache', label='Stack cache'),
+            Item('stack_cache_dir', label='Cache folder', visible_when='stack_cache'),
+            Item('stream', label='Stream to disk'),
+            Item('resume', show_label=False, visible_when='stream'),
+            Item('rerun_failed', show_label=False, visible_when='stream'),
             Item('tvals',
                  visible_when='selected_traits is not None', #<-- Should always be selected, but not in qt
                  label='Selected Layer Common Traits'),
@@ -341,6 +382,12 @@ class ABCSim(HasTraits):
         HGroup(
             Item('outname',label='Run Name'),   
             Item('save_as',label='ext'),
+            Item('json_sidecar', label='Arrays in sidecar', 
+                 visible_when="save_as == '.json'"),
+            Item('compression', visible_when="save_as == '%s'" % config.COLEXT),
+            Item('compression_level', label='level',
+                 visible_when="save_as == '%s' and compression != 'None'" % config.COLEXT),
+            Item('save_depth', label='save'),
             Item('sim_outdir', label='directory'),
             ),
         Item('notes',
@@ -376,6 +423,7 @@ class ABCSim(HasTraits):
         return OrderedDict([(k,v) for k,v in 
                             ('Simulation Name',self.outname), 
                             ('Steps',self.inc), 
+                            ('Sweep',self.sweep_mode),
                             ('Time/Date',self.time), 
                             ('Notes',self.notes),
                             #Storage objects stored in SimConfigure 
@@ -407,11 +455,21 @@ class ABCSim(HasTraits):
     def _sim_variables_default(self): 
         return []
     
-    @on_trait_change('selected_traits.selected_sim, \
-                      base_app.layereditor.selected_layer')
+    @on_trait_change('selected_traits.selected_sim, inc, stream, \
+                      sweep_mode, samples, base_app.layereditor.selected_layer')
     def _checksim(self):
         self.check_sim_ready()
 
+    def _count_steps(self):
+        """ Steps the run will take in the current sweep mode: inc of
+        every variable multiplied for a grid, samples for sampled sweeps,
+        inc (the budget of adaptive sweeps) otherwise """
+        if self.sweep_mode == 'Grid':
+            return int(prod([len(obj.trait_array) for obj in self.sim_variables]))
+        elif self.sweep_mode in ('Latin hypercube', 'Sobol'):
+            return self.samples
+        return self.inc
+
     def check_sim_ready(self):
         """Method to update various storage mechanisms for holding trait values for simulations.  
         Takes user data in table editor and stores it in necessary dictionaries so that 
@@ -460,6 +518,12 @@ class ABCSim(HasTraits):
             ready = False                        
 
 
+        steps = self._count_steps()
+        if steps > config.MAXSTEPS and not self.stream:
+            status_message='<font color="red"> %s steps, over %s: </font> select "Stream to disk"' \
+                % (steps, config.MAXSTEPS)
+            ready = False
+
         if ready:
             status_message='<font color="green"> Simulation ready: all input found</font>'
             ready = True
@@ -499,7 +563,7 @@ class ABCSim(HasTraits):
         allout['about'] = self.simulation_requested() #<-- bug: simulation_requested9
         allout['primary'] = self.primary
         allout['results'] = self.results      
-        allout['inputs'] = self.simulation_traits
+        allout['inputs'] = self.sweep_inputs or self.simulation_traits
         return allout        
 
 
@@ -537,6 +601,11 @@ class LayerSimulation(ABCSim):
     def _outname_default(self): 
         return config.SIMPREFIX
 
+    def _compression_default(self):
+        if config.COMPRESSION in compressors.available():
+            return config.COMPRESSION
+        return 'None'
+
     def _selected_material_changed(self):
         self.check_sim_ready()
 
@@ -586,6 +655,33 @@ class LayerSimulation(ABCSim):
 
         print 'running sim with traits', self.simulation_traits.keys()
 
+        self.sweep_inputs = {}
+        self.labeled = {}
+        store = self._stream_path() if self.stream else None
+        if store and op.exists(store):
+            self.status_message = '<font color="red"> Stream directory exists: </font>%s' % store
+            return
+
+        # The engine runs parallel steps, sweeps and stack cached steps
+        if self.processes > 1 or self.sweep_mode != 'Lockstep' or self.stack_cache:
+            try:
+                allout = self.runsim_engine(store)
+            except (engine.EngineError, sweeps.SweepError) as exc:
+                # Only lockstep can run in the program
+                if self.sweep_mode != 'Lockstep':
+                    self.status_message = '<font color="red"> Cannot run sweep: </font>%s' % exc
+                    return
+                logging.warning('Cannot run simulation on the engine (%s); running in program' % exc)
+            else:
+                self.primary = allout['primary']
+                self.results = allout['results']
+                self.static = allout['static']
+                if self.sweep_mode != 'Lockstep':
+                    self.sweep_inputs = allout['inputs']
+                    self.labeled = allout['labeled']
+                self._finished(store, allout.get('failed', ()))
+                return
+
         # for name brevity
         sconfig = self.configure_storage 
         b_app = self.base_app
@@ -602,103 +698,259 @@ class LayerSimulation(ABCSim):
         staticdict[globalparms.spectralparameters] = b_app.specparms.simulation_requested()         
         staticdict[globalparms.strataname] = b_app.fiberparms.simulation_requested()
 
-        # Begin iterations
+        # Streamed steps go straight to disk; only the current step is kept
+        writer = None
+        if store:
+            writer = simstore.StepWriter(store, staticdict, self.simulation_requested())
+            # Steps finish headless on resume, if the program can be described
+            try:
+                storage, rename = self._engine_storage()
+                engine.write_plan(writer, engine.describe(b_app),
+                    self._swept_paths(), zip(*self.simulation_traits.values()),
+                    self.processes, rename, storage)
+            except engine.EngineError as exc:
+                logging.warning('Streamed simulation cannot be resumed: %s' % exc)
+
+        # Begin iterations.  Plots refresh once at the end; within a step,
+        # materials/Mie recompute once after all traits are set
         sorted_keys = []
-        for i in range(self.inc):
-            for trait in self.simulation_traits.keys():
-                _true_trait = self._trait_namemap[trait]#<--- Trait stored in memory (ie b_app.layereditor.layer1...)
-                xsetattr(b_app, _true_trait, self.simulation_traits[trait][i]) #Object, traitname, traitvalue
-
-            stepname = 'step_%s' % i
-
-            primary_increment = OrderedDict()  #<--- Toplevel/Summary of just this increment (becomes dataframe)
-            results_increment = OrderedDict()  #<--- Deep results of just thsi increment (ie selected_material/layer etc..)
-
-            key = '%s_%s' % (str(i), self.key_title)
-            sorted_keys.append(key)
-
-            # Update Optical Stack
-            b_app.opticstate.update_optical_stack() 
-
-            # Flatten sim attributes.  For example, if attrs selected for Sim are R, A, kz
-            # kz actually has value in each layer so R, A, kz_1, kz_2, kz_3 is what needs
-            # to be iterated over.
-            flat_attributes = []
-
-            # How many layers in optical stack
-            layer_indicies = range(len(b_app.opticstate.ns)) #0,1,2,3,4 for 5 layers etc...            
-
-            for attr in sconfig.choose_optics:
-                if attr in b_app.opticstate.optical_stack.minor_axis:
-                    flat_attributes.append(attr)
-                else:
-                    # http://stackoverflow.com/questions/28031354/match-the-pattern-at-the-end-of-a-string
-                    delim = '_%s' % globalparms._flat_suffix
-
-                    # ['kz', 'vn', 'ang_prop']
-                    setkeys = set(name.split(delim)[0] for name in 
-                                  b_app.opticstate.optical_stack.minor_axis if delim in name)    
-                    if attr in setkeys:
-                        for idx in layer_indicies:
-                            flat_attributes.append(attr + delim + str(idx)) #kz_L1 etc...)                   
-                    else:
-                        raise SimError('Cannot simulate over optical stack attr "%s" '
-                                       ' not found in optical stack.' % attr)
-
-            # --- PRIMARY RESULTS           
-            # Take parameters from optical stack, put in toplevel via sconfig.choose_optics
-            if sconfig.averaging in ['Average','Both']:
-                for optical_attr in flat_attributes:
-                    primary_increment['%s_%s' % (optical_attr, 'avg')] = \
-                        b_app.opticstate.compute_average(optical_attr) #<-- IS NUMPY ARRAY, object type
-
-            if sconfig.averaging in ['Not Averaged', 'Both']:
-                for optical_attr in flat_attributes:
-                    # ITERATE OVER ANGLES! SAVE EACH ANGLE
-                    for angle in b_app.opticstate.angles:
-                        primary_increment['%s_%.2f' % (optical_attr, angle)] = \
-                            b_app.opticstate.optical_stack[angle][optical_attr]  #<-- Save as what, numpy/pandas?        
-
-            # User-set dielectric slab quantites to be in primary
-            for trait in sconfig.additional_list:
-                traitval = xgetattr(b_app.layereditor, trait)
-                primary_increment['%s' % trait]  = traitval
-
-            # --- DEEP RESULTS
-            # Store full Optical Stack
-            if sconfig.store_optical_stack:
-                results_increment[globalparms.optresponse] = b_app.opticstate.optical_stack
-
-            # Save layer/material traits.  If None selected, it just skips
-            if sconfig.choose_layers == 'Selected Layer':
-                key = 'Layer%s' % (b_app.layereditor.selected_index) #<-- index of selected layer
-                results_increment[key] = self.selected_layer.simulation_requested()
-
-            elif sconfig.choose_layers == 'All Layers':
-                materials_only = False
-                if sconfig.mater_only == 'Material Data':
-                    materials_only = True
+        i = 0
+        stopped = None
+        try:
+            with SHARED_QUIET.hold('view', 'redraw'):
+                for i in range(self.inc):
+                    with b_app.quiet():
+                        for trait in self.simulation_traits.keys():
+                            _true_trait = self._trait_namemap[trait]#<--- Trait stored in memory (ie b_app.layereditor.layer1...)
+                            xsetattr(b_app, _true_trait, self.simulation_traits[trait][i]) #Object, traitname, traitvalue
+
+                    stepname = 'step_%s' % i
+
+                    primary_increment = OrderedDict()  #<--- Toplevel/Summary of just this increment (becomes dataframe)
+                    results_increment = OrderedDict()  #<--- Deep results of just thsi increment (ie selected_material/layer etc..)
+
+                    key = '%s_%s' % (str(i), self.key_title)
+                    sorted_keys.append(key)
+
+                    # Update Optical Stack
+                    b_app.opticstate.update_optical_stack() 
+
+                    # Flatten sim attributes.  For example, if attrs selected for Sim are R, A, kz
+                    # kz actually has value in each layer so R, A, kz_1, kz_2, kz_3 is what needs
+                    # to be iterated over.
+                    flat_attributes = []
+
+                    # How many layers in optical stack
+                    layer_indicies = range(len(b_app.opticstate.ns)) #0,1,2,3,4 for 5 layers etc...            
+
+                    for attr in sconfig.choose_optics:
+                        if attr in b_app.opticstate.optical_stack.minor_axis:
+                            flat_attributes.append(attr)
+                        else:
+                            # http://stackoverflow.com/questions/28031354/match-the-pattern-at-the-end-of-a-string
+                            delim = '_%s' % globalparms._flat_suffix
+
+                            # ['kz', 'vn', 'ang_prop']
+                            setkeys = set(name.split(delim)[0] for name in 
+                                          b_app.opticstate.optical_stack.minor_axis if delim in name)    
+                            if attr in setkeys:
+                                for idx in layer_indicies:
+                                    flat_attributes.append(attr + delim + str(idx)) #kz_L1 etc...)                   
+                            else:
+                                raise SimError('Cannot simulate over optical stack attr "%s" '
+                                               ' not found in optical stack.' % attr)
+
+                    # --- PRIMARY RESULTS           
+                    # Take parameters from optical stack, put in toplevel via sconfig.choose_optics
+                    if sconfig.averaging in ['Average','Both']:
+                        for optical_attr in flat_attributes:
+                            primary_increment['%s_%s' % (optical_attr, 'avg')] = \
+                                b_app.opticstate.compute_average(optical_attr) #<-- IS NUMPY ARRAY, object type
+
+                    if sconfig.averaging in ['Not Averaged', 'Both']:
+                        for optical_attr in flat_attributes:
+                            # ITERATE OVER ANGLES! SAVE EACH ANGLE
+                            for angle in b_app.opticstate.angles:
+                                primary_increment['%s_%.2f' % (optical_attr, angle)] = \
+                                    b_app.opticstate.optical_stack[angle][optical_attr]  #<-- Save as what, numpy/pandas?        
+
+                    # User-set dielectric slab quantites to be in primary
+                    for trait in sconfig.additional_list:
+                        traitval = xgetattr(b_app.layereditor, trait)
+                        primary_increment['%s' % trait]  = traitval
+
+                    # --- DEEP RESULTS
+                    # Store full Optical Stack
+                    if sconfig.store_optical_stack:
+                        results_increment[globalparms.optresponse] = b_app.opticstate.optical_stack
+
+                    # Save layer/material traits.  If None selected, it just skips
+                    if sconfig.choose_layers == 'Selected Layer':
+                        key = 'Layer%s' % (b_app.layereditor.selected_index) #<-- index of selected layer
+                        results_increment[key] = self.selected_layer.simulation_requested()
+
+                    elif sconfig.choose_layers == 'All Layers':
+                        materials_only = False
+                        if sconfig.mater_only == 'Material Data':
+                            materials_only = True
                     
-                results_increment['dielectric_layers'] = b_app.layereditor.simulation_requested(materials_only)
+                        results_increment['dielectric_layers'] = b_app.layereditor.simulation_requested(materials_only)
 
 
-            # resultsdict >>  {step1 : {results_of_increment}, ...}
-            resultsdict[stepname] = results_increment               
-            primarydict[stepname] = primary_increment
-
-            print "Iteration\t", i+1, "\t of \t", self.inc, "\t completed"
+                    # resultsdict >>  {step1 : {results_of_increment}, ...}
+                    if writer:
+                        writer.append(i, primary_increment, results_increment,
+                            OrderedDict((trait, values[i]) for trait, values 
+                                        in self.simulation_traits.items()))
+                    else:
+                        resultsdict[stepname] = results_increment               
+                        primarydict[stepname] = primary_increment
+
+                    print "Iteration\t", i+1, "\t of \t", self.inc, "\t completed"
+        except Exception as exc:
+            if not writer:
+                raise
+            # Keep the store consistent so the run can be resumed from step i
+            writer.fail(i, traceback.format_exc())
+            stopped = exc
+            logging.error('Streamed simulation stopped at step %s: %s' % (i, exc))
+        finally:
+            if writer:
+                writer.close()
 
         # SET STORAGE TRAITS
         self.primary = primarydict
         self.results = resultsdict
         self.static = staticdict        
+        if stopped is not None:
+            self.status_message = '<font color="red"> Stopped at step %s: </font>' \
+                '%s (%s; use Resume)' % (i, stopped, store)
+            return
+        self._finished(store)
+
+    def _stream_path(self):
+        return op.join(self.sim_outdir, self.outname + config.STREAMEXT)
+
+    def _finished(self, store=None, failed=()):
+        """ Streamed runs are already saved; otherwise ask to save """
+        if failed:
+            self.status_message = '<font color="red"> %s steps failed: </font>' \
+                '%s (see .failed files; use Rerun failed)' % (len(failed), store)
+        elif store:
+            self.status_message = '<font color="green"> Simulation streamed to </font>%s' % store
+            message('Simulation steps saved to %s (open with '
+                    'LayerSimParser.load_store)' % store, title='Success')
+        else:
+            self._prompt_save()
 
-        # Prompt user to save?
+    def _prompt_save(self):
         popup = BasicDialog(message='Simulation complete.  Would you like to save now?')
         ui = popup.edit_traits(kind='modal')
         if ui.result == True:
             self.save(confirmwindow=True)
 
+    def _engine_path(self, trait_name):
+        """ Path of a trait (relative to base_app) in engine descriptions, ie
+        'selected_material.Vfrac' --> 'layer1.material.Vfrac' """
+        names = trait_name.split('.')
+        selected = self.base_app.layereditor.selected_index
+        if names[0] == 'layereditor':
+            if names[1] in ('selected_layer', 'selected_material'):
+                return self._engine_path('.'.join(names[1:]))
+            return '.'.join(names[1:])
+        elif names[0] == 'selected_layer':
+            return '.'.join(['layer%s' % selected] + names[1:])
+        elif names[0] == 'selected_material':
+            return '.'.join(['layer%s' % selected, 'material'] + names[1:])
+        raise engine.EngineError('No engine path for "%s"' % trait_name)
+
+    def _engine_storage(self):
+        """ evaluate_step keywords from configure_storage, and {engine path :
+        name} of simulation traits then additional_list, to give engine
+        output the keys runsim uses."""
+        sconfig = self.configure_storage 
+        rename = OrderedDict((self._engine_path(self._trait_namemap[trait]), trait)
+                             for trait in self.simulation_traits)
+
+        # additional_list is relative to layereditor
+        additional = [self._engine_path('layereditor.%s' % trait) 
+                      for trait in sconfig.additional_list]
+        for path, trait in zip(additional, sconfig.additional_list):
+            rename.setdefault(path, trait) #Swept paths keep their trait name
+
+        storage = dict(choose_optics=sconfig.choose_optics,
+            averaging=sconfig.averaging,
+            store_optical_stack=sconfig.store_optical_stack,
+            additional_list=additional,
+            choose_layers=sconfig.choose_layers,
+            mater_only=sconfig.mater_only,
+            selected_index=self.base_app.layereditor.selected_index)
+        if self.stack_cache:
+            storage.update(cache=self.stack_cache_dir,
+                           cache_bytes=config.STACKCACHE_MB * 2**20)
+        return storage, rename
+
+    def _swept_paths(self):
+        """ Engine paths of simulation_traits, in their order.  Raises
+        EngineError if two traits are the same engine parameter."""
+        paths = [self._engine_path(self._trait_namemap[trait])
+                 for trait in self.simulation_traits]
+        if len(set(paths)) < len(paths):
+            raise engine.EngineError('Simulation variables %s are the same '
+                'engine parameters %s' % (list(self.simulation_traits), paths))
+        return paths
+
+    def runsim_engine(self, store=None):
+        """ Same simulation as runsim, but steps run in self.processes worker
+        processes on a description of the program (see engine.py), or a
+        Grid/sampled sweep (see sweeps.py).  Raises EngineError if any input or
+        stored quantity has no engine equivalent.  Steps are streamed to the
+        directory store if given."""
+        storage, rename = self._engine_storage()
+        paths = self._swept_paths()
+        variables = OrderedDict(zip(paths, self.simulation_traits.values()))
+        if self.sweep_mode in ('Latin hypercube', 'Sobol', 'Adaptive'):
+            bounds = dict((s.trait_name, (s.start, s.end)) for s in self.sim_variables)
+            variables = OrderedDict((path, bounds[trait]) for path, trait in 
+                                    zip(paths, self.simulation_traits))
+
+        if self.sweep_mode == 'Lockstep':
+            return engine.run_simulation(engine.describe(self.base_app), 
+                variables, self.processes, store, rename, **storage)
+        elif self.sweep_mode == 'Adaptive':
+            if store:
+                raise sweeps.SweepError('Adaptive sweeps are held in memory; '
+                                        'turn off "Stream to disk"')
+            return sweeps.adaptive_sweep(engine.describe(self.base_app), 
+                variables, [self.adaptive_output], self.adaptive_measure, 
+                self.tolerance, self.inc, self.adaptive_initial, 
+                processes=self.processes, rename=rename, **storage)
+        return sweeps.run_sweep(engine.describe(self.base_app), variables, 
+            self.sweep_mode, self.samples, None, self.processes, store, 
+            rename, **storage)
+
+    def _resume(self, failed_only=False):
+        """ Finish the streamed run in the stream directory: skips finished
+        steps, or reruns only failed steps. """
+        store = self._stream_path()
+        try:
+            if 'sweep' in (simstore.StepReader(store).plan or {}):
+                allout = sweeps.resume_sweep(store, self.processes, failed_only)
+            else:
+                allout = engine.resume_simulation(store, self.processes, failed_only)
+        except (engine.EngineError, sweeps.SweepError, simstore.StoreError) as exc:
+            self.status_message = '<font color="red"> Cannot resume: </font>%s' % exc
+            return
+        self.static = allout['static']
+        self.labeled = allout.get('labeled', {})
+        self._finished(store, allout['failed'])
+
+    def _resume_fired(self):
+        self._resume()
+
+    def _rerun_failed_fired(self):
+        self._resume(failed_only=True)
+
 
     def save(self, outpath=None, confirmwindow=True):
         """ Output simulation into json dictionary, where four primary
@@ -730,15 +982,23 @@ class LayerSimulation(ABCSim):
                     title='Warning')
             return 
 
+        storage = simcolumns.trim_storage(self.allstorage, self.save_depth)
+
         # Save json data
         if self.save_as == '.json':
-            customjson.dump(self.allstorage, outpath)
+            customjson.dump(storage, outpath, sidecar=self.json_sidecar)
 
         # Save .mpickle by opening simparser instance
         elif self.save_as == config.SIMEXT:
-            obj = LayerSimParser(**self.allstorage)
+            obj = LayerSimParser(**storage)
             obj.save(outpath)
 
+        # Columnar directory, chunks compressed (see simcolumns)
+        elif self.save_as == config.COLEXT:
+            codec = None if self.compression == 'None' else self.compression
+            simcolumns.write_columns(outpath, storage, overwrite=True,
+                                     codec=codec, level=self.compression_level)
+
         else:
             raise SimError("Don't know how to save simulation of type %s!" % self.save_as)
 
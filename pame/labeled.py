@@ -0,0 +1,259 @@
+""" Light N-D labeled array: numpy values with a name and coordinate array for
+each dimension, and selection by coordinate value.  Used for sweep results,
+eg R_avg over (layer1.d, material1.Vfrac, lambdas):
+
+   >>> R = out['labeled']['R_avg']
+   >>> R.sel({'layer1.d':15.0}).values          #(Vfrac x lambdas) view
+   >>> R.sel({'material1.Vfrac':0.12}, method='nearest')
+
+Selections return views of the underlying array, not copies.  Other
+coordinates can label an existing dimension (aux), ie the input values of
+each simulation step, and select along it by value:
+
+   >>> A = LabeledArray(values, ('variable', 'lambdas', 'step'), coords,
+   ...                  aux={'selected_material.Vfrac':('step', vfracs)})
+   >>> A.sel(variable='R_avg', Vfrac=0.3)      #Last part of a dotted name
+   >>> A.sel(variable='R_avg').max('lambdas')
+
+concat() stacks arrays of the same coordinates along a new dimension (runs).
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+class LabeledError(Exception):
+    """ """
+
+def _positions(where):
+    """ Slice (a view) of sorted positions if they're contiguous """
+    if not len(where):
+        return slice(0, 0)
+    if where[-1] - where[0] + 1 == len(where):
+        return slice(where[0], where[-1]+1)
+    return list(where)
+
+class LabeledArray(object):
+    """ values with dims (names), coords {dim : 1d array} and aux
+    {name : (dim, 1d array)} """
+
+    def __init__(self, values, dims, coords=None, name='', aux=None):
+        self.values = np.asarray(values)
+        self.dims = tuple(dims)
+        if len(self.dims) != self.values.ndim:
+            raise LabeledError('%s dims given for %s dimensional values'
+                               % (len(self.dims), self.values.ndim))
+        coords = coords or {}
+        self.coords = OrderedDict()
+        for dim, size in zip(self.dims, self.values.shape):
+            coord = np.arange(size) if coords.get(dim) is None \
+                else np.asarray(coords[dim])
+            if coord.shape != (size,):
+                raise LabeledError('Coordinate "%s" has shape %s, dimension is %s'
+                                   % (dim, coord.shape, size))
+            self.coords[dim] = coord
+        self.aux = OrderedDict()
+        for key, (dim, coord) in (aux or {}).items():
+            coord = np.asarray(coord)
+            if coord.shape != (self.values.shape[self._axis(dim)],):
+                raise LabeledError('Coordinate "%s" has shape %s, dimension "%s" is %s'
+                    % (key, coord.shape, dim, self.values.shape[self._axis(dim)]))
+            self.aux[key] = (dim, coord)
+        self.name = name
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def ndim(self):
+        return self.values.ndim
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        dims = ', '.join('%s: %s' % (d, n) for d, n in zip(self.dims, self.shape))
+        aux = ''.join(', %s on %s' % (key, dim) for key, (dim, c) in self.aux.items())
+        return '<LabeledArray %s (%s%s)>' % (self.name, dims, aux)
+
+    def _axis(self, dim):
+        try:
+            return self.dims.index(dim)
+        except ValueError:
+            raise LabeledError('No dimension "%s"; dims are %s' % (dim, self.dims))
+
+    def coord(self, name):
+        """ (dim, values) of a dimension or aux coordinate.  Aux names can be
+        given by their last dotted part (Vfrac for selected_material.Vfrac)
+        if that's unambiguous."""
+        if name in self.coords:
+            return name, self.coords[name]
+        if name in self.aux:
+            return self.aux[name]
+        matches = [key for key in self.aux if key.split('.')[-1] == name]
+        if len(matches) == 1:
+            return self.aux[matches[0]]
+        if matches:
+            raise LabeledError('"%s" could be any of %s' % (name, matches))
+        raise LabeledError('No coordinate "%s"; dims are %s, others %s'
+                           % (name, self.dims, self.aux.keys()))
+
+    def isel(self, indexers=None, **kwds):
+        """ Select by integer position (int drops the dimension, slice or
+        list keeps it) """
+        indexers = dict(indexers or {}, **kwds)
+        index = [slice(None)] * self.ndim
+        for dim, idx in indexers.items():
+            index[self._axis(dim)] = idx
+
+        dims, coords, aux = [], {}, OrderedDict()
+        for dim, idx in zip(self.dims, index):
+            if isinstance(idx, (int, np.integer)):
+                continue
+            dims.append(dim)
+            coords[dim] = self.coords[dim][idx]
+            for key, (auxdim, coord) in self.aux.items():
+                if auxdim == dim:
+                    aux[key] = (dim, coord[idx])
+
+        # Lists copy, one axis at a time: numpy would broadcast several lists
+        # together, or move their axis first next to an int
+        values = self.values[tuple(slice(None) if isinstance(idx, list) else idx
+                                   for idx in index)]
+        axis = 0
+        for idx in index:
+            if isinstance(idx, (int, np.integer)):
+                continue
+            if isinstance(idx, list):
+                values = values.take(idx, axis=axis)
+            axis += 1
+        return LabeledArray(values, dims, coords, self.name, aux)
+
+    def index(self, dim, value, method=None):
+        """ Position of value in coordinate dim (or aux coordinate).
+        method='nearest' allows inexact values."""
+        coord = self.coord(dim)[1]
+        if coord.dtype.kind not in 'biufc':
+            match = np.flatnonzero(coord == value)
+        elif method == 'nearest':
+            return int(np.argmin(abs(coord - value)))
+        else:
+            match = np.flatnonzero(np.isclose(coord, value))
+        if not len(match):
+            raise LabeledError('%s not in "%s" coordinate (use method="nearest"?)'
+                               % (value, dim))
+        return int(match[0])
+
+    def sel(self, indexers=None, method=None, **kwds):
+        """ Select by coordinate value; lists/arrays of values keep the
+        dimension, slices are by value (inclusive).  Aux coordinates needn't
+        be sorted or unique (Vfrac of a 2d sweep): a value held by several
+        positions keeps them all, and the dimension."""
+        indexers = dict(indexers or {}, **kwds)
+        positions = {}
+        for name, value in indexers.items():
+            dim, coord = self.coord(name)
+            if dim in positions:
+                raise LabeledError('Dimension "%s" selected twice' % dim)
+            if isinstance(value, slice):
+                mask = np.ones(len(coord), dtype=bool)
+                if value.start is not None:
+                    mask &= coord >= value.start
+                if value.stop is not None:
+                    mask &= coord <= value.stop
+                positions[dim] = _positions(np.flatnonzero(mask))
+            elif name not in self.coords and not np.ndim(value):
+                value = coord[self.index(name, value, method)]
+                if coord.dtype.kind in 'biufc':
+                    where = np.flatnonzero(np.isclose(coord, value))
+                else:
+                    where = np.flatnonzero(coord == value)
+                positions[dim] = int(where[0]) if len(where) == 1 \
+                    else _positions(where)
+            elif np.ndim(value):
+                positions[dim] = [self.index(name, v, method) for v in value]
+            else:
+                positions[dim] = self.index(name, value, method)
+        return self.isel(positions)
+
+    def transpose(self, *dims):
+        axes = [self._axis(dim) for dim in dims]
+        return LabeledArray(self.values.transpose(axes), dims, self.coords,
+                            self.name, self.aux)
+
+    def reduce(self, func, dim):
+        """ func (ie np.mean) over dim, which is dropped """
+        axis = self._axis(dim)
+        dims = [d for d in self.dims if d != dim]
+        aux = OrderedDict((k, v) for k, v in self.aux.items() if v[0] != dim)
+        return LabeledArray(func(self.values, axis=axis), dims, self.coords,
+                            self.name, aux)
+
+    def mean(self, dim):
+        return self.reduce(np.mean, dim)
+
+    def sum(self, dim):
+        return self.reduce(np.sum, dim)
+
+    def min(self, dim):
+        return self.reduce(np.min, dim)
+
+    def max(self, dim):
+        return self.reduce(np.max, dim)
+
+
+def _same(a, b):
+    if a.dtype.kind in 'fc' and b.dtype.kind in 'fc':
+        return a.shape == b.shape and np.allclose(a, b, equal_nan=True)
+    return np.array_equal(a, b)
+
+def concat(arrays, dim, coord=None, name='', pad=None):
+    """ Stack arrays (same dims and coordinates) along a new first dimension
+    dim, ie runs of a simulation catalog.  The output is allocated once;
+    aux coordinates are kept if every array has the same ones.  Dimension
+    pad may be shorter in some arrays (ie fewer steps); they're padded with
+    NaN, and their coordinate (and aux coordinates on pad, to be kept) must
+    start the longest one."""
+    arrays = list(arrays)
+    if not arrays:
+        raise LabeledError('Nothing to concatenate')
+    longest = first = arrays[0]
+    if pad is not None:
+        axis = first._axis(pad)
+        longest = max(arrays, key=lambda a: a.shape[axis])
+    for i, other in enumerate(arrays):
+        if other.dims != first.dims:
+            raise LabeledError('Array %s has dims %s, not %s' % (i, other.dims, first.dims))
+        for d in first.dims:
+            if d == pad:
+                size = len(other.coords[d])
+                if not _same(longest.coords[d][:size], other.coords[d]):
+                    raise LabeledError('Array %s "%s" coordinate is not the start of '
+                                       'the longest one' % (i, d))
+            elif not _same(first.coords[d], other.coords[d]):
+                raise LabeledError('Array %s has a different "%s" coordinate' % (i, d))
+
+    dtype = np.result_type(*[a.values for a in arrays])
+    if any(a.shape != longest.shape for a in arrays):
+        dtype = np.result_type(dtype, np.float32) #For NaN
+    out = np.empty((len(arrays),) + longest.shape, dtype=dtype)
+    for i, array in enumerate(arrays):
+        if array.shape == longest.shape:
+            out[i] = array.values
+        else:
+            index = [slice(None)]*array.ndim
+            index[axis] = slice(0, array.shape[axis])
+            out[i][tuple(index)] = array.values
+            index[axis] = slice(array.shape[axis], None)
+            out[i][tuple(index)] = np.nan
+    def same_aux(a, key, value):
+        """ Padded aux coordinates, as pad's, start the longest one """
+        if key not in a.aux or a.aux[key][0] != value[0]:
+            return False
+        coord = a.aux[key][1]
+        return _same(value[1][:len(coord)] if value[0] == pad else value[1], coord)
+    aux = OrderedDict((key, value) for key, value in longest.aux.items()
+                      if all(same_aux(a, key, value) for a in arrays))
+    coords = dict(longest.coords)
+    coords[dim] = coord
+    return LabeledArray(out, (dim,) + longest.dims, coords, name or first.name, aux)
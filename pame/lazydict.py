@@ -0,0 +1,137 @@
+""" Results dictionaries read on access.  results of a simulation file hold
+every step's optical stack and layer/material dumps, but most analysis only
+uses primary, or one leaf of results per step (promote).  LazyResults has
+the same keys as the stored results, but each leaf is read from the file
+the first time it's asked for:
+
+   >>> results = LazyResults(simcolumns.ColumnReader('Layersim.simcol'))
+   >>> results['step_3.dielectric_layers.layer2.material.earray'] #Reads one leaf
+
+Readers provide layout(step), the flattened keys of a step ('results/a/b',
+nested dictionaries included, see simstore._flatten), and value(key, step),
+one leaf (None for an empty dictionary).  simcolumns.ColumnReader and
+simstore.StepReader both do.  Pickling or deep copying reads everything and
+gives a plain AttrDict.
+"""
+
+import pame.utils as putil
+
+_SEP = '/'
+
+class _Unread(object):
+    """ Placeholder of a leaf not read yet """
+
+_UNREAD = _Unread()
+
+class LazyNode(putil.AttrDict):
+    """ Dictionary below prefix of one step; children are listed from the
+    layout on first use, leaves read when accessed """
+
+    def __init__(self, reader, step, prefix, keys=None):
+        # AttrDict sets attributes as items, so go through object
+        object.__setattr__(self, '_reader', reader)
+        object.__setattr__(self, '_step', step)
+        object.__setattr__(self, '_prefix', prefix)
+        object.__setattr__(self, '_keys', keys)
+        object.__setattr__(self, '_expanded', False)
+
+    def _expand(self):
+        if self._expanded:
+            return
+        object.__setattr__(self, '_expanded', True)
+        keys = self._keys
+        if keys is None:
+            keys = [key[len(self._prefix):] for key in self._reader.layout(self._step)
+                    if key.startswith(self._prefix)]
+        children = []
+        below = {}
+        for key in keys:
+            child, _, rest = key.partition(_SEP)
+            if child not in below:
+                children.append(child)
+                below[child] = []
+            if rest:
+                below[child].append(rest)
+        for child in children:
+            if below[child]:
+                value = LazyNode(self._reader, self._step,
+                                 self._prefix + child + _SEP, below[child])
+            else:
+                value = _UNREAD
+            dict.__setitem__(self, child, value)
+
+    def __getitem__(self, key):
+        self._expand()
+        if '.' in key:
+            key, rest = key.split('.', 1)
+            target = self[key]
+            if not isinstance(target, putil.AttrDict):
+                raise KeyError('cannot get "%s" in "%s" (%s)' % (rest, key, repr(target)))
+            return target[rest]
+        value = dict.__getitem__(self, key)
+        if value is _UNREAD:
+            value = self._reader.value(self._prefix + key, self._step)
+            if value is None:
+                value = putil.AttrDict() #Empty dictionary
+            elif isinstance(value, dict) and not isinstance(value, putil.AttrDict):
+                value = putil.AttrDict(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        self._expand()
+        putil.AttrDict.__setitem__(self, key, value)
+
+    __setattr__ = __setitem__
+
+    def __contains__(self, key):
+        self._expand()
+        return putil.AttrDict.__contains__(self, key)
+
+    def __iter__(self):
+        self._expand()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._expand()
+        return dict.__len__(self)
+
+    def keys(self):
+        self._expand()
+        return dict.keys(self)
+
+    iterkeys = __iter__
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def itervalues(self):
+        return (self[key] for key in self.keys())
+
+    def iteritems(self):
+        return ((key, self[key]) for key in self.keys())
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    has_key = __contains__
+
+    def load(self):
+        """ Everything below this node as plain AttrDicts """
+        return putil.AttrDict(dict((key, value.load() if isinstance(value, LazyNode)
+                                    else value) for key, value in self.items()))
+
+    def __reduce__(self):
+        return (putil.AttrDict, (self.load(),))
+
+    def __repr__(self):
+        return 'LazyNode(%s: %s)' % (self._step, self._prefix.rstrip(_SEP))
+
+
+def LazyResults(reader, section='results'):
+    """ {step : LazyNode} of section of every step of reader """
+    return putil.AttrDict(dict((step, LazyNode(reader, step, section + _SEP))
+                               for step in reader.steps))
@@ -7,6 +7,7 @@ import scipy.interpolate as scinterp
 import os
 import logging
 from pame.utils import complex_n_to_e
+from pame.material_registry import file_fingerprint
 
 class MaterialFileError(Exception):
     """ """
@@ -31,6 +32,10 @@ class ABCExternal(BasicMaterial):
     file_n = CArray() #Complex array nr, ni  
     file_e = Property(CArray, depends_on='file_n')
     xps_in_nm = Array() #<-- x values in file in nanometers
+
+    # Interpolant reused across lambdas changes (see _get_interpolant)
+    _interpolant = Any()
+    _interp_key = Any()
     
     def _get_file_e(self):
         return complex_n_to_e(self.file_n)
@@ -46,7 +51,7 @@ class ABCExternal(BasicMaterial):
     
     def _lambdas_changed(self):
        #update data only re-reads file, so don't need udpate_data()
-        self.update_interp()        
+        self.update_shared(self.update_interp)
     
     def _interpolation_changed(self):
         self.update_interp()
@@ -54,34 +59,39 @@ class ABCExternal(BasicMaterial):
     def _extrapolation_changed(self):
         self.update_interp()
 
+    def _get_interpolant(self):
+        """ interp1d of file data (in nm), built once per (file data, kind) and
+        reused for every new lambdas grid.  Cache is keyed on the array objects
+        themselves, so reassigning file_n or xps_in_nm invalidates it."""
+        key = (self.file_n, self.xps_in_nm, self.interpolation)
+        cached = self._interp_key
+        if cached is None or cached[0] is not key[0] or cached[1] is not key[1] \
+           or cached[2] != key[2]:
+            xps, nps = key[1], key[0]
+
+            # xps is always nm, so if goes large, small, reverse N's
+            if xps[0] > xps[-1]:
+                nps=nps[::-1]
+                xps=xps[::-1]    #Syntax to reverse an array
+
+            self._interpolant = scinterp.interp1d(xps, nps, kind=self.interpolation,
+                                                 bounds_error=False)
+            self._interp_key = key
+        return self._interpolant
+
     def update_interp(self):
         """Interpolates complex arrays from file data and sets self.narray (real and imaginary),
         could also set dielectric function, since BasicMaterial updates when either is changed."""
-        nps = self.file_n
-        xps = np.copy(self.xps_in_nm)
-        
-        # xps is always nm, so if goes large, small, reverse N's
-        if xps[0] > xps[-1]:
-            nps=nps[::-1] 
-            xps=xps[::-1]    #Syntax to reverse an array             
-
-        # Spline interpolation.  
-        f = scinterp.interp1d(xps, nps, kind=self.interpolation, bounds_error=False)             
-        narray = f(self.lambdas)
-                
+        f = self._get_interpolant()
+
         if self.extrapolation:
-            #Only extrapolate if there are Nans.  Mask by dropping Nans
-            #And passing full x, dropped x and narray.  Can't be complex,
-            #even though spline interp can be...
-            # http://docs.scipy.org/doc/numpy/reference/generated/numpy.interp.html            
-            if np.isnan(self.narray).any():
-                xmask = self.lambdas[np.logical_not(np.isnan(narray))]
-                nmask = narray[np.logical_not(np.isnan(narray))]
-                n = np.interp(self.lambdas, xmask, nmask.real)#, left=0, right=0)
-                k = np.interp(self.lambdas, xmask, nmask.imag)#, left=0, right=0)
-                narray = n + 1j*k
-
-        self.narray = narray
+            # Hold the file's edge values outside of its range (np.interp
+            # style constant extrapolation), in one pass with no Nan masking.
+            lambdas = np.clip(self.lambdas, f.x[0], f.x[-1])
+        else:
+            lambdas = self.lambdas
+
+        self.narray = f(lambdas)
 
     def _xps_in_nm_default(self):
         """ Store file datapoints in nm (only need once assuming Nanometer
@@ -137,6 +147,14 @@ class ABCFile(ABCExternal):
     
     def _get_short_name(self):
         return os.path.basename(self.file_path)
+
+    def registry_key(self):
+        """ Same file read by same class shares earray """
+        fingerprint = file_fingerprint(self.file_path)
+        if fingerprint is None:
+            return None
+        return (type(self).__name__, fingerprint, self.interpolation,
+                self.extrapolation)
     
     def update_data(self):
         """ Must set header, set file_x, set file_n and call updated_interp() """
@@ -14,6 +14,8 @@ from main_parms import SpecParms
 from interfaces import IMixer, IMie, IMaterial
 from material_models import Sellmeir, Dispwater
 from mpmath import findroot
+import dispersion
+from quiet import deferred
 
 from functools import partial
 
@@ -56,9 +58,16 @@ class DoubleMixer(HasTraits):
         # when used with composite_material anyway
         #self.update_mix() 
 
+    @deferred('mix')
     def update_mix(self): 
         if self.esolute.shape != self.esolvent.shape:
             return
+
+    def quiet_depends(self, other):
+        """ Uses other's result (for ordering deferred mixes, see quiet) """
+        mixed = getattr(other, 'mixedarray', None)
+        return mixed is not None and (self.esolute is mixed or 
+                                      self.esolvent is mixed)
                            
     
 class LinearSum(DoubleMixer):
@@ -68,10 +77,12 @@ class LinearSum(DoubleMixer):
     alpha = Range(0.0, 1.0, value=0.5)
     beta = Property(Range(0.0, 1.0, value=0.5), depends_on='alpha')
     
+    @deferred('mix')
     def update_mix(self):
         if self.esolute.shape != self.esolvent.shape:
             return        
-        self.mixedarray = self.alpha*self.esolute + self.beta*self.esolvent
+        self.mixedarray = dispersion.linear_sum(self.esolute, self.esolvent,
+                                                self.alpha)
         
     def _alpha_changed(self):
         self.update_mix()
@@ -122,6 +133,7 @@ class MG_Mod(DoubleMixer):
     def _K_changed(self): 
         self.update_mix()
 
+    @deferred('mix')
     def update_mix(self):
         """Its important to update the mixed array all at once because there's a listenter 
         in another method that can change at exact moment anything changes
@@ -129,26 +141,8 @@ class MG_Mod(DoubleMixer):
         if self.esolute.shape != self.esolvent.shape:
             return
             
-        eeff=np.empty(self.esolute.shape, dtype='complex')
-        em = self.esolvent#np.copy(self.esolvent)
-        emr = em.real
-        emi = em.imag  #Usually zero
-        ep = self.esolute#np.copy(self.esolute)
-        epr = ep.real
-        epi = ep.imag
-
-        A = self.Vfrac*(epr - emr)
-        B = self.Vfrac*epi
-        shell_scaling = (1.0/3.0)          #1/3 for spherical particles, not sure for others!!!
-        gam = (1.0/(3.0*emr) ) + (self.K/(4.0*math.pi*emr))
-        C = em + shell_scaling*(epr - emr) - self.Vfrac*gam*(epr-emr)
-        D = shell_scaling*epi - self.Vfrac*gam*epi
-        eff_r = emr + ( (A*C + B*D)/ (C**2 + D**2) )
-        eff_i = ((B*C - A*D)/(C**2 + D**2)).real   #IMAGINARY PART SHOULD BE 0 NO MATTER WHAT!
-        eeff.real = eff_r
-        eeff.imag = eff_i
-       
-        self.mixedarray = eeff       
+        self.mixedarray = dispersion.mg_garcia(self.esolute, self.esolvent,
+                                               self.Vfrac, self.K)
        
 
 class RootFinder(DoubleMixer):
@@ -171,6 +165,7 @@ class RootFinder(DoubleMixer):
         B = (x - em) / (x + 2.0*em + w*(x-em) )
         return B-A
 
+    @deferred('mix')
     def update_mix(self):
         if self.esolute.shape != self.esolvent.shape:
             return
@@ -269,22 +264,14 @@ class EquivMethod(DoubleMixer):
         '''If user changes ratio, this will adjust the shell (by choice) and not the core to fit the ratio'''
         self.shell_width=input_value * self.r_particle
 
+    @deferred('mix')
     def update_mix(self):
         if self.esolute.shape != self.esolvent.shape:
             return        
-        eeff = np.empty(self.esolute.shape, dtype='complex')
-        r1 = self.r_particle
-        r2 = self.shell_width+self.r_particle        #KEY THAT r2 is not just shell_width
-        A = (r1/r2)**3
-        B = self.esolvent/self.esolute
-        
-        num = (B*(1.0 + 2.0*B)) + (2.0*A*B*(1.0-B))
-        den = (1.0+2.0*B) - (A*(1.0-B))
-
-        gam = num/den #gamma is the equivalent coefficient
-        self.mixedarray = gam*self.esolute
-
-        self.gamma=gam  #In case I ever want to plot it, tacked this on 4_13_12
+        #esolvent is the shell here, r2 = r_particle + shell_width
+        self.mixedarray = dispersion.equiv_coreshell(self.esolute, self.esolvent,
+                                                     self.r_particle, self.shell_width)
+        self.gamma = self.mixedarray / self.esolute  #In case I ever want to plot it, tacked this on 4_13_12
 
 
 class CustomEquiv(EquivMethod):
@@ -337,21 +324,16 @@ class CustomEquiv(EquivMethod):
     def _get_shell_width_effective(self): 
         return self.shell_scaling * self.shell_width
 
+    @deferred('mix')
     def update_mix(self):
         if self.esolute.shape != self.esolvent.shape:
             return
         
-        r1=self.rcore_eff
-        r2=self.shell_width_effective+self.rcore_eff        #KEY THAT r2 is not just shell_width
-        A=(r1/r2)**3
-
         #Solvent in this case is shell on np not surrounding matrix/solution (VERIFIED 4_13_12)
-        B = ((self.esolvent*self.e_shell_scaling)/(self.e_core_scaling * self.esolute) )   #B = eshell/ecore  (each one given a scale factor)
-        num = (B*(1.0 + 2.0*B)) + (2.0*A*B*(1.0-B))
-        den = (1.0+2.0*B) - (A*(1.0-B))
-        gam = num/den
-        self.mixedarray = gam*self.esolute
-        self.gamma = gam
+        self.mixedarray = dispersion.equiv_coreshell(self.esolute, self.esolvent,
+            self.r_particle, self.shell_width, self.core_scaling, self.shell_scaling,
+            self.e_core_scaling, self.e_shell_scaling)
+        self.gamma = self.mixedarray / self.esolute
 
 
 if __name__ == '__main__':
@@ -3,12 +3,14 @@ from traits.api import *
 from traitsui.api import *
 import numpy as np
 from utils import complex_e_to_n
+import dispersion
 
 class ABCMaterialModel(BasicMaterial):	
     source='Model'
         
 class Constant(ABCMaterialModel):
     """ Interpolated array from scalaer complex value N or E """
+    registry_traits = ('constant_dielectric',)
     constant_dielectric = Complex() 
     constant_index=Property(Complex,
                             depends_on='constant_dielectric')
@@ -59,6 +61,7 @@ class Constant(ABCMaterialModel):
 class Air(Constant):
     """ Constant material of n=1.0; no dipsersion
     """
+    registry_traits = ('constant_dielectric',)
     def _constant_dielectric_default(self):
         return complex(1.0, 0)
     
@@ -82,6 +85,7 @@ class Air(Constant):
 
 class Cauchy(ABCMaterialModel):
     """ """
+    registry_traits = ('A', 'B', 'C', 'D')
     mat_name = Str('Fused Silica')
     
     A = Float(1.4580)
@@ -110,9 +114,8 @@ class Cauchy(ABCMaterialModel):
 
 
     def update_data(self):		
-        um = self.specparms.conv.specific_array('Micrometers')  #<---
-        A,B,C,D = self.A, self.B, self.C, self.D
-        self.narray = self.A + self.B/um**2 + C/um**3 + D/um**4       
+        self.earray = dispersion.cauchy(self.lambdas, self.A, self.B,
+                                        self.C, self.D)
         
     def simulation_requested(self):
         out = super(Cauchy, self).simulation_requested()
@@ -130,6 +133,7 @@ class Sellmeir(ABCMaterialModel):
     "On the performance of different bimetallic combinations in surface plasmon 
     resonance based fiber optic sensors."  J. APpl. Phys. 101, 092111 (2007)
     """
+    registry_traits = ('a1', 'a2', 'a3', 'b1', 'b2', 'b3')
     mat_name=Str('Dispersive Glass')
 
     a1=Float(.6961663) 
@@ -162,16 +166,13 @@ class Sellmeir(ABCMaterialModel):
         self.update_data()
 
     def update_data(self):		
-        um_xarray = self.specparms.conv.specific_array('Micrometers')
-        l_sqr = um_xarray**2
-        f1=(self.a1*l_sqr) / (l_sqr - self.b1**2)
-        f2=(self.a2*l_sqr) / (l_sqr - self.b2**2)       #Dummy indicies
-        f3=(self.a3*l_sqr) / (l_sqr - self.b3**2)  
-        self.narray = np.sqrt(1.0 + f1 + f2 + f3)	
+        self.earray = dispersion.sellmeir(self.lambdas, self.a1, self.a2,
+                                          self.a3, self.b1, self.b2, self.b3)
 
 
 class Dispwater(ABCMaterialModel):
     """Returns dispersion of water as put in some paper"""
+    registry_traits = ('A', 'B')
     A=Float(3479.0) 
     B=Float(5.111 * 10**7)  # I Believe units of NM
 
@@ -179,7 +180,7 @@ class Dispwater(ABCMaterialModel):
         return 'Dispersive Water'	
     
     def update_data(self): 	
-        self.narray=1.32334 + (self.A/ self.lambdas**2 ) - (self.B/self.lambdas**4)   #Entry in nm
+        self.earray = dispersion.dispwater(self.lambdas, self.A, self.B)   #Entry in nm
 
     @on_trait_change('A, B')
     def update_model(self):
@@ -235,6 +236,7 @@ class DrudeBulk(ABCMetalModel):
     in surface plasmon resonance based fiber optic sensors.  Journ. of app. physics.
     101 093111 (2007)
     """
+    registry_traits = ('lam_plasma', 'lam_collis')
     valid_metals = Enum('gold','silver','aluminum','copper')  #Currently only 
 
     def _valid_metals_default(self): 
@@ -250,25 +252,14 @@ class DrudeBulk(ABCMetalModel):
         return 'Drude Metal'
 
     def _valid_metals_changed(self):
-        if self.valid_metals == 'gold':               #These effects may be size dependent, need to look into it.  
-            self.lam_plasma=(1.6826 * 10**-7) #m
-            self.lam_collis=(8.9342 * 10**-6) #m
-        elif self.valid_metals == 'silver':
-            self.lam_plasma=(1.4541 * 10**-7) #m
-            self.lam_collis=(1.7614 * 10**-5) #m	
-        elif self.valid_metals == 'aluminum':
-            self.lam_plasma=(1.0657 * 10**-7) #m
-            self.lam_collis=(2.4511 * 10**-5) #m	
-        elif self.valid_metals == 'copper':
-            self.lam_plasma=(1.3617 * 10**-7) #m
-            self.lam_collis=(4.0825 * 10**-5) #m
+        #These effects may be size dependent, need to look into it.  
+        self.lam_plasma, self.lam_collis = dispersion.DRUDE_METALS[self.valid_metals] #m
         self.update_data()	
 
 
     def update_data(self):   #THIS DOES FIRE AT INSTANTIATION
-        m_xarray = self.specparms.conv.specific_array('Meters')
-        unity = 0+1j#np.array([complex(0.0,1.0)], dtype=complex)  #Gupta requries i * lambda, so this gets complex value of the xarray
-        self.earray = 1.0 - ( (m_xarray**2 * self.lam_collis) / (self.lam_plasma**2 * ( self.lam_collis + m_xarray*unity)  ) )
+        self.earray = dispersion.drude(self.lambdas, self.lam_plasma,
+                                       self.lam_collis)
 
     traits_view=View(
         VGroup(
@@ -0,0 +1,75 @@
+""" Registry of dispersion arrays shared between identical materials.  The
+same material (eg Dispwater as solvent and as shell medium, or one Sopra file
+in two layers) is often instantiated several times; when the wavelength grid
+changes, only the first instance evaluates and the rest reuse its earray.
+
+Materials opt in through BasicMaterial.registry_key() (class name + parameters
+or file fingerprint).  Shared arrays are read-only; an instance whose
+parameters are edited computes its own new array (copy on write), and is
+re-registered under its new key on the next grid change.
+"""
+
+import os
+from collections import OrderedDict
+
+MAXGRIDS = 2  #Keep arrays for current grid and previous (ie undo a change)
+
+class RegistryError(Exception):
+    """ """
+
+def file_fingerprint(path):
+    """ Cheap stand-in for hashing file contents: (path, size, mtime) """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime)
+
+
+class MaterialRegistry(object):
+    """ {grid : {material key : read-only earray}}, oldest grids dropped."""
+
+    def __init__(self, maxgrids=MAXGRIDS):
+        self.maxgrids = maxgrids
+        self._grids = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return sum(len(arrays) for arrays in self._grids.values())
+
+    def _grid_arrays(self, lambdas):
+        # Raw bytes of the grid are an exact key, and grids are small
+        gridkey = (lambdas.shape, lambdas.dtype.str, lambdas.tostring())
+        if gridkey in self._grids:
+            return self._grids[gridkey]
+        arrays = self._grids[gridkey] = {}
+        while len(self._grids) > self.maxgrids:
+            self._grids.popitem(last=False)
+        return arrays
+
+    def shared(self, key, lambdas, compute):
+        """ Return earray for material key on lambdas grid.  compute() is only
+        called if no identical material was evaluated on this grid already,
+        and must return the new earray."""
+        arrays = self._grid_arrays(lambdas)
+        try:
+            earray = arrays[key]
+        except KeyError:
+            self.misses += 1
+            earray = compute()
+            if earray is None:
+                raise RegistryError('Material with key %s computed no earray'
+                                    % (key,))
+            earray.flags.writeable = False
+            arrays[key] = earray
+        else:
+            self.hits += 1
+        return earray
+
+    def clear(self):
+        self._grids.clear()
+        self.hits = self.misses = 0
+
+
+SHARED_REGISTRY = MaterialRegistry()
@@ -0,0 +1,345 @@
+""" In-memory inverted index over material adapters for fast searching of the
+material tree.  Adapters are indexed by name, path components (ie RIINFO
+shelf/book/page), chemical formula (elements) and spectral coverage.  Metadata
+is gathered once when the index is built (RIINFO catalog.yml, Sopra headers,
+a light text scan of yaml files); queries never open material files.
+
+Queries are comma-delimited terms, eg:
+   'Au, covers 300-900 nm'
+   'silver johnson'
+   'SiO2, 0.4-1.2 um'
+"""
+
+import os.path as op
+import re
+import bisect
+
+from pame import riinfo_dir
+
+# Recognized units for coverage clauses; converted to nanometers
+_PROPORTIONAL = {'nm':1.0, 'nanometers':1.0,
+                 'um':1000.0, 'micrometers':1000.0, 'microns':1000.0,
+                 'mm':1.0e6, 'm':1.0e9, 'cm':1.0e7}
+_RECIPROCAL = {'ev':1239.84193, 'cm-1':1.0e7}
+
+# Sopra header codes (see material_files.SopraFile)
+_SOPRA_UNITS = {1:'ev', 2:'um', 3:'cm-1', 4:'nm'}
+
+ELEMENTS = set((
+    'H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar K Ca Sc Ti V Cr Mn Fe Co '
+    'Ni Cu Zn Ga Ge As Se Br Kr Rb Sr Y Zr Nb Mo Tc Ru Rh Pd Ag Cd In Sn Sb '
+    'Te I Xe Cs Ba La Ce Pr Nd Pm Sm Eu Gd Tb Dy Ho Er Tm Yb Lu Hf Ta W Re '
+    'Os Ir Pt Au Hg Tl Pb Bi Po At Rn Fr Ra Ac Th Pa U Np Pu Am').split())
+
+_COVERAGE = re.compile(r'^(?:covers?|coverage|range)?\s*'
+                       r'(\d+\.?\d*(?:[eE][-+]?\d+)?)\s*(?:-|to)\s*'
+                       r'(\d+\.?\d*(?:[eE][-+]?\d+)?)\s*([a-zA-Z\-1]*)$')
+_CATALOG_RANGE = re.compile(r'(\d+\.?\d*(?:[eE][-+]?\d+)?)\s*-\s*'
+                            r'(\d+\.?\d*(?:[eE][-+]?\d+)?)\s*(\S+)\s*$')
+_FORMULA = re.compile(r'([A-Z][a-z]?)(\d*\.?\d*)')
+_TAGS = re.compile(r'<[^>]+>')
+_SPLIT = re.compile(r'[^a-zA-Z0-9\.]+')
+
+# Score for match types, larger is better
+EXACT, ELEMENT, PREFIX = 3, 4, 1
+
+class MaterialSearchError(Exception):
+    """ """
+
+def _normalize_unit(unit):
+    """ Lowercase unit with micro sign (any encoding) replaced by 'u' """
+    return re.sub(r'[^\x00-\x7f]+', 'u', unit).lower().strip()
+
+def to_nanometers(value, unit):
+    """ Convert a spectral value to nanometers.  Only the common units used in
+    material files are understood (nm, um, eV, cm-1...)"""
+    unit = _normalize_unit(unit)
+    if not unit:
+        unit = 'nm'
+    if unit in _PROPORTIONAL:
+        return float(value) * _PROPORTIONAL[unit]
+    elif unit in _RECIPROCAL:
+        return _RECIPROCAL[unit] / float(value)
+    raise MaterialSearchError('Unknown spectral unit "%s"' % unit)
+
+def _coverage_nm(start, end, unit):
+    """ (xstart, xend) in nm, sorted so that reciprocal units are handled"""
+    try:
+        a, b = to_nanometers(start, unit), to_nanometers(end, unit)
+    except (MaterialSearchError, ZeroDivisionError, ValueError):
+        return None
+    return (min(a, b), max(a, b))
+
+def formula_elements(text):
+    """ Elements in a chemical formula like 'Al2O3' or 'In2O3-SnO2'.  Returns
+    empty set if text doesn't look like a formula, so that words like 'Rakic'
+    are not parsed into elements."""
+    out = set()
+    for word in re.split(r'[\s\-\(\)\[\]/,:]+', text):
+        if not word or not word[0].isupper():
+            continue
+        pieces = _FORMULA.findall(word)
+        # Must consume whole word with valid symbols
+        if ''.join(sym+num for sym, num in pieces) != word:
+            continue
+        symbols = [sym for sym, num in pieces]
+        if symbols and all(sym in ELEMENTS for sym in symbols):
+            out.update(symbols)
+    return out
+
+def tokenize(text):
+    """ Lowercase alphanumeric tokens of text; html tags are stripped."""
+    text = _TAGS.sub('', text)
+    return [t.strip('.') for t in _SPLIT.split(text.lower()) if t.strip('.')]
+
+def read_riinfo_catalog(root=riinfo_dir):
+    """ Parse catalog.yml line-by-line (full yaml parsing is slow) and
+    return {relative path : (book name, page name)}."""
+    out = {}
+    catalog = op.join(root, 'catalog.yml')
+    if not op.exists(catalog):
+        return out
+
+    book, page = '', ''
+    with open(catalog, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('- BOOK:'):
+                book, page = '', ''
+            elif line.startswith('name:'):
+                name = line.split(':', 1)[1].strip().strip('"')
+                # Book names come before any page in the book
+                if not book:
+                    book = name
+                else:
+                    page = name
+            elif line.startswith('path:'):
+                path = line.split(':', 1)[1].strip().strip('"')
+                out[op.normpath(path)] = (book, page)
+    return out
+
+def scan_yaml_coverage(path):
+    """ Light text scan of a RIINFO yaml file for spectral coverage (in
+    micrometers in these files).  Looks for FORMULA 'range:' or the first and
+    last line of a tabulated data block, without yaml parsing."""
+    first = last = None
+    indata = False
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                stripped = line.strip()
+                if stripped.startswith('range:'):
+                    vals = stripped.split(':', 1)[1].split()
+                    return _coverage_nm(vals[0], vals[-1], 'um')
+                if stripped.startswith('data:'):
+                    indata = True
+                    continue
+                if indata:
+                    vals = stripped.split()
+                    try:
+                        x = float(vals[0])
+                    except (ValueError, IndexError):
+                        indata = False
+                        continue
+                    if first is None:
+                        first = x
+                    last = x
+    except IOError:
+        return None
+    if first is None:
+        return None
+    return _coverage_nm(first, last, 'um')
+
+def read_sopra_coverage(path):
+    """ Sopra header is code, xstart, xend, xpoints either on one line or one
+    per line (file dependent), so just read the first tokens of the file."""
+    try:
+        with open(path, 'r') as f:
+            tokens = f.read(256).replace(',', ' ').split()[0:3]
+        code, start, end = int(float(tokens[0])), tokens[1], tokens[2]
+    except (IOError, IndexError, ValueError):
+        return None
+    if code not in _SOPRA_UNITS:
+        return None
+    return _coverage_nm(start, end, _SOPRA_UNITS[code])
+
+def read_xnk_coverage(path, delimiter=None):
+    """ First column of an XNK file, unit from header (first header field) """
+    try:
+        with open(path, 'r') as f:
+            unit = f.readline().lstrip('#').strip().split(delimiter)[0]
+            xs = [line.split(delimiter)[0] for line in f if line.strip()]
+        return _coverage_nm(xs[0], xs[-1], unit)
+    except (IOError, IndexError, ValueError):
+        return None
+
+
+class IndexEntry(object):
+    """ Index record for a single adapter """
+    __slots__ = ('adapter', 'name', 'tokens', 'elements', 'coverage')
+
+    def __init__(self, adapter, name, tokens, elements, coverage):
+        self.adapter = adapter
+        self.name = name
+        self.tokens = tokens
+        self.elements = elements
+        self.coverage = coverage
+
+    def covers(self, start, end):
+        if self.coverage is None:
+            return False
+        return self.coverage[0] <= start and self.coverage[1] >= end
+
+
+class MaterialIndex(object):
+    """ Inverted index of adapters.  Build with add() or from_adapters(), then
+    query with search().  Adapters are stored by reference, so search returns
+    the same adapter objects that populate the tree.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self._inverted = {}      # token --> set(entry ids)
+        self._elements = {}      # element symbol (lowercase) --> set(entry ids)
+        self._sorted_tokens = [] # For prefix matching via bisect
+        self._catalog = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def from_adapters(cls, adapters):
+        index = cls()
+        for adapter in adapters:
+            index.add(adapter)
+        return index
+
+    def _riinfo_catalog(self):
+        if self._catalog is None:
+            self._catalog = read_riinfo_catalog()
+        return self._catalog
+
+    def describe(self, adapter):
+        """ Returns (tokens, elements, coverage) for an adapter by inspecting
+        its name, file path and source."""
+        name = adapter.name
+        words = [name, getattr(adapter, 'source', '')]
+        formulas = [] # Only words that may be chemical formulas
+        coverage = None
+
+        file_path = getattr(adapter, 'file_path', '')
+        if file_path:
+            root = getattr(adapter, 'root', None)
+            if root:
+                relpath = op.normpath(op.relpath(file_path, root))
+                parts = relpath.split(op.sep)
+                words.extend(parts)
+                book, page = self._riinfo_catalog().get(relpath, ('', ''))
+                words.extend([book, page])
+                # Glass names like N-BK7 are not formulas
+                if parts[0] != 'glass':
+                    formulas.extend([book, parts[min(1, len(parts)-1)]])
+                match = _CATALOG_RANGE.search(page)
+                if match:
+                    coverage = _coverage_nm(*match.groups())
+                if coverage is None:
+                    coverage = scan_yaml_coverage(file_path)
+            else:
+                basename = op.splitext(op.basename(file_path))[0]
+                words.append(basename)
+                formulas.append(basename)
+                apikey = adapter.apikey
+                if apikey == 'sopra':
+                    coverage = read_sopra_coverage(file_path)
+                elif apikey in ['xnk', 'xnk_csv']:
+                    delim = ',' if apikey == 'xnk_csv' else None
+                    coverage = read_xnk_coverage(file_path, delim)
+
+        tokens = set()
+        elements = set()
+        for word in words:
+            tokens.update(tokenize(word))
+        for word in formulas:
+            elements.update(formula_elements(_TAGS.sub('', word)))
+        return tokens, elements, coverage
+
+    def add(self, adapter):
+        tokens, elements, coverage = self.describe(adapter)
+        idx = len(self.entries)
+        self.entries.append(IndexEntry(adapter, adapter.name, tokens,
+                                       elements, coverage))
+        for token in tokens:
+            if token not in self._inverted:
+                bisect.insort(self._sorted_tokens, token)
+            self._inverted.setdefault(token, set()).add(idx)
+        for element in elements:
+            self._elements.setdefault(element.lower(), set()).add(idx)
+
+    def _prefix_matches(self, term):
+        """ All entry ids with a token beginning with term """
+        out = set()
+        start = bisect.bisect_left(self._sorted_tokens, term)
+        for token in self._sorted_tokens[start:]:
+            if not token.startswith(term):
+                break
+            out.update(self._inverted[token])
+        return out
+
+    def _term_scores(self, term):
+        """ {entry id : score} for a single search term """
+        scores = {}
+        for idx in self._prefix_matches(term):
+            scores[idx] = PREFIX
+        for idx in self._inverted.get(term, ()):
+            scores[idx] = EXACT
+        for idx in self._elements.get(term, ()):
+            scores[idx] = scores.get(idx, 0) + ELEMENT
+        return scores
+
+    def parse_query(self, query):
+        """ Split query into (search terms, coverage) where coverage is None
+        or (start, end) in nm."""
+        terms = []
+        coverage = None
+        for clause in query.split(','):
+            clause = clause.strip()
+            if not clause:
+                continue
+            match = _COVERAGE.match(_normalize_unit(clause))
+            if match:
+                coverage = _coverage_nm(*match.groups())
+                if coverage is None:
+                    raise MaterialSearchError('Could not understand spectral'
+                                              ' range "%s"' % clause)
+            else:
+                terms.extend(tokenize(clause))
+        return terms, coverage
+
+    def search(self, query, limit=None):
+        """ Return adapters matching all terms of query (and covering the
+        spectral range if specified), best matches first."""
+        terms, coverage = self.parse_query(query)
+
+        if terms:
+            scores = self._term_scores(terms[0])
+            for term in terms[1:]:
+                newscores = self._term_scores(term)
+                scores = dict((idx, score + newscores[idx]) for idx, score
+                              in scores.items() if idx in newscores)
+        elif coverage:
+            scores = dict((idx, 0) for idx in range(len(self.entries)))
+        else:
+            return []
+
+        if coverage:
+            start, end = coverage
+            scores = dict((idx, score) for idx, score in scores.items()
+                          if self.entries[idx].covers(start, end))
+
+        # Best score, then shortest name (eg main_Au_Johnson over main_Au_Lemarchand-11.7nm)
+        ranked = sorted(scores, key=lambda idx: (-scores[idx],
+                                                 len(self.entries[idx].name),
+                                                 self.entries[idx].name))
+        if limit:
+            ranked = ranked[0:limit]
+        return [self.entries[idx].adapter for idx in ranked]
@@ -20,6 +20,7 @@ from pame import XNK_dir
 from material_files import XNKFile
 import os.path as op
 from pame.main_parms import SHARED_SPECPARMS
+from quiet import deferred, immediately
 
 class Mie(HasTraits):
     """Class to compute scattering coefficients given an input of a dielectric array"""
@@ -87,6 +88,7 @@ class Mie(HasTraits):
     def _sviewbutton_fired(self): 
         self.sview.edit_traits()   
 
+    @deferred('scattering')
     def update_cross(self): 
         """ ABC METHOD, udpate cross section"""
 
@@ -140,7 +142,7 @@ class Mie(HasTraits):
         neither call them...
         """
         
-        self.update_cross()
+        immediately(self.update_cross)
         return{
             'extinction':self.Cext,
             'absorbance':self.Cabs,
@@ -205,6 +207,7 @@ class shell(Mie):
 class sphere_electrostatics(ABCsphere):
     """Scattering cross section for a sphere using the conditions x<<1 and |m|x<<1 pg 136""" 
 
+    @deferred('scattering')
     def update_cross(self):
         x=self.k_medium* self.r_core
         Qscatt=(8.0/3.0 * x**4) * ( abs(self.ecore-self.emedium/ self.ecore+2.0* self.emedium)**2 )  #????QSCAT VS CSCATT???
@@ -228,6 +231,7 @@ class bare_sphere(ABCsphere):
             )), buttons=[ 'OK', 'Cancel', 'Undo', 'Help']
             )
 
+    @deferred('scattering')
     def update_cross(self):
         for i in range(self.ecore.shape[0]):   #XX! Can't remove; bessel functions can't generate with full arrays
             ext_term=0.0  ; scatt_term=0.0 ; ext_old=50
@@ -345,6 +349,7 @@ class sphere_shell(bare_sphere, shell):
         ), buttons=[ 'OK', 'Cancel', 'Undo', 'Help'] 
                      )
 
+    @deferred('scattering')
     def update_cross(self):
         print 'full mie updating cross'
         for i in range(self.ecore.shape[0]):
@@ -4,6 +4,9 @@ other default objects.
 """
 import os
 import os.path as op
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
 from traits.api import *
 
 from traitsui.api \
@@ -21,6 +24,7 @@ from yamlmaterials import YamlAdapter
 import composite_materials_adapter as cma
 import nano_materials_adapter as nma
 
+from material_search import MaterialIndex, MaterialSearchError
 from pame import sopra_dir, riinfo_dir, XNK_dir
 import config
 #http://code.enthought.com/projects/traits/docs/html/TUIUG/factories_advanced_extra.html
@@ -60,6 +64,14 @@ tree_editor = TreeEditor(
                   view      = no_view,
                   name      = 'Material models, files and databases',
                   ),        
+
+        # Results of Model.search (empty when no search)
+        TreeNode( node_for  = [ MaterialList ],
+                  auto_open = True,
+                  children  = 'SearchCategories',
+                  label     = '=Search Results',
+                  view      = no_view,
+                  ),
         
         TreeNode( node_for  = [ MaterialList ],
                   auto_open = False,
@@ -160,6 +172,13 @@ class Model( HasTraits ):
     FileSearch = Instance(LiveSearch,())	
     FileDic = Dict  #Maintains object representations for files
 
+    # Search bulk materials (eg 'Au, covers 300-900 nm'); see material_search
+    search = Str()
+    search_results = List(IAdapter)
+    _index = Any() #MaterialIndex, built in background (see _rebuild_index)
+    _index_generation = Int(0) #Bumped when materials change; older builds are dropped
+    _index_built = Event
+
     # All material categories ( see update_tree() )
     nonmetals  = List(IAdapter)
     metals  = List(IAdapter)
@@ -169,9 +188,17 @@ class Model( HasTraits ):
     sopradb = List(IAdapter)
     xnkdb = List(IAdapter)
 
+    # Databases still loading in background (see load_databases())
+    loading = List(Str)
+    _database_loaded = Event
+
     def __init__(self, *args, **kwds):
         super(HasTraits, self).__init__(*args, **kwds)
+        if config.BACKGROUNDLOAD:
+            self.load_databases()
         self.update_tree() #Necessary to make defaults work
+        if not self.loading:
+            self._rebuild_index()
         
     def _current_selection_changed(self):
         # Parse yaml file metadata only when selected to save time
@@ -180,8 +207,62 @@ class Model( HasTraits ):
         except Exception:
             pass
 
-    # Default Database Files
+    def load_databases(self):
+        """ Discover database files in a thread pool.  Tree shows placeholder
+        categories until each database is found; metadata is still only
+        parsed on selection."""
+        finders = {'sopradb':self._find_sopradb,
+                   'riinfodb':self._find_riinfodb,
+                   'xnkdb':self._find_xnkdb}
+
+        self.loading = finders.keys()
+        pool = ThreadPool(config.LOADTHREADS)
+        for name, finder in finders.items():
+            pool.apply_async(self._load_database, (name, finder))
+        pool.close()
+
+    def _load_database(self, name, finder):
+        """ Runs in worker thread; only lists files and makes their adapters
+        (no yaml parsing), so it doesn't compete with the GUI starting."""
+        try:
+            adapters = finder()
+        except Exception as exc:
+            logging.error('Failed to load database %s: %s' % (name, exc))
+            adapters = []
+        self._database_loaded = (name, adapters)
+
+    @on_trait_change('_database_loaded', dispatch='ui')
+    def _fill_database(self, new):
+        """ Put loaded database on the tree (in UI thread) """
+        name, adapters = new
+        setattr(self, name, adapters)
+        self.loading = [db for db in self.loading if db != name]
+        if not self.loading:
+            self._rebuild_index()
+        self.update_tree()
+
+    def _category_name(self, name, dbname):
+        if dbname in self.loading:
+            return '%s (loading...)' % name
+        return name
+
+    # Default Database Files (empty if loading in background)
     def _sopradb_default(self):
+        if config.BACKGROUNDLOAD:
+            return []
+        return self._find_sopradb()
+
+    def _riinfodb_default(self):
+        if config.BACKGROUNDLOAD:
+            return []
+        return self._find_riinfodb()
+
+    def _xnkdb_default(self):
+        if config.BACKGROUNDLOAD:
+            return []
+        return self._find_xnkdb()
+
+    def _find_sopradb(self):
         """ Read all files from sopra database"""
         out = []
         if config.USESOPRA:
@@ -189,7 +270,7 @@ class Model( HasTraits ):
                 out.append(SopraFileAdapter(file_path = op.join(sopra_dir, f)))
         return out
 
-    def _riinfodb_default(self):
+    def _find_riinfodb(self):
         """ Read all files form RI_INFO database. """
         out = []
         if config.USERIINFO:           
@@ -203,8 +284,8 @@ class Model( HasTraits ):
         return out 
     
 
-    def _xnkdb_default(self):
-        """ Read all files from sopra database"""
+    def _find_xnkdb(self):
+        """ Read all files from XNK database"""
         out = []
         if config.USESOPRA:
             for f in os.listdir(XNK_dir):
@@ -269,6 +350,48 @@ class Model( HasTraits ):
         # nk files can be csv too, so have this workaround
         self.nkfiles= [self.FileDic[k] for k in self.FileDic.keys() if
                        k.fileclass in ['XNK', 'XNK_csv']]
+        self._rebuild_index() #Files changed
+        self.update_tree()
+
+    def _rebuild_index(self):
+        """ Index all bulk materials (models, databases and files) in a
+        background thread; indexing scans ~1100 RIINFO files.  Searches
+        before it's done match nothing, and rerun once it is."""
+        self._index = None
+        self._index_generation += 1
+        adapters = (self.nonmetals + self.metals + self.xnkdb + self.sopradb +
+                    self.riinfodb + self.soprafiles + self.nkfiles)
+        thread = threading.Thread(target=self._build_index,
+                                  args=(self._index_generation, adapters))
+        thread.daemon = True
+        thread.start()
+
+    def _build_index(self, generation, adapters):
+        """ Runs in worker thread; only reads the adapters """
+        try:
+            index = MaterialIndex.from_adapters(adapters)
+        except Exception as exc:
+            logging.error('Failed to index materials for search: %s' % exc)
+            return
+        self._index_built = (generation, index)
+
+    @on_trait_change('_index_built', dispatch='ui')
+    def _set_index(self, new):
+        generation, index = new
+        if generation != self._index_generation:
+            return #Materials changed since; a newer build is running
+        self._index = index
+        self._search_changed(self.search) #Refresh stale (or waiting) results
+
+    def _search_changed(self, new):
+        if not new.strip() or self._index is None:
+            self.search_results = []
+        else:
+            try:
+                self.search_results = self._index.search(new)
+            # Partially typed ranges like "300-" are just ignored
+            except MaterialSearchError:
+                return
         self.update_tree()
 
 
@@ -277,6 +400,16 @@ class Model( HasTraits ):
         
         self.materials_trees = MaterialList(
 
+            #Search results
+            #------------
+            SearchCategories = [
+                Category(
+                    name      = 'Matches (%s)' % (len(self.search_results) 
+                        if self._index is not None else 'indexing...'),
+                    Materials = self.search_results
+                    )
+                ] if self.search.strip() else [],
+
             #Composite and Nano materials
             #------------
             NanoMaterials = [
@@ -309,17 +442,17 @@ class Model( HasTraits ):
             DBCategories = \
                [
                 Category(
-                    name      = 'XNK Database',
+                    name      = self._category_name('XNK Database', 'xnkdb'),
                     Materials = self._adaptersort(self.xnkdb) 
                     ),
                 
                 Category(
-                    name      = 'Sopra Database',
+                    name      = self._category_name('Sopra Database', 'sopradb'),
                     Materials = self._adaptersort(self.sopradb) 
                     ),
     
                 Category(
-                    name      = 'RIINFO Database',
+                    name      = self._category_name('RIINFO Database', 'riinfodb'),
                     Materials = self._adaptersort(self.riinfodb),
                     ),
                 ],
@@ -340,6 +473,7 @@ class Model( HasTraits ):
 
     view = View(
         VSplit(
+            Item('search', label='Search'),
             Item( name       = 'materials_trees',
                   editor     = tree_editor,
                   show_label = False,
@@ -12,6 +12,9 @@ from tmm_mod import vector_com_tmm
 import numpy as np
 from pandas import Panel
 import globalparms
+import dataflow
+import stackcache
+import config as pameconfig
 
 
 class OpticalModelError(Exception):
@@ -46,6 +49,8 @@ class DielectricSlab(HasTraits):
     nsubstrate=Property(Array, depends_on='stack')
     ns=Property(Array, depends_on='stack')    #This is a list of arrays [n1, n2, n3] one for each layer
     ds=Property(Array, depends_on='stack')    #This is a lis
+    _flow = Any
+    _flow_layers = Tuple
 
     #sim_designator=Str('New Simulation') #<--- WHY
     implements(IOptic)
@@ -65,29 +70,51 @@ class DielectricSlab(HasTraits):
         # Updates plot (opticview)
         self.opticview.update()
 
-    #@cached_property
+    # Dataflow graph: each layer's n and d, then ns, ds and the optical stack
+    # (see dataflow.py), so only what changed is recomputed.  Rebuilt when
+    # layers are added or removed.
+    def flow(self):
+        layers = tuple(self.stack)
+        if self._flow is None or len(layers) != len(self._flow_layers) or \
+           any(a is not b for a, b in zip(layers, self._flow_layers)):
+            self._flow = self._build_flow(layers)
+            self._flow_layers = layers
+        return self._flow
+
+    def _build_flow(self, layers):
+        graph = dataflow.Graph()
+        for i, layer in enumerate(layers):
+            # Bind layer now, not at call time
+            graph.source('layer%s.n' % i, lambda layer=layer: layer.material.narray,
+                         key=lambda layer=layer: layer.material.earray)
+            graph.source('layer%s.d' % i, lambda layer=layer: layer.d,
+                         key=lambda layer=layer: layer.d)
+        ncols = ['layer%s.n' % i for i in range(len(layers))]
+        graph.node('ns', lambda *narrays: np.array(narrays, dtype=complex), ncols)
+        graph.node('ds', self._compute_ds, ['layer%s.d' % i for i in range(len(layers))])
+        graph.source('config', lambda: (self.Mode, self.angles, self.lambdas),
+                     key=lambda: (self.Mode, self.angles, self.lambdas))
+        graph.node('optical_stack', self._cached_optical_stack, ['ns', 'ds', 'config'])
+        return graph
+
     def _get_ns(self): 
-        rows=len(self.stack) 
-        cols=self.lambdas.shape[0]
-        ns=empty( (rows, cols), dtype=complex )
-        for i in range(rows):	
-            layer=self.stack[i]
-            ns[i,:]=layer.material.narray	#LIST OF ARRAYS NOT AN ARRAY 		
-        return ns	
-
-    #@cached_property
+        """ (layers x lambdas) index of refraction """
+        return self.flow().value('ns')
+
     def _get_nsubstrate(self):
-        for layer in self.stack:
+        for i, layer in enumerate(self.stack):
             if layer.name == 'Substrate':
-                return layer.material.narray
+                return self.flow().value('layer%s.n' % i)
 
-    #@cached_property
     def _get_ds(self): 
         """Returns inf, d1, d2, d3, inf for layers"""
+        return self.flow().value('ds')
+
+    def _compute_ds(self, *layer_ds):
         ds = [inf, inf]
-        for layer in self.stack:
-            if layer.d != globalparms.semiinf_layer:  #When does this happen?  Substrate/solvent?
-                ds.insert(-1, layer.d)
+        for d in layer_ds:
+            if d != globalparms.semiinf_layer:  #When does this happen?  Substrate/solvent?
+                ds.insert(-1, d)
         return array(ds)
 
     # RENAME
@@ -106,14 +133,31 @@ class DielectricSlab(HasTraits):
         The takeaway is that for unpolarized light, the operation (results_s + results_p) / 2.0 is performed
         on the DataFrames, irregardless of a real or complex value in each columns.  We confirmed this works
         as expected, and when plotted, only the real part will be plotted anyway (default behavior of pandas plot).
+
+        Nothing is recomputed if no layer, angle or wavelength changed since the last call.
         """
+        self.optical_stack = self.flow().value('optical_stack')
+
+    def _cached_optical_stack(self, ns, ds, config):
+        """ Optical stack from the stack cache if it was solved before """
+        if not pameconfig.STACKCACHE:
+            return self._compute_optical_stack(ns, ds, config)
+        Mode, angles, lambdas = config
+        cache = stackcache.open_cache(pameconfig.STACKCACHEDIR, 
+                                      pameconfig.STACKCACHE_MB * 2**20)
+        return cache.optical_stack(ns, ds, lambdas, angles, Mode, 
+            lambda ns, ds, lambdas, angles, Mode: 
+                self._compute_optical_stack(ns, ds, (Mode, angles, lambdas)))
+
+    def _compute_optical_stack(self, ns, ds, config):
         print 'recomputing optical stack'
+        Mode, angles, lambdas = config
 
-        if self.Mode == 'S-polarized':
+        if Mode == 'S-polarized':
             pol = 's'
-        elif self.Mode == 'P-polarized':
+        elif Mode == 'P-polarized':
             pol = 'p'
-        elif self.Mode == 'Unpolarized':
+        elif Mode == 'Unpolarized':
             pol = 'both'
         else:
             raise OpticalModelError('Mode must be "S-polarized", "P-polarized" or Unpolarized; crashing intentionally.')
@@ -121,13 +165,13 @@ class DielectricSlab(HasTraits):
             
 
         paneldict = {}        
-        for ang in self.angles:
+        for ang in angles:
             # CALCULATION IN RADIAN MODE
             ang_rad = math.radians(ang)
             
             if pol == 'both':
-                df_s = vector_com_tmm('s', self.ns, self.ds, ang_rad, self.lambdas) 
-                df_p = vector_com_tmm('p', self.ns, self.ds, ang_rad, self.lambdas)                  
+                df_s = vector_com_tmm('s', ns, ds, ang_rad, lambdas) 
+                df_p = vector_com_tmm('p', ns, ds, ang_rad, lambdas)                  
                 result_dataframe = (df_s+df_p) / 2.0
 
                 # Add ellipsometry parameter Psi
@@ -145,17 +189,16 @@ class DielectricSlab(HasTraits):
                 
             else:
                 result_dataframe = vector_com_tmm(
-                    pol, self.ns, self.ds, ang_rad, self.lambdas
+                    pol, ns, ds, ang_rad, lambdas
                                             )
                 # FILL PSI/DELTA TO NANS IF UNPOLARIZED!
-                result_dataframe['r_psi'] = np.nan * np.empty(len(self.lambdas))
-                result_dataframe['r_delta'] = np.nan * np.empty(len(self.lambdas))
+                result_dataframe['r_psi'] = np.nan * np.empty(len(lambdas))
+                result_dataframe['r_delta'] = np.nan * np.empty(len(lambdas))
                 
 
             paneldict[ang] = result_dataframe
 
-        # UPDATE optical_stack!
-        self.optical_stack = Panel(paneldict)
+        return Panel(paneldict)
               
 
     def as_stack(self, attr):
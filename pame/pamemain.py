@@ -18,6 +18,7 @@ from fiberview import ViewMlab, FiberView, EllispometryView
 from plotselector import PlotSelector
 from gensim import LayerSimulation, ABCSim, SimConfigure
 from handlers import WarningDialog
+from quiet import SHARED_QUIET
 import config
 
 
@@ -269,6 +270,20 @@ class GlobalScene(HasTraits):
           message('%s simulation(s) saved to directory: "%s"'%(len(outsims),
                                                                op.split(self.sim_outdir)[1]), title='Success')
 
+     # Quiet mode
+     # ----------
+     def quiet(self):
+          """ Context manager: while setting several traits (ie a simulation
+          step), queue mixes, Mie updates and plot refreshes and run each once
+          on exit (see quiet.py).  
+
+             >>> with app.quiet():
+             ...     app.selected_material.r_core = 15.0
+             ...     app.selected_material.shell_width = 3.0
+             >>> app.opticstate.update_optical_stack()
+          """
+          return SHARED_QUIET.quiet()
+
      # Pop Reflectance/Material Plots
      # ------------------------
      def popout_optics(self):
@@ -0,0 +1,151 @@
+""" Deferred recomputation ("quiet mode").  Setting one trait, say a shell
+material's Vfrac, cascades through mixers, Mie cross sections, material and
+scattering plots and main plot redraws, and several of these run more than
+once for a single change.  Methods decorated with deferred(stage) are queued
+instead of run while SHARED_QUIET is quiet, one entry per object and method,
+and run once each when the block exits, in stage order:
+
+   mix         mixers (material_mixer_v2), inner mixes before the ones using them
+   scattering  Mie cross sections
+   view        material and scattering plots
+   redraw      main plot redraws
+
+A queued call that changes something another object listens to (ie a mix
+changing the earray a Mie uses) queues that call too, and the flush runs
+until nothing is left.
+
+   >>> with SHARED_QUIET.quiet():
+   ...     material.Vfrac = 0.2
+   ...     material.r_core = 15.0     #One mix and one Mie update, on exit
+
+hold(stages) defers only those stages until its block exits, ie simulations
+hold 'view' and 'redraw' for the whole run and plots refresh once at the end.
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+from collections import OrderedDict
+
+STAGES = ('mix', 'scattering', 'view', 'redraw')
+
+class QuietError(Exception):
+    """ """
+
+def _check_stages(stages):
+    for stage in stages:
+        if stage not in STAGES:
+            raise QuietError('Unknown stage "%s"; stages are %s' % (stage, STAGES))
+
+
+class QuietMode(object):
+    """ Queue of deferred calls {(object id, method name) : (stage, object,
+    method)} """
+
+    def __init__(self):
+        self.depth = 0
+        self.held = []
+        self.pending = OrderedDict()
+        self._flushing = False
+        self.deferred = 0   #Calls queued
+        self.collapsed = 0  #Calls dropped as already queued
+
+    def defers(self, stage):
+        return self.depth > 0 or any(stage in hold for hold in self.held)
+
+    def defer(self, stage, obj, method):
+        key = (id(obj), method.__name__)
+        if key in self.pending:
+            self.collapsed += 1
+        else:
+            self.pending[key] = (stage, obj, method)
+        self.deferred += 1
+
+    @contextmanager
+    def quiet(self):
+        """ Defer every stage, run all that isn't held on exit """
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            self.flush()
+
+    @contextmanager
+    def hold(self, *stages):
+        """ Defer stages (ie 'view', 'redraw') until exit """
+        _check_stages(stages)
+        self.held.append(stages)
+        try:
+            yield self
+        finally:
+            self.held.pop()
+            self.flush()
+
+    def _held(self):
+        if self.depth > 0:
+            return set(STAGES)
+        return set(stage for hold in self.held for stage in hold)
+
+    def _next(self, held):
+        """ Key of the next call: earliest stage, and within it one that
+        doesn't depend on another pending call (see quiet_depends)."""
+        ready = [(STAGES.index(stage), key) for key, (stage, obj, method)
+                 in self.pending.items() if stage not in held]
+        if not ready:
+            return None
+        first = min(ready)[0]
+        keys = [key for rank, key in ready if rank == first]
+        for key in keys:
+            obj = self.pending[key][1]
+            depends = getattr(obj, 'quiet_depends', None)
+            if depends is None or not any(depends(self.pending[other][1])
+                                          for other in keys if other != key):
+                return key
+        return keys[0] #Cycle, shouldn't happen
+
+    def flush(self):
+        """ Run pending calls of stages not held, and whatever they queue """
+        if self._flushing:
+            return #Outer flush picks up anything queued
+        held = self._held()
+        self._flushing = True
+        self.depth += 1 #Queue calls made while flushing
+        try:
+            while True:
+                key = self._next(held)
+                if key is None:
+                    break
+                stage, obj, method = self.pending.pop(key)
+                method(obj)
+        finally:
+            self.depth -= 1
+            self._flushing = False
+
+    def clear(self):
+        self.pending.clear()
+        self.deferred = self.collapsed = 0
+
+
+SHARED_QUIET = QuietMode()
+
+
+def deferred(stage):
+    """ Decorator for methods without arguments (update_mix, update_cross...)
+    that queues calls on SHARED_QUIET while stage is deferred."""
+    _check_stages([stage])
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwds):
+            if not args and not kwds and SHARED_QUIET.defers(stage):
+                SHARED_QUIET.defer(stage, self, method)
+            else:
+                return method(self, *args, **kwds)
+        wrapper.deferred_method = method
+        return wrapper
+    return decorator
+
+def immediately(bound):
+    """ Call a deferred method now, even while quiet (ie before reading what
+    it computes)."""
+    func = getattr(bound.__func__, 'deferred_method', bound.__func__)
+    return func(bound.__self__)
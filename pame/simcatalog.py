@@ -0,0 +1,231 @@
+""" Catalog of every saved simulation in a folder, so runs can be found
+without opening each one.  The about, static and inputs of each file are
+indexed into a small sqlite database in the folder (config.CATALOGNAME);
+update() only reads files that are new or changed (by modification time)
+since the last update.
+
+   >>> catalog = SimCatalog('Simulations')
+   >>> catalog.update()
+   {'added': 120, 'updated': 0, 'removed': 0, 'unchanged': 0, 'failed': 1}
+   >>> paths = catalog.find({'CoreMaterial':'gold', 'Vfrac':(0.1, 0.3)},
+   ...                      lambdas=(400, 800))
+   >>> runs = catalog.load_primary(paths)     #LabeledArray (run, variable, ...)
+
+Conditions are {name : value} where name is a full dotted key
+('selected_material.Vfrac') or any dotted part of one ('Vfrac',
+'CoreMaterial'), in about, static or inputs.  Values are matched as:
+
+   'text'        text values containing it (case insensitive)
+   number        numbers or arrays whose range holds it
+   (low, high)   numbers or arrays whose range overlaps it (None is open)
+
+lambdas=(low, high) finds runs whose wavelengths cover low to high.  Queries
+only read the database; files are opened by update() and load_primary().
+"""
+
+import os
+import os.path as op
+import sqlite3
+
+import numpy as np
+
+from pame import globalparms
+from simparser import LayerSimParser, load_simulation
+import config
+
+SIMFILES = (config.SIMEXT, '.json')
+SIMDIRS = (config.COLEXT, config.STREAMEXT)
+SECTIONS = ('about', 'static', 'inputs')
+_TOL = 1e-9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL,
+    name TEXT, steps INTEGER, lambda_min REAL, lambda_max REAL, error TEXT);
+CREATE TABLE IF NOT EXISTS params (path TEXT, section TEXT, key TEXT,
+    text TEXT, low REAL, high REAL);
+CREATE INDEX IF NOT EXISTS params_path ON params (path);
+"""
+
+class CatalogError(Exception):
+    """ """
+
+def _mtime(path):
+    """ Latest modification of path, or of the files of a directory format
+    (steps are added to a streamed simulation as they finish) """
+    mtime = op.getmtime(path)
+    if op.isdir(path):
+        for name in os.listdir(path):
+            mtime = max(mtime, op.getmtime(op.join(path, name)))
+    return mtime
+
+def _flatten(tree, prefix=''):
+    """ [(dotted key, leaf)] of nested dictionaries """
+    out = []
+    for key, value in tree.items():
+        key = '%s%s' % (prefix, key)
+        if isinstance(value, dict):
+            out.extend(_flatten(value, key + '.'))
+        else:
+            out.append((key, value))
+    return out
+
+def _row(value):
+    """ (text, low, high) of a leaf, or None if it can't be queried """
+    if isinstance(value, basestring):
+        return value, None, None
+    try:
+        array = np.asarray(value, dtype=float)
+    except (TypeError, ValueError):
+        return None
+    if not array.size or np.isnan(array).all():
+        return None
+    return None, float(np.nanmin(array)), float(np.nanmax(array))
+
+def simulation_files(directory, recursive=True):
+    """ Paths of saved simulations below directory """
+    out = []
+    for root, dirs, files in os.walk(directory):
+        out.extend(op.join(root, name) for name in files if name.endswith(SIMFILES))
+        for name in list(dirs):
+            if name.endswith(SIMDIRS):
+                out.append(op.join(root, name))
+                dirs.remove(name) #Don't walk into its steps
+        if not recursive:
+            break
+    return sorted(out)
+
+
+class SimCatalog(object):
+    """ sqlite index of the simulations in directory; paths are stored
+    relative to it so the folder can be moved """
+
+    def __init__(self, directory, dbpath=None, recursive=True):
+        self.directory = op.abspath(op.expanduser(directory))
+        self.dbpath = dbpath or op.join(self.directory, config.CATALOGNAME)
+        self.recursive = recursive
+        self.db = sqlite3.connect(self.dbpath)
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _relative(self, path):
+        return op.relpath(op.abspath(path), self.directory)
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM files WHERE error IS NULL').fetchone()[0]
+
+    def update(self):
+        """ Index new and changed files, forget deleted ones.  Returns counts."""
+        counts = dict.fromkeys(('added', 'updated', 'removed', 'unchanged', 'failed'), 0)
+        known = dict(self.db.execute('SELECT path, mtime FROM files'))
+        for path in simulation_files(self.directory, self.recursive):
+            relpath = self._relative(path)
+            mtime = _mtime(path)
+            if known.pop(relpath, None) == mtime:
+                counts['unchanged'] += 1
+                continue
+            counts['updated' if self._forget(relpath) else 'added'] += 1
+            if not self._index(path, relpath, mtime):
+                counts['failed'] += 1
+        for relpath in known:
+            self._forget(relpath)
+            counts['removed'] += 1
+        self.db.commit()
+        return counts
+
+    def _forget(self, relpath):
+        self.db.execute('DELETE FROM params WHERE path = ?', (relpath,))
+        return self.db.execute('DELETE FROM files WHERE path = ?', (relpath,)).rowcount
+
+    def _index(self, path, relpath, mtime):
+        """ Add one file; unreadable files are kept with their error, so
+        they're only retried once changed """
+        try:
+            sim = load_simulation(path)
+        except Exception as exc:
+            self.db.execute('INSERT INTO files (path, mtime, error) VALUES (?, ?, ?)',
+                            (relpath, mtime, '%s: %s' % (type(exc).__name__, exc)))
+            return False
+
+        rows = []
+        for section in SECTIONS:
+            for key, value in _flatten(getattr(sim, section)):
+                row = _row(value)
+                if row is not None:
+                    rows.append((relpath, section, key) + row)
+        self.db.executemany('INSERT INTO params VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+        try:
+            lambdas = np.asarray(sim.static[globalparms.spectralparameters]['lambdas'],
+                                 dtype=float)
+            lambda_min, lambda_max = float(lambdas.min()), float(lambdas.max())
+        except Exception:
+            lambda_min = lambda_max = None
+        self.db.execute('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, NULL)',
+                        (relpath, mtime, sim.about.get('Simulation Name'),
+                         len(sim.primary), lambda_min, lambda_max))
+        return True
+
+    def errors(self):
+        """ {path : error} of files that couldn't be indexed """
+        return dict(self.db.execute('SELECT path, error FROM files WHERE error IS NOT NULL'))
+
+    def find(self, conditions=None, lambdas=None, **kwds):
+        """ Paths (absolute, sorted) of runs matching every condition; see
+        module docstring """
+        conditions = dict(conditions or {}, **kwds)
+        sql = ['SELECT path FROM files WHERE error IS NULL']
+        args = []
+        if lambdas is not None:
+            sql.append('AND lambda_min <= ? AND lambda_max >= ?')
+            args.extend([lambdas[0], lambdas[1]])
+        for name, value in conditions.items():
+            # name is the key, or a whole dotted part of it
+            where = ["instr('.' || key || '.', ?) > 0"]
+            args.append('.%s.' % name)
+            if isinstance(value, basestring):
+                where.append('instr(lower(text), ?) > 0')
+                args.append(value.lower())
+            else:
+                if np.ndim(value):
+                    low, high = value
+                else:
+                    low = high = value
+                if low is not None:
+                    where.append('high >= ?')
+                    args.append(low - _TOL*max(abs(low), 1))
+                if high is not None:
+                    where.append('low <= ?')
+                    args.append(high + _TOL*max(abs(high), 1))
+            sql.append('AND path IN (SELECT path FROM params WHERE %s)' % ' AND '.join(where))
+        sql.append('ORDER BY path')
+        return [op.join(self.directory, row[0]) for row in self.db.execute(' '.join(sql), args)]
+
+    def values(self, name, paths=None):
+        """ {path : [(key, value)]} of keys matching name (as in find) in
+        each run, from the database.  Arrays give (low, high)."""
+        out = {}
+        rows = self.db.execute("SELECT path, key, text, low, high FROM params "
+                               "WHERE instr('.' || key || '.', ?) > 0 ORDER BY path, key",
+                               ('.%s.' % name,))
+        for relpath, key, text, low, high in rows:
+            path = op.join(self.directory, relpath)
+            if paths is not None and path not in paths:
+                continue
+            value = text if text is not None else (low if low == high else (low, high))
+            out.setdefault(path, []).append((key, value))
+        return out
+
+    def load_primary(self, paths=None, conditions=None, lambdas=None,
+                     processes=None, variables=None, **kwds):
+        """ primary_array() of each run (paths, or those found by the
+        conditions) stacked along a new run dimension, loaded in parallel;
+        see LayerSimParser.load_many """
+        if paths is None:
+            paths = self.find(conditions, lambdas, **kwds)
+        if not paths:
+            raise CatalogError('No runs to load')
+        out = LayerSimParser.load_many(paths, processes, variables)
+        out.coords['run'] = np.array([self._relative(path) for path in paths])
+        return out
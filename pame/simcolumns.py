@@ -0,0 +1,393 @@
+""" Columnar simulation files.  A .mpickle pickles the whole LayerSimParser,
+so looking at anything means unpickling every step's nested dictionaries.
+Here every numeric leaf of primary and results is one typed array with
+steps as its first axis, split in chunks of whole steps and opened
+memory-mapped, so reading R_avg of every step, or everything of one step,
+only touches those bytes.  A simulation is a directory:
+
+   Layersim.simcol/
+       header.pickle          about, static, inputs, steps, layouts, columns
+       objects.pickle         leaves that aren't columns (strings...)
+       primary%2FR_avg/
+           chunk_0.npy        steps [0, 40) of primary/R_avg, shape (40, 100)
+           chunk_1.npy        steps [40, 80)
+       results%2Fselected_layer%2Fmaterial%2Fearray/
+           chunk_0.zlib       compressed chunk (see below)
+       ...
+
+header.pickle is a dictionary:
+
+   version      FORMAT
+   about, static, inputs     as ABCSim.allstorage
+   steps        step names, in step order ('step_0', 'step_1'...)
+   layouts      distinct lists of the flattened keys of a step (simstore
+                style 'results/Layer2/material/earray'; keys of nested
+                dictionaries hold None), in order
+   step_layout  index in layouts of each step
+   columns      {key : {'dir', 'dtype', 'shape' (of one step), 'chunks'
+                [(start, stop)], 'pandas' None or (class name, axes),
+                'codec' None or compressors codec, 'level', 'index'}}
+
+A leaf is a column if it is a number, a numeric array or a pandas object of
+numbers, with the same type, shape (and pandas axes) in every step.
+Anything else is pickled in objects.pickle as {key : {step : value}}.
+Steps with identical values (ie a substrate's earray in every step) share
+one row: the chunks then hold each distinct value once, in order of first
+appearance, and index (None otherwise) gives the row of every step.
+Chunk files are .npy, so np.load(..., mmap_mode='r') reads them anywhere.
+With a codec (zlib, lz4, zstd, blosc; see compressors.py), they are
+chunk_i.<codec> instead: the C ordered bytes of the chunk, compressed.  Each
+chunk is decompressed on its own, so reading one step only decompresses the
+chunks holding it.
+
+How much of a simulation is written is set by depth (SAVEDEPTHS; the
+program's default is config.SAVEDEPTH):
+
+   light    primary, inputs, about and static; no results
+   medium   results too, without full optical stacks
+   heavy    everything
+"""
+
+import os
+import os.path as op
+import shutil
+import urllib
+import cPickle
+from collections import OrderedDict
+
+import numpy as np
+from pandas import Series, DataFrame, Panel
+
+import pame.utils as putil
+from pame import globalparms
+from simstore import _flatten, _unflatten, StepReader, content_hash
+import compressors
+
+FORMAT = 3 #2 adds compressed chunks, 3 shared rows
+HEADER = 'header.pickle'
+OBJECTS = 'objects.pickle'
+CHUNKBYTES = 4 * 2**20 #Steps per chunk are chosen to stay about this size
+CACHECHUNKS = 32 #Decompressed chunks a reader keeps
+SAVEDEPTHS = ('light', 'medium', 'heavy')
+
+_PANDAS = {'Series':Series, 'DataFrame':DataFrame, 'Panel':Panel}
+
+class ColumnError(Exception):
+    """ """
+
+def _numeric(array):
+    return array.dtype.kind in 'biufc'
+
+def _leaf(value):
+    """ (array, pandas) of a leaf that can go in a column, else None """
+    if isinstance(value, (Series, DataFrame, Panel)):
+        values = np.asarray(value.values)
+        if not _numeric(values):
+            return None
+        if isinstance(value, Series):
+            axes = (value.index,)
+        elif isinstance(value, DataFrame):
+            axes = (value.index, value.columns)
+        else:
+            axes = (value.items, value.major_axis, value.minor_axis)
+        return values, (type(value).__name__, axes)
+    if isinstance(value, (bool, int, long, float, complex, np.number, np.ndarray)):
+        array = np.asarray(value)
+        if _numeric(array):
+            return array, None
+    return None
+
+def _same_pandas(a, b):
+    if a is None or b is None:
+        return a is b
+    return a[0] == b[0] and all(x.equals(y) for x, y in zip(a[1], b[1]))
+
+def _column_dir(key):
+    return urllib.quote(key, safe='')
+
+def _steps_of(storage):
+    names = set(storage['primary']) | set(storage.get('results', {}))
+    return putil.stepsort(names)
+
+
+def trim_storage(storage, depth='heavy'):
+    """ Copy of storage dictionaries with only what depth saves """
+    if depth not in SAVEDEPTHS:
+        raise ColumnError('Save depth must be one of %s, got %s' % (SAVEDEPTHS, depth))
+    out = OrderedDict(storage)
+    if depth == 'light':
+        out['results'] = OrderedDict()
+    elif depth == 'medium':
+        out['results'] = OrderedDict((step, OrderedDict((k, v) for k, v in
+            results.items() if k != globalparms.optresponse))
+            for step, results in storage.get('results', {}).items())
+    return out
+
+def write_columns(path, storage, chunkbytes=CHUNKBYTES, overwrite=False,
+                  codec=None, level=compressors.DEFAULT_LEVEL):
+    """ Write storage dictionaries (as ABCSim.allstorage or
+    simstore.StepReader.storage()) to a columnar directory, with chunks
+    compressed by codec (ie 'zlib') at level (1-9) """
+    if codec:
+        compressors.compress('', codec, level) #Fail before writing anything
+    if op.exists(path):
+        if not overwrite:
+            raise ColumnError('%s already exists' % path)
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    steps = _steps_of(storage)
+    layouts, step_layout = [], []
+    flats = []
+    for step in steps:
+        flat = OrderedDict()
+        _flatten({'primary':storage['primary'].get(step, {}),
+                  'results':storage.get('results', {}).get(step, {})}, '', flat)
+        keys = tuple(flat)
+        if keys not in layouts:
+            layouts.append(keys)
+        step_layout.append(layouts.index(keys))
+        flats.append(flat)
+
+    keys = []
+    for layout in layouts:
+        keys.extend(key for key in layout if key not in keys)
+
+    columns = OrderedDict()
+    objects = OrderedDict()
+    for key in keys:
+        values = [flat.get(key) for flat in flats]
+        if all(value is None for value in values):
+            continue #Nested dictionary
+        leaves = [_leaf(value) if key in flat else None
+                  for flat, value in zip(flats, values)]
+        first = leaves[0]
+        if first is not None and all(leaf is not None and
+            leaf[0].dtype == first[0].dtype and leaf[0].shape == first[0].shape
+            and _same_pandas(leaf[1], first[1]) for leaf in leaves):
+            columns[key] = _write_column(path, key, [leaf[0] for leaf in leaves],
+                                         first[1], chunkbytes, codec, level)
+        else:
+            objects[key] = OrderedDict((step, value) for step, flat, value in
+                                       zip(steps, flats, values) if key in flat)
+
+    header = {'version':FORMAT, 'about':storage.get('about', {}),
+              'static':storage.get('static', {}), 'inputs':storage.get('inputs', {}),
+              'steps':steps, 'layouts':layouts, 'step_layout':step_layout,
+              'columns':columns}
+    with open(op.join(path, OBJECTS), 'wb') as f:
+        cPickle.dump(objects, f, cPickle.HIGHEST_PROTOCOL)
+    with open(op.join(path, HEADER), 'wb') as f: #Last, marks the file whole
+        cPickle.dump(header, f, cPickle.HIGHEST_PROTOCOL)
+    return path
+
+def _write_column(path, key, arrays, pandas, chunkbytes, codec, level):
+    dirname = _column_dir(key)
+    os.makedirs(op.join(path, dirname))
+    index = None
+    rows = OrderedDict()
+    for array in arrays:
+        rows.setdefault(content_hash(array), array)
+    if len(rows) < len(arrays):
+        order = dict((digest, i) for i, digest in enumerate(rows))
+        index = np.array([order[content_hash(array)] for array in arrays], dtype=np.int32)
+        arrays = rows.values()
+    per = max(1, chunkbytes // max(arrays[0].nbytes, 1))
+    chunks = []
+    for i, start in enumerate(range(0, len(arrays), per)):
+        stop = min(start + per, len(arrays))
+        block = np.array(arrays[start:stop])
+        if codec:
+            with open(op.join(path, dirname, 'chunk_%s.%s' % (i, codec)), 'wb') as f:
+                f.write(compressors.compress(block.tostring(), codec, level,
+                                             block.dtype.itemsize))
+        else:
+            np.save(op.join(path, dirname, 'chunk_%s.npy' % i), block)
+        chunks.append((start, stop))
+    return {'dir':dirname, 'dtype':arrays[0].dtype.str, 'shape':arrays[0].shape,
+            'chunks':chunks, 'pandas':pandas, 'codec':codec, 'level':level,
+            'index':index}
+
+def convert_store(store, path, **kwds):
+    """ Columnar copy of a streamed simulation (see simstore) """
+    return write_columns(path, StepReader(store).storage(), **kwds)
+
+
+class ColumnReader(object):
+    """ Reads a columnar simulation; only the header is read on opening.
+    Column values are read-only views, memory-mapped if not compressed."""
+
+    def __init__(self, path):
+        if not op.exists(op.join(path, HEADER)):
+            raise ColumnError('%s is not a columnar simulation' % path)
+        self.path = path
+        with open(op.join(path, HEADER), 'rb') as f:
+            header = cPickle.load(f)
+        if header['version'] > FORMAT:
+            raise ColumnError('%s is format %s; this version reads up to %s'
+                              % (path, header['version'], FORMAT))
+        self.about = header['about']
+        self.static = header['static']
+        self.inputs = header['inputs']
+        self.steps = header['steps']
+        self.columns = header['columns']
+        self._layouts = header['layouts']
+        self._step_layout = header['step_layout']
+        self._index = dict((step, i) for i, step in enumerate(self.steps))
+        self._chunks = {}
+        self._decompressed = OrderedDict()
+        self._objects = None
+
+    def __len__(self):
+        return len(self.steps)
+
+    @property
+    def objects(self):
+        if self._objects is None:
+            with open(op.join(self.path, OBJECTS), 'rb') as f:
+                self._objects = cPickle.load(f)
+        return self._objects
+
+    def layout(self, step):
+        """ Flattened keys of step, nested dictionaries included """
+        return self._layouts[self._step_layout[self._index[step]]]
+
+    def keys(self, step=None):
+        """ Flattened leaf keys of step (of the first step by default) """
+        layout = self._layouts[self._step_layout[self._index.get(step, 0)]]
+        return [key for key in layout if key in self.columns or key in self.objects]
+
+    def _chunk(self, key, i):
+        meta = self.columns[key]
+        codec = meta.get('codec')
+        if codec:
+            return self._decompress(key, i)
+        if (key, i) not in self._chunks:
+            self._chunks[key, i] = np.load(op.join(self.path,
+                meta['dir'], 'chunk_%s.npy' % i), mmap_mode='r')
+        return self._chunks[key, i]
+
+    def _decompress(self, key, i):
+        """ Chunk i of a compressed column; the last CACHECHUNKS are kept """
+        if (key, i) in self._decompressed:
+            self._decompressed[key, i] = self._decompressed.pop((key, i))
+            return self._decompressed[key, i]
+        meta = self.columns[key]
+        start, stop = meta['chunks'][i]
+        with open(op.join(self.path, meta['dir'], 'chunk_%s.%s' % (i, meta['codec'])), 'rb') as f:
+            data = compressors.decompress(f.read(), meta['codec'])
+        out = np.frombuffer(data, meta['dtype']).reshape((stop - start,) + tuple(meta['shape']))
+        self._decompressed[key, i] = out
+        while len(self._decompressed) > CACHECHUNKS:
+            self._decompressed.popitem(last=False)
+        return out
+
+    def _locate(self, key, index):
+        """ Value of step number index """
+        rows = self.columns[key].get('index')
+        if rows is not None:
+            index = rows[index]
+        for i, (start, stop) in enumerate(self.columns[key]['chunks']):
+            if start <= index < stop:
+                return self._chunk(key, i)[index - start]
+        raise ColumnError('No step %s in column "%s"' % (index, key))
+
+    def column(self, key, steps=None):
+        """ (steps x leaf shape) array of a column, all steps or those named.
+        A column in one uncompressed chunk comes back memory-mapped,
+        otherwise only the chunks holding steps are read."""
+        if key not in self.columns:
+            raise ColumnError('"%s" is not a column of %s' % (key, self.path))
+        chunks = self.columns[key]['chunks']
+        rows = self.columns[key].get('index')
+        if steps is None:
+            if len(chunks) == 1:
+                out = self._chunk(key, 0)
+            else:
+                out = np.concatenate([self._chunk(key, i) for i in range(len(chunks))])
+            return out if rows is None else out[rows]
+        return np.array([self._locate(key, self._index[step]) for step in steps])
+
+    def _leaf(self, key, value):
+        """ Row of a column as stored: pandas objects rebuilt, 0d as scalars """
+        pandas = self.columns[key]['pandas']
+        if pandas is not None:
+            return _PANDAS[pandas[0]](value, *pandas[1])
+        if value.ndim == 0:
+            return value[()]
+        return value
+
+    def _rows(self, key):
+        """ Row of every step of a column, each chunk read (decompressed)
+        once; uncompressed rows stay memory-mapped """
+        meta = self.columns[key]
+        chunks = [self._chunk(key, i) for i in range(len(meta['chunks']))]
+        rows = meta.get('index')
+        out = []
+        for index in range(len(self.steps)):
+            row = index if rows is None else rows[index]
+            for (start, stop), chunk in zip(meta['chunks'], chunks):
+                if start <= row < stop:
+                    out.append(chunk[row - start])
+                    break
+        return out
+
+    def value(self, key, step):
+        """ Leaf of one step; arrays are memory-mapped views """
+        if key in self.columns:
+            return self._leaf(key, self._locate(key, self._index[step]))
+        try:
+            return self.objects[key][step]
+        except KeyError:
+            if key in self.layout(step):
+                return None #Nested dictionary
+            raise ColumnError('No "%s" in %s of %s' % (key, step, self.path))
+
+    def load_step(self, step, section=None):
+        """ {'primary':..., 'results':...} of one step, or just one of them """
+        if step not in self._index:
+            raise ColumnError('No step "%s" in %s' % (step, self.path))
+        keys = list(self._layouts[self._step_layout[self._index[step]]])
+        if section:
+            keys = [k for k in keys if k.split('/', 1)[0] == section]
+        leaves = set(self.columns) | set(self.objects)
+        out = _unflatten(keys, lambda key: self.value(key, step)
+                         if key in leaves else None)
+        if section:
+            return out.get(section, OrderedDict())
+        return out
+
+    def _section(self, section):
+        """ {step : section} of every step.  Read a column at a time, not a
+        step at a time, so a compressed chunk is decompressed once however
+        many columns there are (the chunk cache only holds CACHECHUNKS)."""
+        inside = lambda key: key.split('/', 1)[0] == section
+        rows = dict((key, self._rows(key)) for key in self.columns if inside(key))
+        out = OrderedDict()
+        for i, step in enumerate(self.steps):
+            def read(key):
+                if key in rows:
+                    return self._leaf(key, rows[key][i])
+                if key in self.objects:
+                    return self.objects[key][step]
+                return None #Nested dictionary
+            keys = [key for key in self.layout(step) if inside(key)]
+            out[step] = _unflatten(keys, read).get(section, OrderedDict())
+        return out
+
+    def primary(self):
+        """ {step : primary} of every step, without reading results """
+        return self._section('primary')
+
+    def results(self):
+        return self._section('results')
+
+    def storage(self):
+        """ All storage dictionaries, as ABCSim.allstorage """
+        out = OrderedDict()
+        out['static'] = self.static
+        out['about'] = self.about
+        out['primary'] = self.primary()
+        out['results'] = self.results()
+        out['inputs'] = self.inputs
+        return out
@@ -7,8 +7,9 @@ Can call the initialization with a pickled filename for faster use (eg):
    print s.results
      ...  
 
-Stores simulation results in a pandas Panel object, with each increment
-being an item, and the state of the system at that point as a dataframe. 
+Primary results are available as one LabeledArray (variable x lambdas x step,
+with the simulation inputs as coordinates of step), see primary_array(), or
+as a pandas Panel (primary_panel()).
 
 The simulated parameter values are stored separately in a dataframe called sim_parms.  
 
@@ -18,6 +19,8 @@ Special methods like list_parms() and parms_to_csv() provide nice formats for re
 
 # Python imports
 import cPickle, re 
+import os.path as op
+import multiprocessing
 #3rd party imports
 from traits.api import *
 from traitsui.api import message
@@ -25,11 +28,16 @@ from pandas import DataFrame, Panel
 import pame.utils as putil
 import numpy as np
 import functools, types
+from collections import OrderedDict
 
 #Local imports
 from handlers import FileOverwriteDialog
 from pame import globalparms
 import customjson
+import simstore
+import simcolumns
+from lazydict import LazyResults
+from labeled import LabeledArray, concat
 import custompp #<--- Custom pretty-print
 import logging
 import config
@@ -92,6 +100,8 @@ class LayerSimParser(HasTraits):
     
     primarypanel = Instance(Panel)
     backend = Enum(['skspec', 'pandas'])
+    
+    _primary_array = Instance(LabeledArray) #Cache of primary_array()
 
     def __init__(self, *args, **kwargs):
         #Initialize traits
@@ -100,6 +110,10 @@ class LayerSimParser(HasTraits):
         # Change results to putil.AttrDict
         self.results = putil.AttrDict(results)
 
+    @on_trait_change('primary, primary_items')
+    def _reset_primary_array(self):
+        self._primary_array = None
+
     def _backend_default(self):
         return config.SIMPARSERBACKEND
 
@@ -148,6 +162,38 @@ class LayerSimParser(HasTraits):
                     )
 
     
+    @classmethod
+    def load_store(cls, path, **traitkwds):
+        """ Initialize from a streamed simulation directory (see simstore).
+        Reads primary and inputs of every step; results are read as they're
+        accessed (see lazydict)."""
+        reader = simstore.StepReader(path)
+        inputs = OrderedDict()
+        for step in reader.steps:
+            for key, value in reader.load_step(step, 'inputs').items():
+                inputs.setdefault(key, []).append(value)
+        return cls(about = reader.about,
+                   static = reader.static,
+                   primary = reader.primary(),
+                   results = LazyResults(reader),
+                   inputs = OrderedDict((k, np.array(v)) for k, v in inputs.items()),
+                   **traitkwds
+                   )
+
+    @classmethod
+    def load_columns(cls, path, **traitkwds):
+        """ Initialize from a columnar simulation (see simcolumns).  Only
+        the header is read; arrays are memory-mapped views into the file and
+        results are read as they're accessed (see lazydict)."""
+        reader = simcolumns.ColumnReader(path)
+        return cls(about = reader.about,
+                   static = reader.static,
+                   primary = reader.primary(),
+                   results = LazyResults(reader),
+                   inputs = reader.inputs,
+                   **traitkwds
+                   )
+
     @classmethod
     def load_pickle(cls, path_or_fileobj, **traitkwds):
         """ Initialize from a pre-serialized instance of  """
@@ -155,6 +201,56 @@ class LayerSimParser(HasTraits):
         newobj = cls(**traitkwds)
         newobj.load(path_or_fileobj) 
         return newobj
+
+    @classmethod
+    def load_many(cls, paths, processes=None, variables=None):
+        """ primary_array() of many saved simulations (any format, see
+        load_simulation) stacked along a new first dimension, run.  Files
+        are read in a pool of processes (default one per cpu, 1 reads them
+        here).  Every run needs the same wavelengths and variables; or give
+        variables, ones every run has.  Runs with fewer steps are padded with
+        NaN; inputs that are the same in every run stay coordinates of step.
+
+           >>> runs = LayerSimParser.load_many(['AuAg1.mpickle', 'AuAg2.mpickle'])
+           >>> runs.sel(variable='A_avg').max('lambdas').values  #(run x step)
+        """
+        paths = list(paths)
+        if not paths:
+            raise SimParserError('No simulation files given')
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        tasks = [(i, path, variables) for i, path in enumerate(paths)]
+
+        arrays, failed = [None]*len(paths), []
+        if processes <= 1 or len(paths) == 1:
+            loaded = map(_load_primary, tasks)
+        else:
+            pool = multiprocessing.Pool(min(processes, len(paths)))
+            try:
+                loaded = pool.map(_load_primary, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        for i, array, error in loaded:
+            arrays[i] = array
+            if error:
+                failed.append('%s (%s)' % (paths[i], error))
+        if failed:
+            raise SimParserError('Could not load: %s' % ', '.join(failed))
+
+        # Check compatibility here so errors name the file
+        first = arrays[0]
+        for path, array in zip(paths[1:], arrays[1:]):
+            lambdas = array.coords['lambdas']
+            if lambdas.shape != first.coords['lambdas'].shape or \
+               not np.allclose(lambdas, first.coords['lambdas']):
+                raise SimParserError('Wavelengths of %s (%s - %s nm, %s points) differ '
+                    'from %s' % (path, lambdas[0], lambdas[-1], len(lambdas), paths[0]))
+            if list(array.coords['variable']) != list(first.coords['variable']):
+                raise SimParserError('Variables of %s %s differ from %s %s; choose '
+                    'common variables' % (path, list(array.coords['variable']),
+                    paths[0], list(first.coords['variable'])))
+        return concat(arrays, 'run', paths, pad='step')
         
             
     def summary(self, style='short'):
@@ -181,9 +277,11 @@ class LayerSimParser(HasTraits):
         # of dict, sometimes dict of scalars, some times mixed scalars/dict
         
 #        if style == 'short':  
+        primary = self.primary_array()
         panel_printout = 'Primary:'
-        panel_printout += '\n\t%s' % self.primary_panel().__repr__().replace('\n', '\n\t')
-        #panel_printout += '\n\t  ".primary_panel()" to access full panel'
+        panel_printout += '\n\t%s' % primary
+        panel_printout += '\n\tvariables: %s' % ', '.join(primary.coords['variable'])
+        #panel_printout += '\n\t  ".primary_array()" to access full array'
         
         input_printout = 'Inputs:'
         for k,v in self.inputs.items():
@@ -217,52 +315,95 @@ class LayerSimParser(HasTraits):
     def promote(self, attr, alias=None):
         """ Takes results attribute of form 'a.b.c' corresponding to 
         'step.results.a.b.c and promotes it for each step into 
-        primary.  Alias is name of attr put into primary.
+        primary.  Alias is name of attr put into primary.  Results loaded
+        from columnar or streamed simulations only read attr of each step.
         """
-        out = []
         if not alias:
             alias = attr 
-        if alias in self.primary:
+        if any(alias in self.primary[step] for step in self.primary):
             raise SimParserError('"%s" already exists in primary, please choose different alias.' % alias)
         for step in self.results:
             try:
                 longattr = '%s.%s' % (step, attr)
                 value = getattr(self.results, longattr)
-            except AttributeError:
-                raise SimParserError('Could not find attribute %s on step %s')
+            except (AttributeError, KeyError):
+                raise SimParserError('Could not find attribute %s on step %s' % (attr, step))
             
             # Just adds it to primary at each step
             self.primary[step].update({alias:value})
+        self._primary_array = None #Nested update, no trait event
             
-    def primary_panel(self, minor_axis=None, prefix=None):
-        """ Returns primary as a Panel if possible, if fails, raises warning
-        and returns as dict.
-        """        
-        primary_of_df = {} #Create a primary of dataframes, so has to convert all values to DF's
-        ignoring = [] # If can't convert a value to df, let user know
+    def primary_array(self):
+        """ primary as one LabeledArray of dims (variable, lambdas, step);
+        inputs are coordinates of step.  Built on first use and cached, and
+        selections/reductions are views of it:
+
+           >>> A = sim.primary_array()
+           >>> A.sel(variable='R_avg', Vfrac=0.3).values  #lambdas
+           >>> A.sel(variable='A_avg').max('lambdas').values  #per step
+        """
+        if self._primary_array is None:
+            self._primary_array = self._build_primary_array()
+        return self._primary_array
 
+    def _build_primary_array(self):
+        steps = putil.stepsort(self.primary.keys())
+        if not steps:
+            raise SimParserError('No steps in primary')
         try:
-            wavelengths = self.static[globalparms.spectralparameters]['lambdas']
+            wavelengths = np.asarray(self.static[globalparms.spectralparameters]['lambdas'])
         except Exception:
-            logging.warning('Could not find lambdas in self.static, primary panel will'
+            logging.warning('Could not find lambdas in self.static, primary array will'
                             ' not be indexed by wavelength...')
             wavelengths = None
 
-        # Try to convert to dataframes.   If fails on one step, should fail on all the steps
-        for step, data in self.primary.items():
-            primary_of_df[step] = DataFrame(data, index=wavelengths)
-        
-        # Panel with as simulation variabless as major axis (ie A_avg, R_0)
-        outpanel = Panel.from_dict(primary_of_df, orient='minor')
-        
-        # Sort Items alphabetically (R_avg, R_0, R_1, T_avg, ...)
-        outpanel = outpanel.reindex_axis(sorted(outpanel.items))  #<-- Sorted items alphabetically
-        
-        # Sort Minor axis with integer suffix (step_0, step_1, step_2)
-        # http://stackoverflow.com/questions/4287209/sort-list-of-strings-by-integer-suffix-in-python
-        outpanel = outpanel.reindex_axis(putil.stepsort(outpanel.minor_axis),
-                                        axis=2, #items axis
-                                        copy=False) #Save memory        
+        variables, ignoring = [], []
+        for var in sorted(set().union(*[self.primary[step].keys() for step in steps])):
+            values = [np.asarray(self.primary[step].get(var, np.nan)) for step in steps]
+            if any(v.dtype.kind not in 'biufc' or v.ndim > 1 for v in values):
+                ignoring.append(var)
+            else:
+                variables.append((var, values))
+        if ignoring:
+            logging.warning('Ignoring non-numeric primary values: %s' % ignoring)
+        if not variables:
+            raise SimParserError('No numeric values in primary')
+
+        if wavelengths is None:
+            nlam = max([len(v) for var, values in variables for v in values if v.ndim] or [1])
+        else:
+            nlam = len(wavelengths)
+        dtype = np.result_type(*[v for var, values in variables for v in values])
+
+        # Allocated once, filled a step at a time; scalars (ie promoted
+        # thicknesses) broadcast along lambdas like they did in the Panel
+        out = np.empty((len(variables), nlam, len(steps)), dtype=dtype)
+        for i, (var, values) in enumerate(variables):
+            for j, value in enumerate(values):
+                try:
+                    out[i, :, j] = value
+                except ValueError:
+                    raise SimParserError('"%s" of %s has shape %s, lambdas are %s'
+                                         % (var, steps[j], value.shape, nlam))
+
+        aux = OrderedDict((key, ('step', value)) for key, value in self.inputs.items()
+                          if np.shape(value) == (len(steps),))
+        return LabeledArray(out, ('variable', 'lambdas', 'step'),
+                            {'variable':np.array([var for var, values in variables]),
+                             'lambdas':wavelengths,
+                             'step':np.array(steps)},
+                            name=self.about.get('Simulation Name', ''), aux=aux)
+
+    def primary_panel(self, minor_axis=None, prefix=None):
+        """ primary_array() as a Panel of items variable, major axis 
+        wavelength and minor axis step.  Copies the array; Panel is gone from
+        newer pandas, use primary_array() for analysis.
+        """        
+        primary = self.primary_array()
+        outpanel = Panel(primary.values.copy(),
+                         items=list(primary.coords['variable']),
+                         major_axis=primary.coords['lambdas'],
+                         minor_axis=list(primary.coords['step']))
 
         # REORIENTATION OF MINOR AXIS LABELS
         if minor_axis:
@@ -291,6 +432,17 @@ class LayerSimParser(HasTraits):
         with open(outfilename, 'wb') as o:
             cPickle.dump(self, o)
 
+    def save_columns(self, outpath, overwrite=False, codec=None, level=6,
+                     depth='heavy'):
+        """ Save as a columnar simulation directory (see simcolumns),
+        compressed by codec (ie 'zlib'), with results saved to depth."""
+        storage = dict(about=self.about, static=self.static,
+                       primary=self.primary, results=self.results,
+                       inputs=self.inputs)
+        return simcolumns.write_columns(outpath, 
+            simcolumns.trim_storage(storage, depth), overwrite=overwrite,
+            codec=codec, level=level)
+
     def load(self, path_or_fileobj):
         """ Load and set self.about, static, primary, results """
         if isinstance(path_or_fileobj, basestring):
@@ -302,3 +454,36 @@ class LayerSimParser(HasTraits):
                                      'results',
                                      'inputs'
                                      ], copy='deep')
+
+
+def _load_primary(task):
+    """ (index, primary_array() of path, error) in a worker process """
+    i, path, variables = task
+    try:
+        array = load_simulation(path).primary_array()
+        if variables is not None:
+            array = array.sel(variable=list(variables))
+    except Exception as exc:
+        return i, None, '%s: %s' % (type(exc).__name__, exc)
+    return i, array, None
+
+def load_simulation(path, **traitkwds):
+    """ LayerSimParser of any saved simulation, by extension: pickled
+    (config.SIMEXT), .json, columnar (config.COLEXT) or streamed
+    (config.STREAMEXT) """
+    loaders = {config.SIMEXT:LayerSimParser.load_pickle,
+               '.json':LayerSimParser.load_json,
+               config.COLEXT:LayerSimParser.load_columns,
+               config.STREAMEXT:LayerSimParser.load_store}
+    ext = op.splitext(path.rstrip('/\\'))[1]
+    if ext not in loaders:
+        raise SimParserError('Unknown simulation format "%s"; extensions are %s'
+                             % (ext, loaders.keys()))
+    return loaders[ext](path, **traitkwds)
+
+def convert_mpickle(inpath, outpath=None, overwrite=False):
+    """ Columnar copy of a pickled LayerSimParser (.mpickle); outpath
+    defaults to inpath with config.COLEXT """
+    if outpath is None:
+        outpath = op.splitext(inpath)[0] + config.COLEXT
+    return LayerSimParser.load_pickle(inpath).save_columns(outpath, overwrite)
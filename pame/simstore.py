@@ -0,0 +1,309 @@
+""" Append-only on-disk store of simulation steps, so long simulations don't
+hold every step in memory.  A store is a directory:
+
+   Layersim.simdir/
+       header.pickle      static and about dictionaries
+       step_0.npz         primary, results and inputs of one step
+       step_1.npz
+       step_2.failed      traceback of a step that raised
+       ...
+       blobs/
+           3f2a...9c.npy  array shared by several steps (see below)
+       plan.pickle        what to run (description, points...), for resuming
+       complete           written by close(); missing if the run was cut short
+
+Each step file is written to a temporary name and renamed once complete, so
+readers only ever see whole steps.  Nested dictionaries are flattened to
+'primary/R_avg' style keys; arrays are stored as is and anything else (Panels,
+strings...) is pickled inside the npz.
+
+Numeric arrays in results of at least DEDUPBYTES are stored once by content
+hash in blobs/ and steps only hold their hash (in __refs__), so layers and materials
+that don't change between steps (substrate, solvent...) aren't written again
+for every step.  Blobs are read memory-mapped.
+
+Since finished steps are on disk as soon as they complete, a store is its own
+checkpoint: engine.resume_simulation runs only the steps it is missing.
+"""
+
+import os
+import os.path as op
+import re
+import hashlib
+import cPickle
+from collections import OrderedDict
+
+import numpy as np
+
+import pame.utils as putil
+
+HEADER = 'header.pickle'
+PLAN = 'plan.pickle'
+COMPLETE = 'complete'
+_SEP = '/'
+_KEYS = '__keys__'
+_REFS = '__refs__'
+BLOBS = 'blobs'
+DEDUPBYTES = 1024 #Arrays at least this big are stored once across steps
+_STEPFILE = re.compile(r'step_(\d+)\.npz$')
+_FAILFILE = re.compile(r'step_(\d+)\.failed$')
+
+class StoreError(Exception):
+    """ """
+
+def _flatten(tree, prefix, out):
+    for key, value in tree.items():
+        key = str(key)
+        if _SEP in key:
+            raise StoreError('Key "%s" cannot contain "%s"' % (key, _SEP))
+        name = prefix + _SEP + key if prefix else key
+        if isinstance(value, dict):
+            out[name] = None #Keeps empty dicts and their order
+            _flatten(value, name, out)
+        else:
+            out[name] = value
+    return out
+
+def _unflatten(keys, values):
+    out = OrderedDict()
+    for name in keys:
+        parts = name.split(_SEP)
+        node = out
+        for part in parts[:-1]:
+            node = node[part]
+        value = values(name)
+        node[parts[-1]] = OrderedDict() if value is None else value
+    return out
+
+def _pack(value):
+    if value is None or isinstance(value, np.ndarray) and value.dtype != object:
+        return value
+    out = np.empty((), dtype=object)
+    out[()] = value
+    return out
+
+def _unpack(value):
+    if value.dtype == object and value.shape == ():
+        return value[()]
+    return value
+
+def content_hash(array):
+    """ Hex digest of an array's dtype, shape and values """
+    array = np.ascontiguousarray(array)
+    digest = hashlib.sha1('%s%s' % (array.dtype.str, array.shape))
+    digest.update(array.data)
+    return digest.hexdigest()
+
+def _shared(name, value):
+    """ Results arrays are shared; primary changes every step anyway """
+    return name.startswith('results' + _SEP) and isinstance(value, np.ndarray) \
+        and value.dtype.kind in 'biufc' and value.nbytes >= DEDUPBYTES
+
+
+class StepWriter(object):
+    """ Writes steps of a simulation as they complete.  Holds no step data. """
+
+    def __init__(self, path, static=None, about=None, overwrite=False):
+        self.path = path
+        if op.exists(path):
+            if not overwrite and os.listdir(path):
+                raise StoreError('Simulation store %s already exists' % path)
+        else:
+            os.makedirs(path)
+        self.steps = 0
+        self._blobs = set()
+        self.write_header(static or {}, about or {})
+
+    @classmethod
+    def reopen(cls, path):
+        """ Writer adding to an existing store (eg resuming) """
+        if not op.exists(op.join(path, HEADER)):
+            raise StoreError('%s is not a simulation store' % path)
+        writer = cls.__new__(cls)
+        writer.path = path
+        writer.steps = 0
+        blobs = op.join(path, BLOBS)
+        writer._blobs = set(name[:-len('.npy')] for name in os.listdir(blobs)
+                            if name.endswith('.npy')) if op.exists(blobs) else set()
+        if op.exists(op.join(path, COMPLETE)):
+            os.remove(op.join(path, COMPLETE))
+        return writer
+
+    def write_header(self, static, about):
+        self._write(HEADER, lambda f: cPickle.dump(
+            {'static':static, 'about':about}, f, cPickle.HIGHEST_PROTOCOL))
+
+    def write_plan(self, plan):
+        """ Everything needed to rerun steps (see engine.collect_points) """
+        self._write(PLAN, lambda f: cPickle.dump(plan, f, cPickle.HIGHEST_PROTOCOL))
+
+    def _write(self, name, write):
+        """ Write to temporary file then rename, so name is always whole """
+        tmp = op.join(self.path, '.%s.tmp' % name)
+        with open(tmp, 'wb') as f:
+            write(f)
+        os.rename(tmp, op.join(self.path, name))
+
+    def append(self, index, primary, results, inputs=None):
+        """ Write step number index (ie 'step_3' for index 3).  Steps may
+        arrive in any order."""
+        flat = OrderedDict()
+        _flatten({'primary':primary, 'results':results,
+                  'inputs':inputs or {}}, '', flat)
+        arrays = {}
+        refs = []
+        for name, value in flat.items():
+            if _shared(name, value):
+                refs.append((name, self._write_blob(value)))
+            elif value is not None:
+                arrays[name] = _pack(value)
+        arrays[_KEYS] = np.array(flat.keys())
+        if refs:
+            arrays[_REFS] = np.array(refs)
+        self._write('step_%s.npz' % index, lambda f: np.savez(f, **arrays))
+        self.steps += 1
+        failed = op.join(self.path, 'step_%s.failed' % index)
+        if op.exists(failed):
+            os.remove(failed)
+
+    def _write_blob(self, array):
+        """ Hash of array, written to blobs/ unless a step already did """
+        digest = content_hash(array)
+        if digest not in self._blobs:
+            blobs = op.join(self.path, BLOBS)
+            if not op.exists(blobs):
+                os.makedirs(blobs)
+            tmp = op.join(blobs, '.%s.tmp' % digest)
+            with open(tmp, 'wb') as f:
+                np.save(f, array)
+            os.rename(tmp, op.join(blobs, '%s.npy' % digest))
+            self._blobs.add(digest)
+        return digest
+
+    def fail(self, index, message):
+        """ Record that step index raised (message is the traceback) """
+        self._write('step_%s.failed' % index, lambda f: f.write(message))
+
+    def close(self):
+        self._write(COMPLETE, lambda f: f.write(str(self.steps)))
+
+
+class StepReader(object):
+    """ Reads a store written by StepWriter; steps are loaded on request."""
+
+    def __init__(self, path):
+        if not op.exists(op.join(path, HEADER)):
+            raise StoreError('%s is not a simulation store' % path)
+        self.path = path
+        with open(op.join(path, HEADER), 'rb') as f:
+            header = cPickle.load(f)
+        self.static = header['static']
+        self.about = header['about']
+
+    @property
+    def complete(self):
+        return op.exists(op.join(self.path, COMPLETE))
+
+    @property
+    def plan(self):
+        """ Plan written by the engine, None if the store has none """
+        if not op.exists(op.join(self.path, PLAN)):
+            return None
+        with open(op.join(self.path, PLAN), 'rb') as f:
+            return cPickle.load(f)
+
+    def _indices(self, pattern):
+        return sorted(int(pattern.match(name).group(1)) for name in 
+                      os.listdir(self.path) if pattern.match(name))
+
+    @property
+    def finished(self):
+        """ Indices of steps on disk """
+        return self._indices(_STEPFILE)
+
+    @property
+    def failed(self):
+        """ {index : traceback} of steps that raised """
+        out = OrderedDict()
+        for idx in self._indices(_FAILFILE):
+            with open(op.join(self.path, 'step_%s.failed' % idx)) as f:
+                out[idx] = f.read()
+        return out
+
+    def unfinished(self, steps):
+        """ Indices in range(steps) with no step on disk (failed or not run) """
+        done = set(self.finished)
+        return [i for i in range(steps) if i not in done]
+
+    @property
+    def steps(self):
+        """ Step names on disk, in step order """
+        names = [name[:-len('.npz')] for name in os.listdir(self.path)
+                 if _STEPFILE.match(name)]
+        return putil.stepsort(names)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def _open(self, step):
+        try:
+            return np.load(op.join(self.path, '%s.npz' % step), allow_pickle=True)
+        except IOError:
+            raise StoreError('No step "%s" in %s' % (step, self.path))
+
+    def load_step(self, step, section=None):
+        """ {'primary':..., 'results':..., 'inputs':...} of one step, or just
+        one of them with section (the others aren't read from disk)."""
+        with self._open(step) as npz:
+            keys = [str(k) for k in npz[_KEYS]]
+            if section:
+                keys = [k for k in keys if k.split(_SEP, 1)[0] == section]
+            refs = self._refs(npz)
+            out = _unflatten(keys, lambda name: self._read(npz, refs, name))
+        return out[section] if section else out
+
+    def _refs(self, npz):
+        if _REFS not in npz.files:
+            return {}
+        return dict((str(name), str(digest)) for name, digest in npz[_REFS])
+
+    def _read(self, npz, refs, name):
+        if name in refs:
+            return np.load(op.join(self.path, BLOBS, '%s.npy' % refs[name]),
+                           mmap_mode='r')
+        return _unpack(npz[name]) if name in npz.files else None
+
+    def layout(self, step):
+        """ Flattened keys of step, nested dictionaries included """
+        with self._open(step) as npz:
+            return [str(k) for k in npz[_KEYS]]
+
+    def value(self, key, step):
+        """ One leaf of step (None for a nested dictionary), read on its own """
+        with self._open(step) as npz:
+            return self._read(npz, self._refs(npz), key)
+
+    def primary(self):
+        """ {step : primary} of every step, without reading results """
+        return OrderedDict((step, self.load_step(step, 'primary'))
+                           for step in self.steps)
+
+    def storage(self):
+        """ All storage dictionaries, as ABCSim.allstorage (loads every step) """
+        primary = OrderedDict()
+        results = OrderedDict()
+        inputs = OrderedDict()
+        for step in self.steps:
+            data = self.load_step(step)
+            primary[step] = data['primary']
+            results[step] = data['results']
+            for path, value in data['inputs'].items():
+                inputs.setdefault(path, []).append(value)
+
+        out = OrderedDict()
+        out['static'] = self.static
+        out['about'] = self.about
+        out['primary'] = primary
+        out['results'] = results
+        out['inputs'] = OrderedDict((k, np.array(v)) for k, v in inputs.items())
+        return out
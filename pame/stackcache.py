@@ -0,0 +1,164 @@
+""" On-disk cache of optical stacks (the transfer matrix results), keyed by a
+hash of everything they depend on: every layer's index of refraction,
+thicknesses, wavelengths, angles and polarization mode.  Re-running a sweep
+with one extra step, or a different output selection, only solves the stacks
+it hasn't seen, in this session or earlier ones.
+
+   >>> cache = open_cache('~/.pame_stackcache', maxbytes=256*2**20)
+   >>> stack = cache.optical_stack(ns, ds, lambdas, angles, Mode, compute)
+   >>> cache.stats()
+   {'hits': 12, 'misses': 3, 'hit_rate': 0.8, ...}
+
+Entries are pickled Panels, one file per key; least recently used files are
+deleted once the directory is over maxbytes.  Workers of a process pool each
+open the cache themselves; their counts are added into COUNTS of the parent
+(see engine.iter_points).
+"""
+
+import os
+import os.path as op
+import hashlib
+import cPickle
+
+import numpy as np
+
+MAXBYTES = 256 * 2**20
+EXT = '.pstack'
+_VERSION = 'pame-stack-1' #Change if the optical stack contents change
+
+# Counts of every cache in this process (and workers reported to it)
+COUNTS = {'hits':0, 'misses':0, 'stores':0, 'evictions':0}
+
+def stack_key(ns, ds, lambdas, angles, Mode):
+    """ Hex digest of an optical stack's inputs """
+    digest = hashlib.sha1(_VERSION)
+    digest.update(str(Mode))
+    for array in (ns, ds, lambdas, angles):
+        array = np.ascontiguousarray(array)
+        digest.update('%s%s' % (array.dtype.str, array.shape))
+        digest.update(array.tostring())
+    return digest.hexdigest()
+
+def add_counts(counts):
+    for name, value in counts.items():
+        COUNTS[name] += value
+
+
+class StackCache(object):
+    """ Directory of optical stacks with least recently used eviction """
+
+    def __init__(self, directory, maxbytes=MAXBYTES):
+        self.directory = op.abspath(op.expanduser(directory))
+        self.maxbytes = maxbytes
+        if not op.exists(self.directory):
+            os.makedirs(self.directory)
+        self.counts = dict((name, 0) for name in COUNTS)
+        self._index = None #{filename : [last use, bytes]}
+
+    def _count(self, name):
+        self.counts[name] += 1
+        COUNTS[name] += 1
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = {}
+            for name in os.listdir(self.directory):
+                if name.endswith(EXT):
+                    try:
+                        stat = os.stat(op.join(self.directory, name))
+                    except OSError:
+                        continue #Just evicted
+                    self._index[name] = [stat.st_atime, stat.st_size]
+        return self._index
+
+    @property
+    def nbytes(self):
+        return sum(size for used, size in self.index.values())
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, key):
+        """ Cached optical stack or None """
+        name = key + EXT
+        path = op.join(self.directory, name)
+        try:
+            with open(path, 'rb') as f:
+                stack = cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            self._count('misses')
+            return None
+        self._count('hits')
+        try:
+            os.utime(path, None) #Recently used
+            stat = os.stat(path)
+            self.index[name] = [stat.st_atime, stat.st_size]
+        except OSError:
+            self.index.pop(name, None) #Evicted by another process
+        return stack
+
+    def put(self, key, stack):
+        name = key + EXT
+        path = op.join(self.directory, name)
+        tmp = op.join(self.directory, '.%s.%s.tmp' % (name, os.getpid()))
+        with open(tmp, 'wb') as f:
+            cPickle.dump(stack, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+        self._count('stores')
+        stat = os.stat(path)
+        self.index[name] = [stat.st_atime, stat.st_size]
+        if self.nbytes > self.maxbytes:
+            self.evict()
+
+    def evict(self):
+        """ Delete least recently used entries until under maxbytes """
+        self._index = None #Rescan, other processes may have added entries
+        total = self.nbytes
+        for name in sorted(self.index, key=lambda name: self.index[name][0]):
+            if total <= self.maxbytes:
+                break
+            total -= self.index.pop(name)[1]
+            try:
+                os.remove(op.join(self.directory, name))
+            except OSError:
+                pass #Another process got it first
+            self._count('evictions')
+
+    def optical_stack(self, ns, ds, lambdas, angles, Mode, compute):
+        """ Cached stack, or compute(ns, ds, lambdas, angles, Mode) stored """
+        key = stack_key(ns, ds, lambdas, angles, Mode)
+        stack = self.get(key)
+        if stack is None:
+            stack = compute(ns, ds, lambdas, angles, Mode)
+            self.put(key, stack)
+        return stack
+
+    def clear(self):
+        for name in list(self.index):
+            try:
+                os.remove(op.join(self.directory, name))
+            except OSError:
+                pass
+        self._index = {}
+
+    def stats(self):
+        """ Counts of this cache, and entries/bytes of the directory """
+        self._index = None
+        out = dict(self.counts)
+        lookups = out['hits'] + out['misses']
+        out['hit_rate'] = out['hits'] / float(lookups) if lookups else 0.0
+        out['entries'] = len(self)
+        out['bytes'] = self.nbytes
+        return out
+
+
+_OPEN = {}
+
+def open_cache(directory, maxbytes=MAXBYTES):
+    """ StackCache shared by everything in this process using directory """
+    key = op.abspath(op.expanduser(directory))
+    if key not in _OPEN:
+        _OPEN[key] = StackCache(directory, maxbytes)
+    _OPEN[key].maxbytes = maxbytes
+    return _OPEN[key]
@@ -0,0 +1,272 @@
+""" Multi-dimensional parameter sweeps on the headless engine.  Unlike the
+lockstep simulation (every variable stepped together), a sweep covers the
+space of several variables:
+
+   Grid             Cartesian product of each variable's values
+   Latin hypercube  N space-filling samples within (low, high) of each variable
+   Sobol            N quasi-random samples (needs scipy >= 1.7 for scipy.stats.qmc)
+   Adaptive         lockstep from (start, end), refined where outputs change
+                    fastest (see adaptive_sweep)
+
+Points are scheduled so materials are only re-evaluated when a material
+parameter changes (see engine.schedule), ie a sweep over Vfrac and layer d
+evaluates the mixing once per Vfrac and only the transfer matrix per d.
+
+Each primary quantity comes back as a LabeledArray; for a grid its dims are
+the variables (then lambdas), for sampled sweeps a 'sample' dimension with
+the sampled values of each variable in out['inputs'].
+"""
+
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+
+import engine
+import simstore
+from labeled import LabeledArray
+
+SOBOL_INSTALLED = True
+try:
+    from scipy.stats import qmc
+except ImportError:
+    SOBOL_INSTALLED = False
+
+SWEEP_MODES = ('Grid', 'Latin hypercube', 'Sobol', 'Adaptive')
+
+def available_modes():
+    """ SWEEP_MODES that can run here (Sobol needs scipy.stats.qmc) """
+    return tuple(mode for mode in SWEEP_MODES 
+                 if mode != 'Sobol' or SOBOL_INSTALLED)
+
+# How adaptive_sweep compares neighbouring steps of an output spectrum
+ADAPTIVE_MEASURES = ('Spectrum', 'Dip', 'Dip wavelength', 'Peak', 'Peak wavelength')
+
+class SweepError(Exception):
+    """ """
+
+def latin_hypercube(bounds, samples, seed=None):
+    """ samples x len(bounds) points, one in each of samples equal strata of
+    every variable (bounds is [(low, high), ...]) """
+    rng = np.random.RandomState(seed)
+    k = len(bounds)
+    strata = np.array([rng.permutation(samples) for _ in range(k)]).T
+    unit = (strata + rng.rand(samples, k)) / samples
+    return _scale(unit, bounds)
+
+def sobol(bounds, samples, seed=None):
+    """ Scrambled Sobol points (samples should be a power of 2) """
+    if not SOBOL_INSTALLED:
+        raise SweepError('Sobol sweeps need scipy.stats.qmc (scipy >= 1.7); '
+                         'use "Latin hypercube" instead')
+    unit = qmc.Sobol(d=len(bounds), scramble=True, seed=seed).random(samples)
+    return _scale(unit, bounds)
+
+def _scale(unit, bounds):
+    low = np.array([b[0] for b in bounds], dtype=float)
+    high = np.array([b[1] for b in bounds], dtype=float)
+    return low + unit * (high - low)
+
+def labeled_primary(primary, shape, dims, coords, lambdas):
+    """ {quantity : LabeledArray} stacking steps of primary (in C order of
+    shape).  Spectral quantities get a trailing lambdas dimension."""
+    steps = primary.values()
+    out = OrderedDict()
+    for key in steps[0]:
+        values = np.array([np.asarray(step[key]) for step in steps])
+        extra = values.shape[1:]
+        values = values.reshape(tuple(shape) + extra)
+        if extra == lambdas.shape:
+            extra_dims, extra_coords = ('lambdas',), {'lambdas':lambdas}
+        else:
+            extra_dims, extra_coords = tuple('dim_%s' % i for i in range(len(extra))), {}
+        out[key] = LabeledArray(values, tuple(dims) + extra_dims,
+                                dict(coords, **extra_coords), name=key)
+    return out
+
+def run_sweep(description, axes, mode='Grid', samples=None, seed=None,
+              processes=1, store=None, rename=None, **storage):
+    """ Sweep over axes ({path : values} for Grid, {path : (low, high)} for
+    sampled modes).  Returns the run_simulation storage dictionaries (steps
+    in C order of the grid, or sample order) plus 'labeled', the primary
+    quantities as LabeledArrays.  With store, steps are streamed to disk as
+    in engine.run_simulation (labeled still holds the primary quantities,
+    once every step has succeeded; see resume_sweep).  rename is {path :
+    name} as in run_simulation, and also renames grid dimensions."""
+    rename = rename or {}
+    axes = OrderedDict((path, np.asarray(values)) for path, values in axes.items())
+    paths = list(axes)
+    if not paths:
+        raise SweepError('Sweep needs at least one variable')
+
+    if mode == 'Grid':
+        points = list(itertools.product(*axes.values()))
+        shape = [len(values) for values in axes.values()]
+        dims = [rename.get(path, path) for path in paths]
+        coords = dict(zip(dims, axes.values()))
+    elif mode in ('Latin hypercube', 'Sobol'):
+        if not samples:
+            raise SweepError('%s sweep needs the number of samples' % mode)
+        bounds = [tuple(values) for values in axes.values()]
+        if any(len(b) != 2 for b in bounds):
+            raise SweepError('%s sweep needs (low, high) for each variable' % mode)
+        sampler = latin_hypercube if mode == 'Latin hypercube' else sobol
+        points = [tuple(p) for p in sampler(bounds, samples, seed)]
+        shape = [len(points)]
+        dims, coords = ['sample'], {}
+    elif mode == 'Adaptive':
+        raise SweepError('Use adaptive_sweep for adaptive sweeps')
+    else:
+        raise SweepError('Unknown sweep mode "%s"; valid modes are %s'
+                         % (mode, SWEEP_MODES))
+
+    static = engine.static_storage(description)
+    lambdas = static[engine.globalparms.spectralparameters]['lambdas']
+
+    allout = OrderedDict()
+    allout['static'] = static
+    allout['about'] = OrderedDict([('Steps', len(points)), ('Sweep', mode),
+                                   ('Shape', shape), ('Processes', processes),
+                                   ('Storage', storage)])
+    sweep = dict(shape=shape, dims=dims, coords=coords)
+    counts = dict(engine.stackcache.COUNTS)
+    allout['primary'], allout['results'] = engine.collect_points(description,
+        paths, points, processes, store, static, allout['about'], rename,
+        plan={'sweep':sweep}, **storage)
+    if storage.get('cache'):
+        allout['about']['Stack cache'] = engine.cache_counts(counts)
+    allout['inputs'] = OrderedDict((rename.get(path, path), 
+                                    np.array([p[j] for p in points]))
+                                   for j, path in enumerate(paths))
+    if store is None:
+        allout['labeled'] = labeled_primary(allout['primary'], lambdas=lambdas,
+                                            **sweep)
+        return allout
+    allout['store'] = store
+    return _stored_labeled(allout)
+
+def _stored_labeled(allout):
+    """ Adds 'failed' and 'labeled' (once all steps are done) of a streamed
+    sweep """
+    reader = simstore.StepReader(allout['store'])
+    allout['failed'] = list(reader.failed)
+    allout['labeled'] = OrderedDict()
+    if not reader.unfinished(len(reader.plan['points'])):
+        lambdas = reader.static[engine.globalparms.spectralparameters]['lambdas']
+        allout['labeled'] = labeled_primary(reader.primary(), lambdas=lambdas,
+                                            **reader.plan['sweep'])
+    return allout
+
+def resume_sweep(store, processes=None, failed_only=False):
+    """ engine.resume_simulation for a streamed sweep, with 'labeled' """
+    if 'sweep' not in (simstore.StepReader(store).plan or {}):
+        raise SweepError('%s is not a streamed sweep' % store)
+    return _stored_labeled(engine.resume_simulation(store, processes, failed_only))
+
+
+def _features(primary, outputs, measure, lambdas):
+    """ 1d array per step that adaptive_sweep compares between steps """
+    out = []
+    for key in outputs:
+        try:
+            values = np.asarray(primary[key], dtype=float)
+        except KeyError:
+            raise SweepError('Adaptive output "%s" not in primary (%s)'
+                             % (key, ', '.join(primary)))
+        if measure == 'Spectrum' or not values.ndim:
+            out.append(values.ravel())
+        elif measure == 'Dip':
+            out.append([values.min()])
+        elif measure == 'Peak':
+            out.append([values.max()])
+        elif measure == 'Dip wavelength':
+            out.append([lambdas[values.argmin()]])
+        elif measure == 'Peak wavelength':
+            out.append([lambdas[values.argmax()]])
+        else:
+            raise SweepError('Unknown measure "%s"; valid measures are %s'
+                             % (measure, ADAPTIVE_MEASURES))
+    return np.concatenate(out)
+
+def adaptive_sweep(description, axes, outputs=('R_avg',), measure='Spectrum',
+                   tol=0.01, budget=50, initial=5, min_spacing=1e-3,
+                   processes=1, rename=None, **storage):
+    """ Lockstep sweep of axes ({path : (start, end)}, variables move
+    together as in run_simulation) that starts with initial evenly spaced
+    steps, then repeatedly bisects the intervals where outputs (primary
+    keys, after rename) change by more than tol between neighbouring steps,
+    largest change first, until no interval exceeds tol or budget steps
+    have run.  Intervals are not split below min_spacing (fraction of the
+    range).
+
+    measure is how neighbours are compared (ADAPTIVE_MEASURES): the whole
+    spectrum (max difference), the value or wavelength of its dip/peak.
+    Steps come back sorted by input, with the actual values in 'inputs' and
+    the measured change to the next step in about['Changes']."""
+    rename = rename or {}
+    axes = OrderedDict(axes)
+    paths = list(axes)
+    if not paths:
+        raise SweepError('Sweep needs at least one variable')
+    if any(len(bounds) != 2 for bounds in axes.values()):
+        raise SweepError('Adaptive sweep needs (start, end) for each variable')
+    if budget < initial or initial < 2:
+        raise SweepError('Adaptive sweep needs 2 <= initial (%s) <= budget (%s)'
+                         % (initial, budget))
+    if measure not in ADAPTIVE_MEASURES:
+        raise SweepError('Unknown measure "%s"; valid measures are %s'
+                         % (measure, ADAPTIVE_MEASURES))
+
+    start = np.array([bounds[0] for bounds in axes.values()], dtype=float)
+    end = np.array([bounds[1] for bounds in axes.values()], dtype=float)
+    static = engine.static_storage(description)
+    lambdas = static[engine.globalparms.spectralparameters]['lambdas']
+
+    steps = {} #t (fraction of range) : (primary, results)
+    counts = dict(engine.stackcache.COUNTS)
+    features = {}
+    def evaluate(ts):
+        points = [tuple(start + t*(end - start)) for t in ts]
+        for t, (primary, results) in zip(ts, engine.run_points(
+                description, paths, points, processes, **storage)):
+            primary = engine.rename_keys(primary, rename)
+            steps[t] = (primary, results)
+            features[t] = _features(primary, outputs, measure, lambdas)
+
+    evaluate(list(np.linspace(0.0, 1.0, initial)))
+    while len(steps) < budget:
+        ts = sorted(steps)
+        changes = [(np.abs(features[b] - features[a]).max(), a, b)
+                   for a, b in zip(ts[:-1], ts[1:])]
+        split = sorted([c for c in changes if c[0] > tol and c[2] - c[1] > min_spacing],
+                       reverse=True)
+        if not split:
+            break
+        evaluate([(a + b) / 2.0 for change, a, b in split[:budget - len(steps)]])
+
+    ts = sorted(steps)
+    changes = [np.abs(features[b] - features[a]).max() for a, b in zip(ts[:-1], ts[1:])]
+    primary = OrderedDict(('step_%s' % i, steps[t][0]) for i, t in enumerate(ts))
+    values = [start + t*(end - start) for t in ts]
+
+    allout = OrderedDict()
+    allout['static'] = static
+    allout['about'] = OrderedDict([('Steps', len(ts)), ('Sweep', 'Adaptive'),
+        ('Outputs', list(outputs)), ('Measure', measure), ('Tolerance', tol),
+        ('Budget', budget), ('Changes', changes), ('Processes', processes),
+        ('Storage', storage)])
+    if storage.get('cache'):
+        allout['about']['Stack cache'] = engine.cache_counts(counts)
+    allout['primary'] = primary
+    allout['results'] = OrderedDict(('step_%s' % i, steps[t][1]) for i, t in enumerate(ts))
+    allout['inputs'] = OrderedDict((rename.get(path, path), np.array([v[j] for v in values]))
+                                   for j, path in enumerate(paths))
+
+    # One variable is its own axis; several (lockstep) share a step axis
+    if len(paths) == 1:
+        dims = [rename.get(paths[0], paths[0])]
+        coords = {dims[0]: allout['inputs'][dims[0]]}
+    else:
+        dims, coords = ['step'], {}
+    allout['labeled'] = labeled_primary(primary, [len(ts)], dims, coords, lambdas)
+    return allout
@@ -0,0 +1,17 @@
+""" Tests of the headless modules (engine, sweeps, simstore...); run with
+
+   python -m unittest discover pame/tests
+
+Modules that need the GUI (chaco, matplotlib) aren't tested here.
+"""
+
+def description(xpoints=20):
+    """ Small three layer stack: glass, a 30nm composite film, water """
+    return {'spectral':{'xstart':400.0, 'xend':700.0, 'xpoints':xpoints},
+            'angles':{'angles':[0.5, 5.5, 10.5]},
+            'stack':[{'name':'Substrate', 'd':'semi-infinite',
+                      'material':{'model':'Sellmeir'}},
+                     {'name':'Film', 'd':30.0,
+                      'material':{'model':'CompositeMaterial', 'Vfrac':0.1}},
+                     {'name':'Solvent', 'd':'semi-infinite',
+                      'material':{'model':'Dispwater'}}]}
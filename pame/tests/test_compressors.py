@@ -0,0 +1,31 @@
+import unittest
+
+import numpy as np
+
+from pame import compressors
+
+
+class TestCompressors(unittest.TestCase):
+
+    def test_round_trip(self):
+        array = np.sin(np.linspace(0, 10, 1000)) * (1 + 0j)
+        self.assertIn('zlib', compressors.available())
+        for codec in compressors.available():
+            for level in (1, 9):
+                data = compressors.compress(array.tostring(), codec, level,
+                                            array.dtype.itemsize)
+                self.assertTrue(len(data) < array.nbytes)
+                out = np.frombuffer(compressors.decompress(data, codec), array.dtype)
+                np.testing.assert_array_equal(out, array)
+
+    def test_errors(self):
+        self.assertRaises(compressors.CompressionError, compressors.compress, 'x', 'rar')
+        self.assertRaises(compressors.CompressionError, compressors.compress, 'x', 'zlib', 0)
+        missing = [name for name in compressors.CODECS
+                   if name not in compressors.available()]
+        for name in missing:
+            self.assertRaises(compressors.CompressionError, compressors.compress, 'x', name)
+
+
+if __name__ == '__main__':
+    unittest.main()
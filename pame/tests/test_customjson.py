@@ -0,0 +1,77 @@
+import json
+import os
+import os.path as op
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from pame import customjson
+
+DATA = {'primary':{'R_avg':np.linspace(0, 1, 7),
+                   'earray':np.arange(5) * (1 + 2j),
+                   'empty':np.zeros(0),
+                   'grid':np.arange(12, dtype=np.int32).reshape(3, 4)[:, ::2]},
+        'name':'test', 'n':np.complex128(1 + 1j)}
+
+
+class TestCustomJson(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = op.join(self.tmp, 'sim.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def assertData(self, out):
+        self.assertEqual(out['name'], 'test')
+        self.assertEqual(complex(out['n']), 1 + 1j)
+        for key, array in DATA['primary'].items():
+            np.testing.assert_array_equal(out['primary'][key], array)
+            self.assertEqual(out['primary'][key].dtype, array.dtype)
+
+    def test_base64(self):
+        self.assertData(customjson.loads(customjson.dumps(DATA)))
+
+    def test_sidecar(self):
+        with open(self.path, 'w') as f:
+            customjson.dump(DATA, f, sidecar=True)
+        self.assertTrue(op.exists(self.path + customjson.SIDECAREXT))
+        with open(self.path) as f:
+            refs = json.load(f)['primary']
+        for ref in refs.values():
+            self.assertEqual(ref['__ndarray_ref__'] % customjson._ALIGN, 0)
+            self.assertEqual(ref['file'], 'sim.json' + customjson.SIDECAREXT)
+
+        with open(self.path) as f:
+            out = customjson.load(f)
+        self.assertData(out)
+        self.assertIsInstance(out['primary']['R_avg'], np.memmap)
+        self.assertFalse(out['primary']['R_avg'].flags.writeable)
+        with open(self.path) as f:
+            out = customjson.load(f, mmap=False)
+        self.assertData(out)
+        self.assertNotIsInstance(out['primary']['R_avg'], np.memmap)
+
+    def test_moved(self):
+        with open(self.path, 'w') as f:
+            customjson.dump(DATA, f, sidecar=True)
+        moved = op.join(self.tmp, 'moved')
+        os.makedirs(moved)
+        for name in ('sim.json', 'sim.json' + customjson.SIDECAREXT):
+            os.rename(op.join(self.tmp, name), op.join(moved, name))
+        with open(op.join(moved, 'sim.json')) as f:
+            self.assertData(customjson.load(f, mmap=False))
+
+    def test_missing_sidecar(self):
+        with open(self.path, 'w') as f:
+            customjson.dump(DATA, f, sidecar=True)
+        os.remove(self.path + customjson.SIDECAREXT)
+        with open(self.path) as f:
+            self.assertRaises(customjson.CustomJsonError, customjson.load, f)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from pame import dataflow
+
+
+class TestGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.inputs = {'a':np.arange(3.0), 'b':1.0, 'c':2.0}
+        graph = dataflow.Graph()
+        graph.source('a', lambda: self.inputs['a'], key=lambda: self.inputs['a'])
+        graph.source('b', lambda: self.inputs['b'], key=lambda: self.inputs['b'])
+        graph.source('c', lambda: self.inputs['c']) #Only re-read on invalidate
+        graph.node('ab', lambda a, b: a * b, ['a', 'b'])
+        graph.node('total', lambda ab, c: ab.sum() + c, ['ab', 'c'])
+        self.graph = graph
+
+    def test_cached(self):
+        self.assertEqual(self.graph.value('total'), 5.0)
+        self.assertEqual(self.graph.value('total'), 5.0)
+        self.assertEqual(self.graph.stats(), {'a':1, 'b':1, 'c':1, 'ab':1, 'total':1})
+
+    def test_key_change(self):
+        self.graph.value('total')
+        self.inputs['b'] = 2.0
+        self.assertEqual(self.graph.value('total'), 8.0)
+        stats = self.graph.stats()
+        self.assertEqual((stats['a'], stats['b'], stats['c']), (1, 2, 1))
+        self.assertEqual((stats['ab'], stats['total']), (2, 2))
+
+        # New array, same values: nothing recomputed
+        self.inputs['a'] = np.arange(3.0)
+        self.graph.value('total')
+        self.assertEqual(self.graph.stats()['ab'], 2)
+
+    def test_invalidate(self):
+        self.graph.value('total')
+        self.inputs['c'] = 10.0
+        self.assertEqual(self.graph.value('total'), 5.0) #c has no key
+        self.graph.invalidate('c')
+        self.assertEqual(self.graph.value('total'), 13.0)
+        self.assertEqual(self.graph.stats()['ab'], 1)
+
+    def test_errors(self):
+        self.assertRaises(dataflow.DataflowError, self.graph.source, 'a', list)
+        self.assertRaises(dataflow.DataflowError, self.graph.node, 'x',
+                          lambda y: y, ['y'])
+
+    def test_same(self):
+        a = np.arange(3)
+        self.assertTrue(dataflow.same(a, a.copy()))
+        self.assertFalse(dataflow.same(a, a[:2]))
+        self.assertTrue(dataflow.same((1, a), [1, a.copy()]))
+        self.assertFalse(dataflow.same('S', 'P'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import os.path as op
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from pame import engine, simstore
+from pame.tests import description
+
+PATHS = ['layer1.d', 'material1.Vfrac']
+POINTS = [(d, vfrac) for vfrac in (0.1, 0.3) for d in (10.0, 20.0, 40.0)]
+
+
+class TestEvaluateStep(unittest.TestCase):
+
+    def test_primary_keys(self):
+        primary, results = engine.evaluate_step(description(), ('R', 'kz'), 'Both')
+        self.assertEqual(primary.keys(),
+            ['R_avg', 'kz_L0_avg', 'kz_L1_avg', 'kz_L2_avg'] +
+            ['R_%.2f' % angle for angle in (0.5, 5.5, 10.5)] +
+            ['kz_L%s_%.2f' % (layer, angle) for layer in range(3)
+                                            for angle in (0.5, 5.5, 10.5)])
+        self.assertEqual(len(primary['R_avg']), 20)
+
+    def test_output_optics(self):
+        outputs = engine.output_optics(description())
+        self.assertEqual(outputs['R_avg'], ('R', 'Average'))
+        self.assertEqual(outputs['kz_L1_avg'], ('kz', 'Average'))
+        self.assertEqual(outputs['r_amp_5.50'], ('r_amp', 'Not Averaged'))
+        self.assertNotIn('R_5.00', outputs)
+
+    def test_values(self):
+        d = description()
+        self.assertEqual(engine.get_value(d, 'layer1.d'), 30.0)
+        self.assertEqual(engine.get_value(d, 'material1.K'), 0.0) #Model default
+        engine.set_value(d, 'material1.Vfrac', 0.2)
+        self.assertEqual(d['stack'][1]['material']['Vfrac'], 0.2)
+        self.assertRaises(engine.EngineError, engine.set_value, d, 'material0.Vfrac', 0.2)
+        self.assertRaises(engine.EngineError, engine.get_value, d, 'layer5.d')
+
+
+class TestRunPoints(unittest.TestCase):
+
+    def expected(self):
+        out = []
+        for point in POINTS:
+            d = description()
+            for path, value in zip(PATHS, point):
+                engine.set_value(d, path, value)
+            out.append(engine.evaluate_step(d)[0])
+        return out
+
+    def assertSteps(self, steps, expected):
+        self.assertEqual(len(steps), len(expected))
+        for (primary, results), other in zip(steps, expected):
+            self.assertEqual(primary.keys(), other.keys())
+            for key in primary:
+                np.testing.assert_allclose(primary[key], other[key])
+
+    def test_serial(self):
+        self.assertSteps(engine.run_points(description(), PATHS, POINTS),
+                         self.expected())
+
+    def test_parallel(self):
+        self.assertSteps(engine.run_points(description(), PATHS, POINTS, processes=2),
+                         self.expected())
+
+    def test_schedule(self):
+        groups = engine.schedule(description(), PATHS, POINTS)
+        self.assertEqual(groups, [[0, 1, 2], [3, 4, 5]])
+
+    def test_run_simulation(self):
+        allout = engine.run_simulation(description(), {'layer1.d':[10.0, 20.0]},
+                                       rename={'layer1.d':'d'})
+        self.assertEqual(allout['primary'].keys(), ['step_0', 'step_1'])
+        self.assertEqual(allout['inputs'].keys(), ['d'])
+
+
+class TestResume(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.store = op.join(self.tmp, 'run.simdir')
+        self.variables = {'layer1.d':[10.0, 20.0, 30.0, 40.0]}
+        self.expected = engine.run_simulation(description(), self.variables)['primary']
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def assertStored(self):
+        primary = simstore.StepReader(self.store).primary()
+        self.assertEqual(primary.keys(), self.expected.keys())
+        for step in primary:
+            np.testing.assert_allclose(primary[step]['R_avg'],
+                                       self.expected[step]['R_avg'])
+
+    def test_stream(self):
+        allout = engine.run_simulation(description(), self.variables,
+                                       store=self.store)
+        self.assertEqual(allout['primary'], {})
+        self.assertEqual(allout['failed'], [])
+        self.assertTrue(simstore.StepReader(self.store).complete)
+        self.assertStored()
+
+    def test_resume(self):
+        engine.run_simulation(description(), self.variables, store=self.store)
+        # Cut short after two steps
+        for name in ('step_2.npz', 'step_3.npz', simstore.COMPLETE):
+            os.remove(op.join(self.store, name))
+        allout = engine.resume_simulation(self.store)
+        self.assertEqual(allout['failed'], [])
+        self.assertEqual(list(allout['inputs']['layer1.d']), self.variables['layer1.d'])
+        self.assertTrue(simstore.StepReader(self.store).complete)
+        self.assertStored()
+
+    def test_failed_only(self):
+        engine.run_simulation(description(), self.variables, store=self.store)
+        os.remove(op.join(self.store, 'step_1.npz'))
+        os.remove(op.join(self.store, 'step_3.npz'))
+        simstore.StepWriter.reopen(self.store).fail(1, 'Traceback...')
+        engine.resume_simulation(self.store, failed_only=True)
+        reader = simstore.StepReader(self.store)
+        self.assertEqual(reader.failed, {})
+        self.assertEqual(reader.unfinished(4), [3]) #Never ran, not failed
+        engine.resume_simulation(self.store)
+        self.assertStored()
+
+    def test_no_plan(self):
+        simstore.StepWriter(self.store).close()
+        self.assertRaises(engine.EngineError, engine.resume_simulation, self.store)
+
+
+if __name__ == '__main__':
+    unittest.main()
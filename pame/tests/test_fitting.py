@@ -0,0 +1,95 @@
+import unittest
+
+import numpy as np
+
+from pame import engine, fitting
+from pame.tests import description
+
+
+def synthetic(d=25.0, output='R_avg', scale=2.0):
+    """ Measured spectrum of description() with layer1.d of d, scaled and
+    in reverse wavelength order """
+    true = description()
+    engine.set_value(true, 'layer1.d', d)
+    values = scale * np.asarray(engine.evaluate_step(true, ('R', 'kz'))[0][output])
+    lambdas = engine.spectral_grid(true['spectral'])
+    return fitting.measured_spectrum((lambdas[::-1], values[::-1].real))
+
+
+class TestFit(unittest.TestCase):
+
+    def test_local(self):
+        out = fitting.fit(description(), synthetic(), {'layer1.d':(10.0, 40.0)},
+                          method='Local', min_step=1e-3)
+        self.assertAlmostEqual(out.params['layer1.d'], 25.0, delta=0.1)
+        self.assertAlmostEqual(out.scale, 2.0, delta=0.01)
+        self.assertEqual(out.description['stack'][1]['d'], out.params['layer1.d'])
+        self.assertTrue(out.solves <= out.evaluations)
+
+    def test_global(self):
+        out = fitting.fit(description(), synthetic(scale=1.0), {'layer1.d':(10.0, 40.0)},
+                          method='Global + local', scale=False, seed=0, generations=5)
+        self.assertAlmostEqual(out.params['layer1.d'], 25.0, delta=0.1)
+        self.assertTrue((np.diff(out.history) <= 0).all())
+
+    def test_layer_output(self):
+        measured = synthetic(output='kz_L1_avg', scale=1.0)
+        out = fitting.fit(description(), measured, {'layer1.d':(10.0, 40.0)},
+                          output='kz_L1_avg', method='Local', min_step=1e-3)
+        self.assertAlmostEqual(out.params['layer1.d'], 25.0, delta=0.1)
+
+
+class TestObjective(unittest.TestCase):
+
+    def objective(self, **kwds):
+        return fitting.Objective(description(), synthetic(),
+                                 {'layer1.d':(10.0, 40.0)}, **kwds)
+
+    def test_outputs(self):
+        self.assertEqual(self.objective(output='kz_L1_avg').storage,
+                         {'choose_optics':('kz',), 'averaging':'Average'})
+        self.assertEqual(self.objective(output='R_5.50').storage,
+                         {'choose_optics':('R',), 'averaging':'Not Averaged'})
+        self.assertRaises(fitting.FitError, self.objective, output='R_5.00')
+        self.assertRaises(fitting.FitError, self.objective, output='T_avg',
+                          choose_optics=('R',))
+
+    def test_solves_once(self):
+        objective = self.objective()
+        objective([[20.0], [30.0]])
+        objective([[20.0], [20.0 + 1e-9]])
+        self.assertEqual((objective.solves, objective.evaluations), (2, 4))
+
+    def test_errors(self):
+        d = description()
+        measured = synthetic()
+        self.assertRaises(fitting.FitError, fitting.Objective, d, measured,
+                          {'layer1.d':(40.0, 10.0)})
+        self.assertRaises(engine.EngineError, fitting.Objective, d, measured,
+                          {'material1.q':(10.0, 40.0)})
+        self.assertRaises(fitting.FitError, fitting.Objective, d,
+                          (measured[0] + 1000, measured[1]), {'layer1.d':(10.0, 40.0)})
+        self.assertRaises(fitting.FitError, fitting.fit, d, measured,
+                          {'layer1.d':(10.0, 40.0)}, method='Newton')
+
+
+class TestHelpers(unittest.TestCase):
+
+    def test_fit_scale(self):
+        models = np.array([[1.0, 2.0, 3.0], [0.0, 0.0, 0.0]])
+        scaled, scales, offsets = fitting.fit_scale(models, np.array([2.0, 4.0, 6.0]))
+        np.testing.assert_allclose(scales, [2.0, 0.0])
+        np.testing.assert_allclose(scaled[0], [2.0, 4.0, 6.0])
+        scaled, scales, offsets = fitting.fit_scale(models[:1], np.array([3.0, 5.0, 7.0]),
+                                                    offset=True)
+        np.testing.assert_allclose((scales[0], offsets[0]), (2.0, 1.0))
+
+    def test_measured_spectrum(self):
+        wavelengths, values = fitting.measured_spectrum(([3, 1, 2], [30, 10, 20]))
+        np.testing.assert_array_equal(wavelengths, [1, 2, 3])
+        np.testing.assert_array_equal(values, [10, 20, 30])
+        self.assertRaises(fitting.FitError, fitting.measured_spectrum, ([1, 2], [1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+
+import numpy as np
+
+from pame.labeled import LabeledArray, LabeledError, concat
+
+D = np.array([10.0, 20.0, 30.0])
+VFRAC = np.array([0.1, 0.2])
+LAMBDAS = np.linspace(400, 700, 4)
+
+
+def sweep():
+    """ (d, Vfrac, lambdas) array whose value is 100*d + Vfrac + lambdas """
+    values = 100*D[:, None, None] + VFRAC[None, :, None] + LAMBDAS
+    return LabeledArray(values, ('d', 'Vfrac', 'lambdas'),
+                        {'d':D, 'Vfrac':VFRAC, 'lambdas':LAMBDAS}, name='R_avg')
+
+
+def steps():
+    """ (variable, lambdas, step) array with step inputs as aux coordinates """
+    values = np.arange(2*4*6, dtype=float).reshape(2, 4, 6)
+    return LabeledArray(values, ('variable', 'lambdas', 'step'),
+        {'variable':np.array(['R_avg', 'T_avg']), 'lambdas':LAMBDAS},
+        aux={'layer1.d':('step', np.repeat(D, 2)),
+             'material1.Vfrac':('step', np.tile(VFRAC, 3))})
+
+
+class TestLabeledArray(unittest.TestCase):
+
+    def test_sel(self):
+        R = sweep()
+        out = R.sel({'d':20.0})
+        self.assertEqual(out.dims, ('Vfrac', 'lambdas'))
+        np.testing.assert_array_equal(out.values, R.values[1])
+        self.assertTrue(np.may_share_memory(out.values, R.values)) #View
+        self.assertEqual(R.sel(d=[10.0, 30.0]).shape, (2, 2, 4))
+        self.assertEqual(R.sel(lambdas=slice(450, 700)).shape, (3, 2, 3))
+        out = R.sel(d=[10.0, 30.0], Vfrac=0.2, lambdas=[400.0, 700.0])
+        self.assertEqual(out.dims, ('d', 'lambdas'))
+        np.testing.assert_array_equal(out.values, [[1400.2, 1700.2], [3400.2, 3700.2]])
+        self.assertEqual(R.sel(Vfrac=0.19, method='nearest').values[0, 0], 1000.2 + 400)
+        self.assertRaises(LabeledError, R.sel, Vfrac=0.19)
+        self.assertRaises(LabeledError, R.sel, angle=0.5)
+
+    def test_isel_transpose(self):
+        R = sweep()
+        self.assertEqual(R.isel(d=0, lambdas=slice(0, 2)).dims, ('Vfrac', 'lambdas'))
+        out = R.transpose('lambdas', 'd', 'Vfrac')
+        self.assertEqual(out.shape, (4, 3, 2))
+        np.testing.assert_array_equal(out.coords['lambdas'], LAMBDAS)
+
+    def test_aux(self):
+        A = steps()
+        out = A.sel(variable='R_avg', Vfrac=0.2)
+        self.assertEqual(out.dims, ('lambdas', 'step'))
+        np.testing.assert_array_equal(out.coords['step'], [1, 3, 5])
+        np.testing.assert_array_equal(out.aux['layer1.d'][1], D)
+        self.assertEqual(A.sel(variable='T_avg', d=20.0).sel(Vfrac=0.1).shape, (4,))
+        self.assertRaises(LabeledError, A.sel, d=20.0, Vfrac=0.1) #Both step
+        self.assertRaises(LabeledError, LabeledArray, A.values, A.dims, A.coords,
+                          aux={'x':('step', np.arange(5))})
+
+    def test_reduce(self):
+        A = steps()
+        out = A.max('lambdas')
+        self.assertEqual(out.dims, ('variable', 'step'))
+        np.testing.assert_array_equal(out.values, A.values.max(axis=1))
+        self.assertEqual(out.aux.keys(), A.aux.keys())
+        self.assertEqual(A.mean('step').aux.keys(), [])
+
+
+class TestConcat(unittest.TestCase):
+
+    def test_concat(self):
+        a, b = steps(), steps()
+        b.values = b.values * 2
+        out = concat([a, b], 'run', np.array(['a', 'b']))
+        self.assertEqual(out.dims, ('run', 'variable', 'lambdas', 'step'))
+        np.testing.assert_array_equal(out.sel(run='b').values, b.values)
+        self.assertEqual(out.aux.keys(), a.aux.keys())
+
+    def test_pad(self):
+        a = steps()
+        short = a.isel(step=slice(0, 4))
+        out = concat([short, a], 'run', pad='step')
+        self.assertEqual(out.shape, (2, 2, 4, 6))
+        self.assertTrue(np.isnan(out.values[0, ..., 4:]).all())
+        np.testing.assert_array_equal(out.values[0, ..., :4], short.values)
+        np.testing.assert_array_equal(out.aux['layer1.d'][1], a.aux['layer1.d'][1])
+        self.assertRaises(LabeledError, concat, [a.isel(step=slice(1, 3)), a],
+                          'run', pad='step')
+
+    def test_different(self):
+        a, b = steps(), steps()
+        b.aux['layer1.d'] = ('step', np.arange(6.0))
+        self.assertEqual(concat([a, b], 'run').aux.keys(), ['material1.Vfrac'])
+        c = sweep()
+        self.assertRaises(LabeledError, concat, [sweep(), c.transpose('Vfrac', 'd', 'lambdas')], 'run')
+        c.coords['lambdas'] = c.coords['lambdas'] + 1
+        self.assertRaises(LabeledError, concat, [sweep(), c], 'run')
+        self.assertRaises(LabeledError, concat, [], 'run')
+
+
+if __name__ == '__main__':
+    unittest.main()
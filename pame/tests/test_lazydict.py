@@ -0,0 +1,83 @@
+import copy
+import cPickle
+import os.path as op
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from pame import lazydict, simcolumns, simstore
+from pame.utils import AttrDict
+from pame.tests.test_simcolumns import STEPS, storage
+
+
+class Counting(object):
+    """ Reader that records the leaves read through it """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.steps = reader.steps
+        self.read = []
+
+    def layout(self, step):
+        return self.reader.layout(step)
+
+    def value(self, key, step):
+        self.read.append((key, step))
+        return self.reader.value(key, step)
+
+
+class TestLazyResults(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.storage = storage()
+        for results in self.storage['results'].values():
+            results['empty'] = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def readers(self):
+        path = op.join(self.tmp, 'test.simcol')
+        simcolumns.write_columns(path, self.storage)
+        store = op.join(self.tmp, 'test.simdir')
+        writer = simstore.StepWriter(store)
+        for i, step in enumerate(self.storage['primary']):
+            writer.append(i, self.storage['primary'][step], self.storage['results'][step])
+        writer.close()
+        return simcolumns.ColumnReader(path), simstore.StepReader(store)
+
+    def test_on_access(self):
+        for reader in self.readers():
+            reader = Counting(reader)
+            results = lazydict.LazyResults(reader)
+            self.assertEqual(sorted(results), sorted(self.storage['results']))
+            self.assertEqual(sorted(results['step_3']), ['Layer1', 'empty', 'extra', 'frame'])
+            self.assertEqual(reader.read, []) #Keys come from the layout
+            earray = results['step_2.Layer1.earray']
+            np.testing.assert_array_equal(earray,
+                self.storage['results']['step_2']['Layer1']['earray'])
+            self.assertEqual(results['step_2'].Layer1.name, 'film')
+            self.assertEqual(results['step_2']['empty'], {})
+            self.assertEqual(reader.read, [('results/Layer1/earray', 'step_2'),
+                                           ('results/Layer1/name', 'step_2'),
+                                           ('results/empty', 'step_2')])
+            results['step_2']['Layer1']['earray'] #Read once
+            self.assertEqual(len(reader.read), 3)
+            self.assertRaises(KeyError, results['step_2'].__getitem__, 'missing')
+
+    def test_load(self):
+        for reader in self.readers():
+            results = lazydict.LazyResults(reader)
+            for loaded in (results['step_1'].load(), cPickle.loads(cPickle.dumps(results['step_1'])),
+                           copy.deepcopy(results['step_1'])):
+                self.assertIs(type(loaded), AttrDict)
+                self.assertEqual(sorted(loaded), ['Layer1', 'empty', 'frame'])
+                self.assertIs(type(loaded['Layer1']), AttrDict)
+                self.assertTrue(loaded['frame'].equals(self.storage['results']['step_1']['frame']))
+
+
+if __name__ == '__main__':
+    unittest.main()
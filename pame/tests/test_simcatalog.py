@@ -0,0 +1,123 @@
+import os
+import os.path as op
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from pame import engine, simcolumns
+from pame.tests import description
+
+try:
+    from pame import simcatalog, simparser
+except ImportError: #simparser needs the GUI libraries (matplotlib...)
+    simcatalog = None
+
+
+def write_run(path, d, xstart=400.0):
+    """ Columnar simulation of description() with layer1.d values d """
+    desc = description()
+    desc['spectral']['xstart'] = xstart
+    allout = engine.run_simulation(desc, {'layer1.d':d})
+    allout['about']['Simulation Name'] = op.basename(path)
+    simcolumns.write_columns(path, allout)
+
+
+@unittest.skipIf(simcatalog is None, 'simcatalog needs matplotlib')
+class TestSimCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        write_run(op.join(self.tmp, 'thin.simcol'), [10.0, 15.0])
+        write_run(op.join(self.tmp, 'thick.simcol'), [30.0, 40.0], xstart=500.0)
+        os.makedirs(op.join(self.tmp, 'more'))
+        write_run(op.join(self.tmp, 'more', 'mid.simcol'), [20.0, 25.0])
+        with open(op.join(self.tmp, 'broken.json'), 'w') as f:
+            f.write('{not json')
+        self.catalog = simcatalog.SimCatalog(self.tmp)
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def path(self, *names):
+        return op.join(self.tmp, *names)
+
+    def test_update(self):
+        self.assertEqual(self.catalog.update(), {'added':4, 'updated':0, 'removed':0,
+                                                 'unchanged':0, 'failed':1})
+        self.assertEqual(len(self.catalog), 3)
+        self.assertEqual(self.catalog.errors().keys(), ['broken.json'])
+        self.assertEqual(self.catalog.update()['unchanged'], 4)
+
+        shutil.rmtree(self.path('thin.simcol'))
+        write_run(self.path('thick.simcol.tmp'), [35.0])
+        shutil.rmtree(self.path('thick.simcol'))
+        os.rename(self.path('thick.simcol.tmp'), self.path('thick.simcol'))
+        later = time.time() + 10
+        os.utime(self.path('thick.simcol'), (later, later))
+        counts = self.catalog.update()
+        self.assertEqual((counts['removed'], counts['updated'], counts['unchanged']), (1, 1, 2))
+        self.assertEqual(self.catalog.find(d=35.0), [self.path('thick.simcol')])
+
+    def test_find(self):
+        self.catalog.update()
+        self.assertEqual(self.catalog.find(), [self.path('more', 'mid.simcol'),
+            self.path('thick.simcol'), self.path('thin.simcol')])
+        self.assertEqual(self.catalog.find({'layer1.d':12.0}), [self.path('thin.simcol')])
+        self.assertEqual(self.catalog.find(d=(None, 22.0)),
+                         [self.path('more', 'mid.simcol'), self.path('thin.simcol')])
+        self.assertEqual(self.catalog.find(lambdas=(450, 700)),
+                         [self.path('more', 'mid.simcol'), self.path('thin.simcol')])
+        self.assertEqual(self.catalog.find({'Simulation Name':'THICK'}),
+                         [self.path('thick.simcol')])
+        self.assertEqual(self.catalog.find(d=100.0), [])
+        values = self.catalog.values('layer1.d')
+        self.assertEqual(values[self.path('thin.simcol')], [('layer1.d', (10.0, 15.0))])
+
+    def test_not_recursive(self):
+        catalog = simcatalog.SimCatalog(self.tmp, op.join(self.tmp, 'flat.sqlite'),
+                                        recursive=False)
+        catalog.update()
+        self.assertNotIn(self.path('more', 'mid.simcol'), catalog.find())
+        catalog.close()
+
+    def test_load_primary(self):
+        self.catalog.update()
+        paths = self.catalog.find(lambdas=(450, 700))
+        runs = self.catalog.load_primary(paths, processes=1)
+        self.assertEqual(runs.dims, ('run', 'variable', 'lambdas', 'step'))
+        self.assertEqual(list(runs.coords['run']), [op.join('more', 'mid.simcol'),
+                                                    'thin.simcol'])
+        parallel = self.catalog.load_primary(paths, processes=2)
+        np.testing.assert_array_equal(parallel.values, runs.values)
+
+        R = runs.sel(variable='R_avg', run='thin.simcol')
+        desc = description()
+        engine.set_value(desc, 'layer1.d', 15.0)
+        np.testing.assert_allclose(R.values[:, 1], engine.evaluate_step(desc)[0]['R_avg'])
+        self.assertRaises(simcatalog.CatalogError, self.catalog.load_primary, [])
+
+    def test_load_many(self):
+        LayerSimParser = simparser.LayerSimParser
+        write_run(self.path('short.simcol'), [50.0])
+        paths = [self.path('thin.simcol'), self.path('short.simcol')]
+        runs = LayerSimParser.load_many(paths, processes=2, variables=['R_avg', 'T_avg'])
+        self.assertEqual(runs.shape, (2, 2, 20, 2))
+        self.assertTrue(np.isnan(runs.values[1, :, :, 1]).all()) #Padded step
+        self.assertFalse(np.isnan(runs.values[1, :, :, 0]).any())
+
+        # Errors name the file
+        for bad in ('thick.simcol', 'broken.json'):
+            try:
+                LayerSimParser.load_many([self.path('thin.simcol'), self.path(bad)], 1)
+            except simparser.SimParserError as exc:
+                self.assertIn(bad, str(exc))
+            else:
+                self.fail('%s loaded' % bad)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import os.path as op
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+from pandas import DataFrame
+
+from pame import compressors, globalparms, simcolumns, simstore
+
+STEPS = 5
+
+
+def storage():
+    """ Storage dictionaries with every kind of leaf: arrays, scalars,
+    strings, pandas objects and a key only some steps have """
+    lambdas = np.linspace(400, 700, 10)
+    primary, results = OrderedDict(), OrderedDict()
+    for i in range(STEPS):
+        step = 'step_%s' % i
+        primary[step] = OrderedDict([('R_avg', np.sin(lambdas / (10.0 + i))),
+                                     ('layer1.d', 10.0 + i),
+                                     ('Material', 'gold' if i % 2 else 'silver')])
+        results[step] = OrderedDict([
+            ('Layer1', {'earray':(1 + 1j) * lambdas * i, 'name':'film'}),
+            ('frame', DataFrame({'R':lambdas * i, 'T':lambdas}, index=lambdas))])
+        if i == 3:
+            results[step]['extra'] = np.arange(4)
+    return OrderedDict([('static', {'lambdas':lambdas}), ('about', {'Steps':STEPS}),
+                        ('primary', primary), ('results', results),
+                        ('inputs', {'layer1.d':np.arange(STEPS) + 10.0})])
+
+
+def assertTreeEqual(test, a, b):
+    """ Nested dictionaries with the same keys, in order, and leaves """
+    if isinstance(a, dict):
+        test.assertEqual(list(a), list(b))
+        for key in a:
+            assertTreeEqual(test, a[key], b[key])
+    elif isinstance(a, DataFrame):
+        test.assertTrue(a.equals(b))
+    elif isinstance(a, np.ndarray):
+        np.testing.assert_array_equal(a, b)
+    else:
+        test.assertEqual(a, b)
+
+
+class TestColumns(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = op.join(self.tmp, 'test.simcol')
+        self.storage = storage()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_round_trip(self):
+        simcolumns.write_columns(self.path, self.storage, chunkbytes=200)
+        reader = simcolumns.ColumnReader(self.path)
+        self.assertEqual(len(reader), STEPS)
+        self.assertTrue(len(reader.columns['primary/R_avg']['chunks']) > 1)
+        self.assertIn('primary/Material', reader.objects)
+        out = reader.storage()
+        for section in self.storage:
+            assertTreeEqual(self, out[section], self.storage[section])
+
+    def test_read_parts(self):
+        simcolumns.write_columns(self.path, self.storage)
+        reader = simcolumns.ColumnReader(self.path)
+        column = reader.column('primary/layer1.d')
+        self.assertIsInstance(column, np.memmap)
+        np.testing.assert_array_equal(column, np.arange(STEPS) + 10.0)
+        np.testing.assert_array_equal(reader.column('primary/layer1.d', ['step_4', 'step_1']),
+                                      [14.0, 11.0])
+        self.assertEqual(reader.value('primary/layer1.d', 'step_2'), 12.0)
+        assertTreeEqual(self, reader.load_step('step_3', 'results'),
+                        self.storage['results']['step_3'])
+        self.assertNotIn('results/extra', reader.keys('step_2'))
+        self.assertRaises(simcolumns.ColumnError, reader.column, 'primary/Material')
+        self.assertRaises(simcolumns.ColumnError, reader.load_step, 'step_9')
+
+    def test_exists(self):
+        simcolumns.write_columns(self.path, self.storage)
+        self.assertRaises(simcolumns.ColumnError, simcolumns.write_columns,
+                          self.path, self.storage)
+        simcolumns.write_columns(self.path, self.storage, overwrite=True)
+
+    def test_convert_store(self):
+        store = op.join(self.tmp, 'test.simdir')
+        writer = simstore.StepWriter(store, self.storage['static'], self.storage['about'])
+        for i in range(STEPS):
+            step = 'step_%s' % i
+            writer.append(i, self.storage['primary'][step], self.storage['results'][step],
+                          {'layer1.d':10.0 + i})
+        writer.close()
+        simcolumns.convert_store(store, self.path)
+        out = simcolumns.ColumnReader(self.path).storage()
+        assertTreeEqual(self, out['primary'], self.storage['primary'])
+        np.testing.assert_array_equal(out['inputs']['layer1.d'],
+                                      self.storage['inputs']['layer1.d'])
+
+    def test_shared_rows(self):
+        substrate = np.linspace(1, 2, 500) * (1 + 0.1j)
+        for i, results in enumerate(self.storage['results'].values()):
+            results['Substrate'] = substrate.copy()
+            results['alternating'] = np.arange(3.0) * (i % 2)
+        simcolumns.write_columns(self.path, self.storage, codec='zlib')
+        reader = simcolumns.ColumnReader(self.path)
+        meta = reader.columns['results/Substrate']
+        self.assertEqual(meta['chunks'], [(0, 1)]) #Stored once
+        self.assertEqual(list(meta['index']), [0] * STEPS)
+        self.assertEqual(list(reader.columns['results/alternating']['index']), [0, 1, 0, 1, 0])
+        self.assertIsNone(reader.columns['primary/R_avg']['index'])
+        self.assertEqual(reader.column('results/Substrate').shape, (STEPS, 500))
+        np.testing.assert_array_equal(reader.column('results/alternating', ['step_3']),
+                                      [np.arange(3.0)])
+        assertTreeEqual(self, reader.results(), self.storage['results'])
+
+
+class TestCompressed(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.storage = storage()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_codecs(self):
+        for codec in compressors.available():
+            path = op.join(self.tmp, '%s.simcol' % codec)
+            simcolumns.write_columns(path, self.storage, chunkbytes=200,
+                                     codec=codec, level=3)
+            reader = simcolumns.ColumnReader(path)
+            self.assertEqual(reader.columns['primary/R_avg']['codec'], codec)
+            out = reader.storage()
+            for section in self.storage:
+                assertTreeEqual(self, out[section], self.storage[section])
+            np.testing.assert_array_equal(reader.column('primary/layer1.d', ['step_3']), [13.0])
+            self.assertEqual(reader.value('primary/layer1.d', 'step_4'), 14.0)
+
+    def test_bad_codec(self):
+        path = op.join(self.tmp, 'bad.simcol')
+        self.assertRaises(compressors.CompressionError, simcolumns.write_columns,
+                          path, self.storage, codec='rar')
+        self.assertFalse(op.exists(path)) #Nothing written
+
+    def test_depth(self):
+        for results in self.storage['results'].values():
+            results[globalparms.optresponse] = np.zeros(3)
+        light = simcolumns.trim_storage(self.storage, 'light')
+        self.assertEqual(light['results'], {})
+        assertTreeEqual(self, light['primary'], self.storage['primary'])
+        medium = simcolumns.trim_storage(self.storage, 'medium')
+        self.assertNotIn(globalparms.optresponse, medium['results']['step_0'])
+        self.assertIn('Layer1', medium['results']['step_0'])
+        self.assertIn(globalparms.optresponse, self.storage['results']['step_0'])
+        heavy = simcolumns.trim_storage(self.storage, 'heavy')
+        self.assertIn(globalparms.optresponse, heavy['results']['step_0'])
+        self.assertRaises(simcolumns.ColumnError, simcolumns.trim_storage,
+                          self.storage, 'deep')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import os.path as op
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+
+from pame import simstore
+
+
+def step(i):
+    """ primary, results and inputs of a fake step i """
+    primary = OrderedDict([('R_avg', np.linspace(0, 1, 5) * i), ('d', float(i))])
+    results = {'Layer1':{'name':'gold', 'earray':np.arange(3) + 1j*i}}
+    return primary, results, {'layer1.d':float(i)}
+
+
+class TestStepStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = op.join(self.tmp, 'test.simdir')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def assertStep(self, data, i):
+        primary, results, inputs = step(i)
+        self.assertEqual(data['primary'].keys(), primary.keys())
+        np.testing.assert_array_equal(data['primary']['R_avg'], primary['R_avg'])
+        self.assertEqual(data['primary']['d'], i)
+        self.assertEqual(data['results']['Layer1']['name'], 'gold')
+        np.testing.assert_array_equal(data['results']['Layer1']['earray'],
+                                      results['Layer1']['earray'])
+        self.assertEqual(data['inputs'], inputs)
+
+    def test_append(self):
+        writer = simstore.StepWriter(self.path, {'static':1}, {'Steps':3})
+        for i in (2, 0, 1): #Any order
+            writer.append(i, *step(i))
+        self.assertFalse(simstore.StepReader(self.path).complete)
+        writer.close()
+
+        reader = simstore.StepReader(self.path)
+        self.assertTrue(reader.complete)
+        self.assertEqual(reader.static, {'static':1})
+        self.assertEqual(reader.about, {'Steps':3})
+        self.assertEqual(reader.steps, ['step_0', 'step_1', 'step_2'])
+        for i in range(3):
+            self.assertStep(reader.load_step('step_%s' % i), i)
+        self.assertEqual(reader.load_step('step_1', 'inputs'), {'layer1.d':1.0})
+        self.assertEqual(reader.value('primary/d', 'step_2'), 2.0)
+        self.assertEqual(reader.primary().keys(), reader.steps)
+        self.assertRaises(simstore.StoreError, reader.load_step, 'step_5')
+
+    def test_exists(self):
+        simstore.StepWriter(self.path).append(0, *step(0))
+        self.assertRaises(simstore.StoreError, simstore.StepWriter, self.path)
+
+    def test_reopen(self):
+        writer = simstore.StepWriter(self.path)
+        writer.append(0, *step(0))
+        writer.fail(1, 'Traceback...')
+        writer.close()
+
+        writer = simstore.StepWriter.reopen(self.path)
+        reader = simstore.StepReader(self.path)
+        self.assertFalse(reader.complete)
+        self.assertEqual(reader.failed, {1:'Traceback...'})
+        self.assertEqual(reader.unfinished(3), [1, 2])
+        writer.append(1, *step(1))
+        writer.append(2, *step(2))
+        writer.close()
+
+        self.assertTrue(reader.complete)
+        self.assertEqual(reader.failed, {})
+        self.assertEqual(reader.unfinished(3), [])
+        for i in range(3):
+            self.assertStep(reader.load_step('step_%s' % i), i)
+        self.assertRaises(simstore.StoreError, simstore.StepWriter.reopen,
+                          op.join(self.tmp, 'missing'))
+
+    def test_shared(self):
+        substrate = np.linspace(1, 2, 500) * (1 + 0.1j) #Over DEDUPBYTES
+        writer = simstore.StepWriter(self.path)
+        for i in range(3):
+            primary, results, inputs = step(i)
+            results['Substrate'] = substrate.copy()
+            results['Changing'] = substrate * (i + 2)
+            primary['R_big'] = substrate #Primary is never shared
+            writer.append(i, primary, results, inputs)
+        writer.close()
+        blobs = op.join(self.path, simstore.BLOBS)
+        self.assertEqual(len(os.listdir(blobs)), 1 + 3)
+
+        # Blobs from before are still shared after reopening
+        primary, results, inputs = step(3)
+        results['Substrate'] = substrate.copy()
+        simstore.StepWriter.reopen(self.path).append(3, primary, results)
+        self.assertEqual(len(os.listdir(blobs)), 1 + 3)
+
+        reader = simstore.StepReader(self.path)
+        for i in range(3):
+            value = reader.value('results/Substrate', 'step_%s' % i)
+            self.assertIsInstance(value, np.memmap)
+            np.testing.assert_array_equal(value, substrate)
+            np.testing.assert_array_equal(reader.load_step('step_%s' % i)['results']['Changing'],
+                                          substrate * (i + 2))
+        self.assertNotIsInstance(reader.value('primary/R_big', 'step_0'), np.memmap)
+
+
+if __name__ == '__main__':
+    unittest.main()
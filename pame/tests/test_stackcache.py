@@ -0,0 +1,78 @@
+import os
+import os.path as op
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from pame import engine, stackcache
+from pame.tests import description
+
+ARGS = (np.ones((3, 4)), np.array([np.inf, 20.0, np.inf]), np.linspace(400, 700, 4),
+        np.array([0.5, 5.0]), 'S-polarized')
+
+
+class TestStackCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = stackcache.StackCache(self.tmp)
+        self.computes = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def compute(self, ns, ds, lambdas, angles, Mode):
+        self.computes.append(ds[1])
+        return {'ds':ds, 'Mode':Mode}
+
+    def test_key(self):
+        key = stackcache.stack_key(*ARGS)
+        self.assertEqual(key, stackcache.stack_key(*[np.copy(a) for a in ARGS[:4]]
+                                                   + ['S-polarized']))
+        self.assertNotEqual(key, stackcache.stack_key(*(ARGS[:4] + ('P-polarized',))))
+        ds = ARGS[1].copy()
+        ds[1] = 20.5
+        self.assertNotEqual(key, stackcache.stack_key(ARGS[0], ds, *ARGS[2:]))
+
+    def test_hit(self):
+        first = self.cache.optical_stack(*(ARGS + (self.compute,)))
+        second = self.cache.optical_stack(*(ARGS + (self.compute,)))
+        self.assertEqual(len(self.computes), 1)
+        np.testing.assert_array_equal(first['ds'], second['ds'])
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['stores']), (1, 1, 1))
+        self.assertEqual(stats['entries'], 1)
+
+        # Another session, same directory
+        other = stackcache.StackCache(self.tmp)
+        other.optical_stack(*(ARGS + (self.compute,)))
+        self.assertEqual(len(self.computes), 1)
+
+    def test_evict(self):
+        for i, d in enumerate([10.0, 20.0, 30.0]):
+            key = 'key%s' % i
+            self.cache.put(key, {'d':d, 'pad':np.zeros(1000)})
+            path = op.join(self.tmp, key + stackcache.EXT)
+            os.utime(path, (1000 + i, 1000 + i)) #key0 used first
+        self.cache._index = None
+        self.cache.maxbytes = self.cache.nbytes - 1
+        self.cache.evict()
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get('key0'))
+        self.assertEqual(self.cache.get('key2')['d'], 30.0)
+
+    def test_engine(self):
+        variables = {'layer1.d':[10.0, 20.0, 10.0]}
+        plain = engine.run_simulation(description(), variables)
+        cached = engine.run_simulation(description(), variables, cache=self.tmp)
+        counts = cached['about']['Stack cache']
+        self.assertEqual((counts['hits'], counts['misses']), (1, 2))
+        for step in plain['primary']:
+            np.testing.assert_allclose(cached['primary'][step]['R_avg'],
+                                       plain['primary'][step]['R_avg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+
+import numpy as np
+
+from pame import engine, sweeps
+from pame.tests import description
+
+BOUNDS = [(10.0, 40.0), (0.1, 0.3)]
+
+
+class TestPoints(unittest.TestCase):
+
+    def test_latin_hypercube(self):
+        points = sweeps.latin_hypercube(BOUNDS, 8, seed=0)
+        self.assertEqual(points.shape, (8, 2))
+        for j, (low, high) in enumerate(BOUNDS):
+            strata = np.floor((points[:, j] - low) / (high - low) * 8)
+            self.assertEqual(sorted(strata), range(8)) #One sample per stratum
+        np.testing.assert_array_equal(points, sweeps.latin_hypercube(BOUNDS, 8, seed=0))
+
+    @unittest.skipUnless(sweeps.SOBOL_INSTALLED, 'needs scipy.stats.qmc')
+    def test_sobol(self):
+        points = sweeps.sobol(BOUNDS, 8, seed=0)
+        self.assertEqual(points.shape, (8, 2))
+        for j, (low, high) in enumerate(BOUNDS):
+            self.assertTrue(((points[:, j] >= low) & (points[:, j] <= high)).all())
+
+    def test_available_modes(self):
+        modes = sweeps.available_modes()
+        self.assertIn('Grid', modes)
+        self.assertEqual('Sobol' in modes, sweeps.SOBOL_INSTALLED)
+
+
+class TestRunSweep(unittest.TestCase):
+
+    def test_grid(self):
+        axes = {'layer1.d':[10.0, 20.0, 40.0], 'material1.Vfrac':[0.1, 0.3]}
+        out = sweeps.run_sweep(description(), axes, 'Grid',
+                               rename={'material1.Vfrac':'Vfrac'})
+        R = out['labeled']['R_avg']
+        self.assertEqual(R.dims, ('layer1.d', 'Vfrac', 'lambdas'))
+        self.assertEqual(R.shape, (3, 2, 20))
+
+        # Steps are in C order of the grid
+        d = description()
+        engine.set_value(d, 'layer1.d', 20.0)
+        engine.set_value(d, 'material1.Vfrac', 0.3)
+        expected = engine.evaluate_step(d)[0]['R_avg']
+        np.testing.assert_allclose(R.sel({'layer1.d':20.0, 'Vfrac':0.3}).values, expected)
+        np.testing.assert_allclose(out['primary']['step_3']['R_avg'], expected)
+        self.assertEqual(list(out['inputs']['Vfrac']), [0.1, 0.3] * 3)
+
+    def test_latin_hypercube(self):
+        axes = {'layer1.d':BOUNDS[0], 'material1.Vfrac':BOUNDS[1]}
+        out = sweeps.run_sweep(description(), axes, 'Latin hypercube', 6, seed=1)
+        self.assertEqual(out['labeled']['R_avg'].dims, ('sample', 'lambdas'))
+        self.assertEqual(out['labeled']['R_avg'].shape, (6, 20))
+        self.assertEqual(len(out['inputs']['layer1.d']), 6)
+
+    def test_errors(self):
+        d = description()
+        self.assertRaises(sweeps.SweepError, sweeps.run_sweep, d, {})
+        self.assertRaises(sweeps.SweepError, sweeps.run_sweep, d,
+                          {'layer1.d':BOUNDS[0]}, 'Latin hypercube')
+        self.assertRaises(sweeps.SweepError, sweeps.run_sweep, d,
+                          {'layer1.d':[1, 2, 3]}, 'Latin hypercube', 4)
+        self.assertRaises(sweeps.SweepError, sweeps.run_sweep, d,
+                          {'layer1.d':BOUNDS[0]}, 'Spiral')
+
+
+class TestAdaptiveSweep(unittest.TestCase):
+
+    def test_refines(self):
+        out = sweeps.adaptive_sweep(description(), {'layer1.d':(0.0, 200.0)},
+            measure='Spectrum', tol=1e-6, budget=12, initial=3)
+        d = out['inputs']['layer1.d']
+        self.assertEqual(len(d), 12)
+        self.assertTrue((np.diff(d) > 0).all()) #Sorted by input
+        self.assertEqual(len(out['about']['Changes']), 11)
+        self.assertEqual(out['labeled']['R_avg'].dims, ('layer1.d', 'lambdas'))
+        np.testing.assert_array_equal(out['labeled']['R_avg'].coords['layer1.d'], d)
+
+    def test_tolerance(self):
+        # Reached before the budget: every remaining change is within tol
+        out = sweeps.adaptive_sweep(description(), {'layer1.d':(0.0, 200.0)},
+            measure='Dip', tol=1e-4, budget=40, initial=3)
+        self.assertTrue(3 < len(out['inputs']['layer1.d']) < 40)
+        self.assertTrue(max(out['about']['Changes']) <= 1e-4)
+
+    def test_errors(self):
+        d = description()
+        self.assertRaises(sweeps.SweepError, sweeps.adaptive_sweep, d,
+                          {'layer1.d':(10.0, 20.0)}, initial=1)
+        self.assertRaises(sweeps.SweepError, sweeps.adaptive_sweep, d,
+                          {'layer1.d':(10.0, 20.0)}, measure='Width')
+        self.assertRaises(sweeps.SweepError, sweeps.adaptive_sweep, d,
+                          {'layer1.d':(10.0, 20.0)}, outputs=('Q_avg',))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 from traits.api import Str, HasTraits, Instance, Button, implements,\
-     File, Property, Bool, Any, Enum
+     File, Property, Bool, Any, Enum, Int, Array
 from traitsui.api import View, Item, Group, Include, InstanceEditor, VGroup
 from interfaces import IMaterial, IAdapter
 from simple_materials_adapter import ABCFileAdapter
@@ -8,6 +8,7 @@ import os.path as op
 import numpy as np
 
 import yaml
+import dispersion
 
 class YamlMaterial(ABCExternal):
     """ """
@@ -22,6 +23,11 @@ class YamlMaterial(ABCExternal):
     def _datastring_changed(self):
         self.update_data()
         self.update_interp()
+
+    def registry_key(self):
+        """ Same data (ie same database page) shares earray """
+        return (type(self).__name__, self.datatype, self.datastring,
+                self.interpolation, self.extrapolation)
         
     def update_data(self):
         """ Yaml Files are always Micrometers.
@@ -49,6 +55,60 @@ class YamlMaterial(ABCExternal):
         #Interpolate
         #self.update_interp()
 
+class YamlFormulaMaterial(ABCExternal):
+    """ RIINFO formula material (FORMULA types 1-9).  n is evaluated exactly
+    on lambdas; k is interpolated from the optional tabulated k DATA (and held
+    at its edge values), otherwise zero.  Coefficients are parsed once on
+    creation.
+    """
+
+    file_spec_unit = Str('Micrometers')
+
+    formula_type = Int(1)
+    coefficients = Array()  #See dispersion.riinfo_coefficients()
+    formula_range = Any()  #(start, end) um from FORMULA, or None
+    kstring = Str  #DATA of type 'k', if any
+
+    def update_data(self):
+        """ Store k table (or formula range with k=0) as the file data """
+        x, k = [], []
+        for line in self.kstring.split('\n'):
+            line = line.strip().split()
+            if line:
+                x.append(line[0])
+                k.append(line[1])
+
+        if not x:
+            if self.formula_range:
+                x = list(self.formula_range)
+            else:
+                x = [self.lambdas[0] / 1000.0, self.lambdas[-1] / 1000.0]
+            k = [0.0, 0.0]
+
+        self.file_x = np.array(x, dtype=float)
+        self.file_n = 1j*np.array(k, dtype=float)
+        self.update_interp()
+
+    def update_interp(self):
+        """ Formula n on lambdas, k from interpolant of k data """
+        f = self._get_interpolant()
+        k = f(np.clip(self.lambdas, f.x[0], f.x[-1])).imag
+        n = dispersion.riinfo_index(self.lambdas, self.formula_type,
+                                    self.coefficients)
+        self.narray = n + 1j*k
+
+    def registry_key(self):
+        return (type(self).__name__, self.formula_type,
+                self.coefficients.tostring(), self.kstring,
+                self.interpolation)
+
+    def simulation_requested(self):
+        out = super(YamlFormulaMaterial, self).simulation_requested()
+        out['formula_type'] = self.formula_type
+        out['coefficients'] = self.coefficients
+        return out
+
+
 class YamlAdapter(ABCFileAdapter):
     """ Adapter to parse yaml.dump and figure out if experimental data, or 
     which type of model (2-8) and call corresponding material. 
@@ -62,6 +122,7 @@ class YamlAdapter(ABCFileAdapter):
     DATA = Any()
     COMMENTS = Str('Not Found')
     FORMULA = Any
+    metadata_read = Bool(False)
 
     root = None #Used for compatibility with modeltree to set special name
 
@@ -87,10 +148,14 @@ class YamlAdapter(ABCFileAdapter):
             return False
 
 
-    # CALL THIS LATER ON SELECTION
+    # CALL THIS LATER ON SELECTION (or in background, see modeltree_v2)
     def read_file_metadata(self):
-        """ Opens yaml file, gets the metadata and data. """
-        loaded = yaml.load(open(self.file_path, 'r'))
+        """ Opens yaml file, gets the metadata and data.  Only reads once. """
+        if self.metadata_read:
+            return
+
+        with open(self.file_path, 'r') as f:
+            loaded = yaml.load(f)
 
         try:
             self.REFERENCES = loaded['REFERENCES']
@@ -112,12 +177,29 @@ class YamlAdapter(ABCFileAdapter):
         except KeyError:
             pass        
 
+        self.metadata_read = True
+
 
     def _set_matobject(self): 
         """Method used to instantiate an object to conserve resources"""
+        self.read_file_metadata()
     
         if self._is_model:
-            raise NotImplementedError('RIINFO DB models not supported up yet!')
+            kstring = ''
+            if self.DATA and self.DATA['type'] == 'k':
+                kstring = self.DATA['data']
+
+            formula_range = None
+            if 'range' in self.FORMULA:
+                formula_range = tuple(float(x) for x in 
+                                      str(self.FORMULA['range']).split())
+
+            self.matobject = YamlFormulaMaterial(
+                formula_type = int(self.FORMULA['type']),
+                coefficients = dispersion.riinfo_coefficients(
+                    self.FORMULA['coefficients']),
+                formula_range = formula_range,
+                kstring = kstring)
 
         else:
             datatype = self.DATA['type']